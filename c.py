@@ -12,6 +12,8 @@ from typing import List, Dict, Optional, Set, Tuple
 from typing import List, Optional
 
 class Clausula:
+    __slots__ = ("nombre", "origen", "veracidad", "profundidad", "padre", "valor", "choice_open")
+
     def __init__(self, nombre, origen="<dynamic>:0", veracidad="",
                  profundidad=0, padre=None):
         self.nombre = nombre                       # p/2(args) …
@@ -0,0 +1,254 @@
+"""
+Almacén de checkpoints e historial del LLM en SQLite.
+
+Sustituye al fichero pickle por módulo/ciclo/fecha en `checkpoints/`: buscar
+el historial más reciente obligaba a listar el directorio y consultar la
+fecha de cada fichero. Aquí cada checkpoint es una fila de la tabla
+`checkpoints`, con un índice por (problema, modulo, ciclo, marca):
+
+- `problema`: clave del problema (`identidad.clave_problema`: descripción
+  normalizada y huella de la configuración). Los pickles antiguos solo
+  guardaban en el nombre los primeros caracteres de la descripción, que
+  pueden coincidir entre problemas: al migrarlos se indica a qué problema
+  pertenecen (`--problema`) o quedan con la clave `legado:<identificador>`,
+  que no se consulta.
+- `modulo` y `ciclo`: `misa_j_trace_cycle2` se guarda como ("misa_j_trace", 2);
+  los módulos sin ciclo usan el ciclo 0.
+- `marca`: segundos desde epoch al guardar.
+- `datos`: el objeto serializado con pickle, como en los ficheros (o, para los
+  resultados de MISA-J, en el formato de `misa_j/archivo_ramas.py`).
+
+La base de datos está en modo WAL: varias ejecuciones en paralelo pueden leer
+mientras otra escribe, y las escrituras esperan a que termine la anterior
+(hasta `ESPERA_BLOQUEO` segundos).
+
+Migración de los pickles de un directorio:
+
+    python -m checkpoints_sqlite checkpoints [--borrar] [--problema descripcion.txt]
+"""
+import os
+import pickle
+import re
+import sqlite3
+import sys
+import time
+from contextlib import closing, contextmanager
+from datetime import datetime
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+from identidad import Manifiesto
+
+NOMBRE_BD = "checkpoints.sqlite3"
+ESPERA_BLOQUEO = 30  # segundos que espera una escritura si otra ejecución tiene la base de datos bloqueada
+MODULO_HISTORIAL = "llm_history"
+
+# Módulos con checkpoint; sirven para separar módulo e identificador en los nombres de los pickles
+MODULOS_CHECKPOINT = ("mfsa_kr_store", "misa_j_trace", "mmrc_result", "ohi_result")
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    problema TEXT NOT NULL,
+    modulo TEXT NOT NULL,
+    ciclo INTEGER NOT NULL,
+    marca REAL NOT NULL,
+    datos BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS checkpoints_clave ON checkpoints (problema, modulo, ciclo, marca);
+"""
+
+_CICLO = re.compile(r"(.*)_cycle(\d+)")
+_PICKLE_HISTORIAL = re.compile(r"llm_history_(.*)_(\d{8}_\d{6})\.pkl", re.DOTALL)
+_PICKLE_CHECKPOINT = re.compile(r"(%s)(?:_cycle(\d+))?_(.*)\.pkl" % "|".join(MODULOS_CHECKPOINT), re.DOTALL)
+
+
+def clave_legado(identificador: str) -> str:
+    """Clave de las filas migradas desde pickles, a partir del identificador del nombre del fichero."""
+    return f"legado:{identificador}"
+
+
+def identificadores_legado(problem_description: str) -> Tuple[str, str]:
+    """
+    Identificadores del problema en los nombres de los pickles antiguos: los
+    50 primeros caracteres saneados (checkpoints) o con `_` en vez de espacios
+    y `/` (historial).
+    """
+    texto = re.sub(r'[^\w\s-]', '', problem_description)
+    checkpoint = re.sub(r'[-\s]+', '_', texto).strip('_')[:50] if problem_description else "default_id"
+    historial = problem_description[:50].replace(" ", "_").replace("/", "_")
+    return checkpoint, historial
+
+
+def separar_ciclo(module_name: str) -> Tuple[str, int]:
+    """`mmrc_result_cycle1` -> ("mmrc_result", 1); `mfsa_kr_store` -> ("mfsa_kr_store", 0)."""
+    coincidencia = _CICLO.fullmatch(module_name)
+    if coincidencia is None:
+        return module_name, 0
+    return coincidencia.group(1), int(coincidencia.group(2))
+
+
+class AlmacenCheckpoints:
+    """Checkpoints de un directorio, en `<directorio>/checkpoints.sqlite3`."""
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self.ruta = os.path.join(directorio, NOMBRE_BD)
+
+    def existe(self) -> bool:
+        return os.path.exists(self.ruta)
+
+    @contextmanager
+    def _conexion(self) -> Iterator[sqlite3.Connection]:
+        # Una conexión por operación: sirve igual desde varios hilos y procesos
+        os.makedirs(self.directorio, exist_ok=True)
+        with closing(sqlite3.connect(self.ruta, timeout=ESPERA_BLOQUEO, isolation_level=None)) as conexion:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.executescript(_ESQUEMA)
+            yield conexion
+
+    @contextmanager
+    def _transaccion(self) -> Iterator[sqlite3.Connection]:
+        """Transacción de escritura; BEGIN IMMEDIATE toma el bloqueo al empezar y no a mitad."""
+        with self._conexion() as conexion:
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                yield conexion
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+            conexion.execute("COMMIT")
+
+    def guardar(self, problema: str, modulo: str, ciclo: int, datos: Any, reemplazar: bool = True,
+                marca: Optional[float] = None):
+        """
+        Guarda `datos` (serializados con pickle). Con `reemplazar` se borran
+        antes las filas de la misma clave, como al sobrescribir el fichero; el
+        historial del LLM conserva todas las versiones.
+        """
+        self.guardar_serializado(problema, modulo, ciclo, pickle.dumps(datos), reemplazar, marca)
+
+    def guardar_serializado(self, problema: str, modulo: str, ciclo: int, datos: bytes, reemplazar: bool = True,
+                            marca: Optional[float] = None):
+        marca = time.time() if marca is None else marca
+        with self._transaccion() as conexion:
+            if reemplazar:
+                conexion.execute("DELETE FROM checkpoints WHERE problema = ? AND modulo = ? AND ciclo = ?",
+                                 (problema, modulo, ciclo))
+            conexion.execute("INSERT INTO checkpoints (problema, modulo, ciclo, marca, datos) VALUES (?, ?, ?, ?, ?)",
+                             (problema, modulo, ciclo, marca, sqlite3.Binary(datos)))
+
+    def cargar(self, problemas: Sequence[str], modulo: str, ciclo: Optional[int] = None) -> Any:
+        """
+        Datos más recientes de `modulo` (y `ciclo`, si no es None) para
+        cualquiera de las claves de `problemas`, o None si no hay ninguno. Los
+        errores al deserializar se propagan.
+        """
+        datos = self.cargar_serializado(problemas, modulo, ciclo)
+        return None if datos is None else pickle.loads(datos)
+
+    def cargar_serializado(self, problemas: Sequence[str], modulo: str, ciclo: Optional[int] = None) -> Optional[bytes]:
+        """Como `cargar`, pero devuelve los bytes guardados sin deserializar."""
+        if not self.existe():
+            return None
+        marcadores = ", ".join("?" * len(problemas))
+        consulta = f"SELECT datos FROM checkpoints WHERE problema IN ({marcadores}) AND modulo = ?"
+        parametros: List[Any] = [*problemas, modulo]
+        if ciclo is not None:
+            consulta += " AND ciclo = ?"
+            parametros.append(ciclo)
+        with self._conexion() as conexion:
+            fila = conexion.execute(consulta + " ORDER BY marca DESC, id DESC LIMIT 1", parametros).fetchone()
+        return None if fila is None else bytes(fila[0])
+
+    def eliminar(self, problemas: Optional[Sequence[str]] = None, modulo: Optional[str] = None,
+                 ciclo: Optional[int] = None) -> int:
+        """Borra las filas que cumplen los filtros dados (todas si no hay ninguno). Devuelve cuántas."""
+        if not self.existe():
+            return 0
+        condiciones, parametros = [], []
+        if problemas is not None:
+            condiciones.append(f"problema IN ({', '.join('?' * len(problemas))})")
+            parametros.extend(problemas)
+        if modulo is not None:
+            condiciones.append("modulo = ?")
+            parametros.append(modulo)
+        if ciclo is not None:
+            condiciones.append("ciclo = ?")
+            parametros.append(ciclo)
+        donde = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with self._transaccion() as conexion:
+            return conexion.execute("DELETE FROM checkpoints" + donde, parametros).rowcount
+
+    def tiene_version(self, problema: str, modulo: str, ciclo: int, marca: float) -> bool:
+        """Si hay una fila de esa clave guardada en `marca` o después."""
+        if not self.existe():
+            return False
+        with self._conexion() as conexion:
+            return conexion.execute("SELECT 1 FROM checkpoints WHERE problema = ? AND modulo = ? AND ciclo = ? "
+                                    "AND marca >= ? LIMIT 1", (problema, modulo, ciclo, marca)).fetchone() is not None
+
+
+def _clave_pickle(ruta: str) -> Optional[Tuple[str, str, int, float, bool]]:
+    """(problema, modulo, ciclo, marca, es_historial) a partir del nombre de un pickle, o None."""
+    nombre = os.path.basename(ruta)
+    coincidencia = _PICKLE_HISTORIAL.fullmatch(nombre)
+    if coincidencia is not None:
+        identificador, fecha = coincidencia.groups()
+        marca = datetime.strptime(fecha, "%Y%m%d_%H%M%S").timestamp()
+        return clave_legado(identificador), MODULO_HISTORIAL, 0, marca, True
+    coincidencia = _PICKLE_CHECKPOINT.fullmatch(nombre)
+    if coincidencia is not None:
+        modulo, ciclo, identificador = coincidencia.groups()
+        return clave_legado(identificador), modulo, int(ciclo or 0), os.path.getmtime(ruta), False
+    return None
+
+
+def migrar_pickles(directorio: str, borrar: bool = False, problem_description: Optional[str] = None) -> int:
+    """
+    Copia al almacén los pickles de checkpoints e historial de `directorio`
+    (sin deserializarlos), en orden de nombre (el del historial lleva la
+    fecha). Los de `problem_description`, si se da, pasan a su clave con la
+    configuración actual. Es idempotente: un pickle ya migrado no se vuelve a
+    insertar. Con `borrar` se eliminan los ficheros migrados. Devuelve
+    cuántos pickles se migraron.
+    """
+    almacen = AlmacenCheckpoints(directorio)
+    propias = {}
+    if problem_description is not None:
+        clave = Manifiesto(directorio).registrar(problem_description)
+        propias = {clave_legado(identificador): clave for identificador in identificadores_legado(problem_description)}
+    migrados = 0
+    for nombre in sorted(os.listdir(directorio)):
+        ruta = os.path.join(directorio, nombre)
+        if not nombre.endswith(".pkl") or not os.path.isfile(ruta):
+            continue
+        clave = _clave_pickle(ruta)
+        if clave is None:
+            print(f"INFO: {nombre!r} no es un checkpoint conocido; no se migra.")
+            continue
+        problema, modulo, ciclo, marca, es_historial = clave
+        problema = propias.get(problema, problema)
+        # Un pickle ya migrado, o un checkpoint guardado después en el almacén, no se sobrescribe
+        if not almacen.tiene_version(problema, modulo, ciclo, marca):
+            with open(ruta, "rb") as f:
+                almacen.guardar_serializado(problema, modulo, ciclo, f.read(), reemplazar=not es_historial,
+                                            marca=marca)
+        migrados += 1
+        if borrar:
+            os.remove(ruta)
+    print(f"INFO: {migrados} pickles migrados a {almacen.ruta}.")
+    return migrados
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    descripcion = None
+    if "--problema" in argumentos:
+        posicion = argumentos.index("--problema")
+        with open(argumentos[posicion + 1], encoding="utf-8") as f:
+            descripcion = f.read()
+        del argumentos[posicion:posicion + 2]
+    borrar = "--borrar" in argumentos
+    argumentos = [argumento for argumento in argumentos if argumento != "--borrar"]
+    migrar_pickles(argumentos[0] if argumentos else "checkpoints", borrar, descripcion)
@@ -1,54 +1,93 @@
 # checkpoint_utils.py
 import pickle
 import os
-import re # Para sanitizar nombres de archivo
+
+from checkpoints_sqlite import AlmacenCheckpoints, separar_ciclo
+from config import CONFIG
+from diario_historial import EXTENSION as EXTENSION_DIARIO, olvidar
+from identidad import Manifiesto, clave_problema, identificador
+from misa_j.archivo_ramas import archivar_resultado, es_resultado_con_ramas, leer_resultado
 
 CHECKPOINT_DIR = "checkpoints" # Nombre de la carpeta para guardar los checkpoints
 
-def _ensure_checkpoint_dir():
+def _ensure_checkpoint_dir(checkpoint_dir: str = None):
     """Asegura que el directorio de checkpoints exista."""
-    if not os.path.exists(CHECKPOINT_DIR):
+    checkpoint_dir = checkpoint_dir or CHECKPOINT_DIR
+    if not os.path.exists(checkpoint_dir):
         try:
-            os.makedirs(CHECKPOINT_DIR)
-            print(f"Directorio de checkpoints creado: {CHECKPOINT_DIR}")
+            os.makedirs(checkpoint_dir)
+            print(f"Directorio de checkpoints creado: {checkpoint_dir}")
         except OSError as e:
-            print(f"Error al crear el directorio de checkpoints {CHECKPOINT_DIR}: {e}")
+            print(f"Error al crear el directorio de checkpoints {checkpoint_dir}: {e}")
             # Podrías lanzar una excepción aquí si el directorio es crucial
 
-def _sanitize_filename(text: str, max_len: int = 50) -> str:
-    """Convierte un texto en un nombre de archivo seguro y corto."""
-    if not text:
-        return "default_id"
-    # Quitar caracteres no alfanuméricos (excepto guiones bajos y espacios que se reemplazarán)
-    text = re.sub(r'[^\w\s-]', '', text)
-    # Reemplazar espacios y guiones repetidos con un solo guión bajo
-    text = re.sub(r'[-\s]+', '_', text).strip('_')
-    return text[:max_len]
-
-def get_checkpoint_filepath(module_name: str, problem_description: str) -> str:
-    """Genera una ruta de archivo consistente para un checkpoint."""
-    _ensure_checkpoint_dir()
-    problem_identifier = _sanitize_filename(problem_description)
-    filename = f"{module_name}_{problem_identifier}.pkl"
-    return os.path.join(CHECKPOINT_DIR, filename)
-
-def save_checkpoint(data: any, module_name: str, problem_description: str):
+def get_checkpoint_filepath(module_name: str, problem_description: str, checkpoint_dir: str = None) -> str:
+    """Genera una ruta de archivo consistente para un checkpoint.
+    `checkpoint_dir` permite usar el directorio de una ejecución concreta (por defecto, CHECKPOINT_DIR)."""
+    checkpoint_dir = checkpoint_dir or CHECKPOINT_DIR
+    _ensure_checkpoint_dir(checkpoint_dir)
+    # Clave del problema y de la configuración (identidad.py), no el principio de la descripción
+    filename = f"{module_name}_{identificador(problem_description)}.pkl"
+    return os.path.join(checkpoint_dir, filename)
+
+def _usa_sqlite() -> bool:
+    """Si los checkpoints van al almacén SQLite (checkpoints_sqlite.py) en vez de a un pickle por módulo."""
+    return CONFIG["checkpoints_backend"] == "sqlite"
+
+def _serializar(data: any) -> bytes:
+    """Resultados de MISA-J en el formato de misa_j/archivo_ramas.py (si está activado); el resto con pickle."""
+    if CONFIG["checkpoints_formato_ramas"] and es_resultado_con_ramas(data):
+        try:
+            return archivar_resultado(data)
+        except (TypeError, ValueError) as e:
+            print(f"INFO: El resultado no cabe en el archivo de ramas ({e}); se guarda con pickle.")
+    return pickle.dumps(data)
+
+def _deserializar(datos: bytes) -> any:
+    """Inversa de `_serializar`: reconoce el archivo de ramas por su cabecera."""
+    resultado = leer_resultado(datos)
+    return pickle.loads(datos) if resultado is None else resultado
+
+def save_checkpoint(data: any, module_name: str, problem_description: str, checkpoint_dir: str = None):
     """Guarda los datos de un módulo como un checkpoint."""
-    filepath = get_checkpoint_filepath(module_name, problem_description)
+    Manifiesto(checkpoint_dir or CHECKPOINT_DIR).registrar(problem_description)
+    if _usa_sqlite():
+        almacen = AlmacenCheckpoints(checkpoint_dir or CHECKPOINT_DIR)
+        try:
+            almacen.guardar_serializado(clave_problema(problem_description), *separar_ciclo(module_name),
+                                        _serializar(data))
+            print(f"INFO: Checkpoint guardado: {module_name} en {almacen.ruta}")
+        except Exception as e:
+            print(f"ERROR: No se pudo guardar el checkpoint {module_name} en {almacen.ruta}: {e}")
+        return
+    filepath = get_checkpoint_filepath(module_name, problem_description, checkpoint_dir)
     try:
         with open(filepath, 'wb') as f:
-            pickle.dump(data, f)
+            f.write(_serializar(data))
         print(f"INFO: Checkpoint guardado: {filepath}")
     except Exception as e:
         print(f"ERROR: No se pudo guardar el checkpoint en {filepath}: {e}")
 
-def load_checkpoint(module_name: str, problem_description: str) -> any:
+def load_checkpoint(module_name: str, problem_description: str, checkpoint_dir: str = None) -> any:
     """Carga los datos de un módulo desde un checkpoint, si existe."""
-    filepath = get_checkpoint_filepath(module_name, problem_description)
+    if _usa_sqlite():
+        almacen = AlmacenCheckpoints(checkpoint_dir or CHECKPOINT_DIR)
+        try:
+            datos = almacen.cargar_serializado([clave_problema(problem_description)], *separar_ciclo(module_name))
+            data = None if datos is None else _deserializar(datos)
+        except Exception as e:
+            print(f"ERROR: No se pudo cargar el checkpoint {module_name} desde {almacen.ruta}: {e}. Se procederá sin checkpoint.")
+            return None
+        if data is None:
+            print(f"INFO: Checkpoint no encontrado: {module_name} en {almacen.ruta}. Se ejecutará el módulo correspondiente.")
+        else:
+            print(f"INFO: Checkpoint cargado: {module_name} desde {almacen.ruta}")
+        return data
+    filepath = get_checkpoint_filepath(module_name, problem_description, checkpoint_dir)
     if os.path.exists(filepath):
         try:
             with open(filepath, 'rb') as f:
-                data = pickle.load(f)
+                data = _deserializar(f.read())
             print(f"INFO: Checkpoint cargado: {filepath}")
             return data
         except Exception as e:
@@ -58,9 +97,16 @@ def load_checkpoint(module_name: str, problem_description: str) -> any:
         print(f"INFO: Checkpoint no encontrado: {filepath}. Se ejecutará el módulo correspondiente.")
         return None
 
-def clear_checkpoint(module_name: str, problem_description: str):
+def clear_checkpoint(module_name: str, problem_description: str, checkpoint_dir: str = None):
     """Elimina un archivo de checkpoint específico."""
-    filepath = get_checkpoint_filepath(module_name, problem_description)
+    if _usa_sqlite():
+        almacen = AlmacenCheckpoints(checkpoint_dir or CHECKPOINT_DIR)
+        if almacen.eliminar([clave_problema(problem_description)], *separar_ciclo(module_name)):
+            print(f"INFO: Checkpoint eliminado: {module_name} de {almacen.ruta}")
+        else:
+            print(f"INFO: No se encontró checkpoint para eliminar: {module_name} en {almacen.ruta}")
+        return
+    filepath = get_checkpoint_filepath(module_name, problem_description, checkpoint_dir)
     if os.path.exists(filepath):
         try:
             os.remove(filepath)
@@ -70,11 +116,12 @@ def clear_checkpoint(module_name: str, problem_description: str):
     else:
         print(f"INFO: No se encontró checkpoint para eliminar: {filepath}")
 
-def clear_all_checkpoints() -> int:
-    """Elimina TODOS los archivos de checkpoint en el directorio de checkpoints.
+def clear_all_checkpoints(checkpoint_dir: str = None) -> int:
+    """Elimina TODOS los archivos de checkpoint en el directorio de checkpoints,
+    y las filas del almacén SQLite si existe.
 
     Returns:
-        int: número de archivos de checkpoint eliminados.
+        int: número de checkpoints eliminados (archivos más filas).
 
     Nota: La versión original de esta función llamaba siempre a
     ``_ensure_checkpoint_dir``. Esto creaba el directorio de checkpoints incluso
@@ -84,24 +131,30 @@ def clear_all_checkpoints() -> int:
     eliminados.
     """
 
-    if not os.path.exists(CHECKPOINT_DIR):
+    checkpoint_dir = checkpoint_dir or CHECKPOINT_DIR
+    if not os.path.exists(checkpoint_dir):
         # Si no hay directorio, claramente no hay checkpoints que borrar.
-        print(f"INFO: No se encontraron checkpoints para eliminar en '{CHECKPOINT_DIR}'.")
+        print(f"INFO: No se encontraron checkpoints para eliminar en '{checkpoint_dir}'.")
         return 0
 
     count = 0
-    for filename in os.listdir(CHECKPOINT_DIR):
-        if filename.endswith(".pkl"):  # O cualquier extensión que uses
-            filepath = os.path.join(CHECKPOINT_DIR, filename)
+    for filename in os.listdir(checkpoint_dir):
+        # Pickles y diarios del historial del LLM (diario_historial.py)
+        if filename.endswith(".pkl") or (filename.startswith("llm_history_") and filename.endswith(EXTENSION_DIARIO)):
+            filepath = os.path.join(checkpoint_dir, filename)
+            olvidar(filepath)
             try:
                 os.remove(filepath)
                 count += 1
             except Exception as e:
                 print(f"ERROR: No se pudo eliminar el archivo de checkpoint {filepath}: {e}")
 
+    # Filas del almacén SQLite (historial del LLM incluido, como los .pkl)
+    count += AlmacenCheckpoints(checkpoint_dir).eliminar()
+
     if count > 0:
-        print(f"INFO: Se eliminaron {count} archivos de checkpoint de '{CHECKPOINT_DIR}'.")
+        print(f"INFO: Se eliminaron {count} checkpoints de '{checkpoint_dir}'.")
     else:
-        print(f"INFO: No se encontraron checkpoints para eliminar en '{CHECKPOINT_DIR}'.")
+        print(f"INFO: No se encontraron checkpoints para eliminar en '{checkpoint_dir}'.")
 
     return count
\ No newline at end of file
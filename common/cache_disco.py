@@ -0,0 +1,97 @@
+import os
+import tempfile
+from typing import Optional
+
+
+class CacheDisco:
+    """
+    Caché en disco direccionada por contenido: cada entrada es un fichero
+    `<clave>.bin` en `directorio`. La fecha de modificación marca el último
+    uso y, cuando el tamaño total supera `max_bytes`, se borran primero las
+    entradas usadas hace más tiempo (LRU).
+    """
+
+    EXTENSION = ".bin"
+
+    def __init__(self, directorio: str, max_bytes: int):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, clave + self.EXTENSION)
+
+    def obtener(self, clave: str) -> Optional[bytes]:
+        """Devuelve los datos guardados con `clave`, o None si no están."""
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+        except OSError:
+            return None
+        try:
+            # Marcar la entrada como usada recientemente
+            os.utime(ruta)
+        except OSError:
+            pass
+        return datos
+
+    def guardar(self, clave: str, datos: bytes):
+        """Guarda `datos` con `clave` y desaloja entradas si se supera el tamaño máximo."""
+        os.makedirs(self.directorio, exist_ok=True)
+        # Escritura atómica: otro proceso nunca ve una entrada a medias
+        temporal = tempfile.NamedTemporaryFile(dir=self.directorio, suffix=".tmp", delete=False)
+        try:
+            with temporal:
+                temporal.write(datos)
+            os.replace(temporal.name, self._ruta(clave))
+        except Exception:
+            if os.path.exists(temporal.name):
+                os.remove(temporal.name)
+            raise
+        self._desalojar()
+
+    def _entradas(self):
+        """(último uso, tamaño, ruta) de cada entrada."""
+        entradas = []
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return entradas
+        for nombre in nombres:
+            if not nombre.endswith(self.EXTENSION):
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                estado = os.stat(ruta)
+            except OSError:
+                continue
+            entradas.append((estado.st_mtime_ns, estado.st_size, ruta))
+        return entradas
+
+    def _desalojar(self):
+        entradas = self._entradas()
+        total = sum(tamano for _, tamano, _ in entradas)
+        if total <= self.max_bytes:
+            return
+        for _, tamano, ruta in sorted(entradas):
+            try:
+                os.remove(ruta)
+            except OSError:
+                continue
+            total -= tamano
+            if total <= self.max_bytes:
+                break
+
+    def tamano_total(self) -> int:
+        return sum(tamano for _, tamano, _ in self._entradas())
+
+    def limpiar(self) -> int:
+        """Borra todas las entradas y devuelve cuántas se borraron."""
+        borradas = 0
+        for _, _, ruta in self._entradas():
+            try:
+                os.remove(ruta)
+                borradas += 1
+            except OSError:
+                pass
+        return borradas
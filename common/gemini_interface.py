@@ -3,40 +3,244 @@ import os
 import json
 import time
 import random
+import hashlib
+import asyncio
+import threading
+from typing import Optional
+
+from config import CONFIG
+from common.cache_disco import CacheDisco
 
 # Suponiendo que tienes la API Key en una variable de entorno
 from dotenv import load_dotenv
 load_dotenv()
 API_KEY = os.getenv("GEMINI_API_KEY")
-if not API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables.")
 
-client = genai.Client(api_key=API_KEY)
+# El cliente se crea con la primera llamada real a la API: reproducir desde
+# la caché no necesita API Key
+client = None
 
-# Modelos disponibles (esto es un ejemplo, consulta la documentación de Gemini)
-GENERATION_MODEL = "gemini-2.5-flash-preview-04-17" # O el modelo que prefieras
+# Modelo de generación: CONFIG["gemini_modelo"] (forma parte de la identidad de los checkpoints)
+GENERATION_MODEL = CONFIG["gemini_modelo"]
 
-def ask_gemini(prompt: str, task_hint: str = "", max_retries: int = 8, base_delay: float = 1.0):
+
+class RespuestaNoCacheadaError(LookupError):
+    """En modo "reproducir", el prompt no tiene respuesta en la caché."""
+
+
+def _cliente():
+    global client
+    if client is None:
+        if not API_KEY:
+            raise ValueError("GEMINI_API_KEY not found in environment variables.")
+        client = genai.Client(api_key=API_KEY)
+    return client
+
+
+def _cache_respuestas() -> CacheDisco:
+    return CacheDisco(CONFIG["gemini_cache_dir"], int(CONFIG["gemini_cache_mb"] * 1024 * 1024))
+
+
+def _clave_respuesta(prompt: str, config: Optional[dict]) -> str:
+    """Clave de caché de una petición: hash de (modelo, prompt, config)."""
+    contenido = json.dumps({"modelo": GENERATION_MODEL, "prompt": prompt, "config": config},
+                           sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def _respuesta_cacheada(clave: str) -> Optional[str]:
+    """
+    Texto de la respuesta guardada para `clave`, o None si no hay (o caducó).
+    En modo "reproducir" no hay caducidad y una ausencia es un error.
+    """
+    modo = CONFIG["gemini_cache_mode"]
+    if modo == "desactivada":
+        return None
+    datos = _cache_respuestas().obtener(clave)
+    entrada = None
+    if datos is not None:
+        try:
+            entrada = json.loads(datos.decode('utf-8'))
+        except ValueError:
+            print(f"Advertencia: Entrada de caché de Gemini ilegible: {clave}")
+    if entrada is not None and modo != "reproducir":
+        ttl_horas = CONFIG["gemini_cache_ttl_horas"]
+        if ttl_horas is not None and time.time() - entrada["creado"] > ttl_horas * 3600:
+            entrada = None
+    if entrada is None:
+        if modo == "reproducir":
+            raise RespuestaNoCacheadaError(f"No hay respuesta cacheada de Gemini para la clave {clave}")
+        return None
+    print(f"INFO: Respuesta de Gemini cargada de la caché: {clave}")
+    return entrada["texto"]
+
+
+def _guardar_respuesta(clave: str, response_text: str):
+    if CONFIG["gemini_cache_mode"] == "desactivada":
+        return
+    entrada = {"creado": time.time(), "modelo": GENERATION_MODEL, "texto": response_text}
+    try:
+        _cache_respuestas().guardar(clave, json.dumps(entrada, ensure_ascii=False).encode('utf-8'))
+    except Exception as e:
+        print(f"ERROR: No se pudo guardar la respuesta de Gemini en la caché: {e}")
+
+class LimitadorTasa:
+    """
+    Cubo de fichas compartido por todos los hilos y bucles de eventos: como
+    mucho `por_minuto` peticiones por minuto, con ráfagas de hasta
+    `por_minuto` peticiones. Cada petición reserva su ficha al llegar y
+    espera lo que falte hasta que esa ficha se regenere, así que las
+    peticiones se atienden en orden de llegada.
+    """
+
+    def __init__(self, por_minuto: float):
+        self.por_minuto = por_minuto
+        self._fichas = float(por_minuto)
+        self._ritmo = por_minuto / 60.0
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reservar(self) -> float:
+        """Reserva una ficha y devuelve los segundos que hay que esperar."""
+        with self._lock:
+            ahora = time.monotonic()
+            self._fichas = min(self.por_minuto, self._fichas + (ahora - self._ultimo) * self._ritmo)
+            self._ultimo = ahora
+            self._fichas -= 1
+            return 0.0 if self._fichas >= 0 else -self._fichas / self._ritmo
+
+    def _devolver(self):
+        with self._lock:
+            self._fichas = min(self.por_minuto, self._fichas + 1)
+
+    async def adquirir(self):
+        espera = self._reservar()
+        if espera > 0:
+            try:
+                await asyncio.sleep(espera)
+            except asyncio.CancelledError:
+                # La petición cancelada no llega a enviarse
+                self._devolver()
+                raise
+
+
+_limitador: Optional[LimitadorTasa] = None
+_limitador_lock = threading.Lock()
+
+# Todas las peticiones a la API se hacen en un único bucle de eventos en un
+# hilo propio: el transporte asíncrono de `client.aio` queda ligado al bucle
+# de la primera petición, y el semáforo de concurrencia es así uno solo para
+# todo el proceso, llame quien llame (hilos, `asyncio.run` sucesivos...)
+_bucle: Optional[asyncio.AbstractEventLoop] = None
+_bucle_lock = threading.Lock()
+_semaforo_global: Optional[asyncio.Semaphore] = None
+_semaforo_tamano: Optional[int] = None
+
+
+def _limitador_tasa() -> Optional[LimitadorTasa]:
+    global _limitador
+    por_minuto = CONFIG["gemini_peticiones_por_minuto"]
+    if not por_minuto:
+        return None
+    with _limitador_lock:
+        if _limitador is None or _limitador.por_minuto != por_minuto:
+            _limitador = LimitadorTasa(por_minuto)
+        return _limitador
+
+
+def _bucle_gemini() -> asyncio.AbstractEventLoop:
+    """Bucle de eventos de las peticiones a la API (se arranca con la primera)."""
+    global _bucle
+    with _bucle_lock:
+        if _bucle is None:
+            _bucle = asyncio.new_event_loop()
+            threading.Thread(target=_bucle.run_forever, name="gemini", daemon=True).start()
+        return _bucle
+
+
+def _semaforo() -> asyncio.Semaphore:
+    """Semáforo de `gemini_max_concurrencia`; solo se usa dentro del bucle de Gemini."""
+    global _semaforo_global, _semaforo_tamano
+    if _semaforo_global is None or _semaforo_tamano != CONFIG["gemini_max_concurrencia"]:
+        _semaforo_tamano = CONFIG["gemini_max_concurrencia"]
+        _semaforo_global = asyncio.Semaphore(_semaforo_tamano)
+    return _semaforo_global
+
+
+async def _peticion(prompt: str, config: Optional[dict]):
+    limitador = _limitador_tasa()
+    if limitador is not None:
+        await limitador.adquirir()
+    async with _semaforo():
+        return await _cliente().aio.models.generate_content(
+            model=GENERATION_MODEL,
+            contents=prompt,
+            config=config
+        )
+
+
+async def _generar(prompt: str, config: Optional[dict] = None):
+    """
+    Una petición a la API, dentro de los límites de tasa y de concurrencia.
+    Se ejecuta en el bucle de Gemini; cancelar al que espera la cancela allí.
+    """
+    bucle = _bucle_gemini()
+    if asyncio.get_running_loop() is bucle:
+        return await _peticion(prompt, config)
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_peticion(prompt, config), bucle))
+
+
+def _ejecutar_sincrono(corrutina):
+    """Ejecuta la corrutina en el bucle de Gemini y espera el resultado; no vale dentro de un bucle en marcha."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        corrutina.close()
+        raise RuntimeError("Dentro de un bucle asyncio hay que usar ask_gemini_async / ask_gemini_json_async.")
+    futuro = asyncio.run_coroutine_threadsafe(corrutina, _bucle_gemini())
+    try:
+        return futuro.result()
+    except BaseException:
+        # Ctrl+C en el hilo que espera: la petición no sigue en segundo plano
+        futuro.cancel()
+        raise
+
+
+async def ask_gemini_async(prompt: str, task_hint: str = "", max_retries: int = 8, base_delay: float = 1.0):
     """
     Función genérica para hacer una pregunta a Gemini con reintentos automáticos.
     task_hint es para ayudar a seleccionar una respuesta mock durante el desarrollo.
     max_retries: número máximo de reintentos
     base_delay: tiempo base de espera en segundos
+    Las peticiones respetan `gemini_max_concurrencia` y
+    `gemini_peticiones_por_minuto` de CONFIG; cancelar la tarea cancela
+    también la espera entre reintentos.
     """
     print(f"\n\n-------------------------------------------------------------------")
     print(f"\n--- Pregunta a Gemini ({task_hint if task_hint else 'general'}) ---")
     print(f"Prompt: {prompt}") # Imprime solo una parte del prompt para brevedad
     print(f"\n-------------------------------------------------------------------")
-    
+
+    clave = _clave_respuesta(prompt, None)
+    response_text = _respuesta_cacheada(clave)
+    if response_text is not None:
+        print(f"Respuesta de Gemini: {response_text}")
+        return response_text
+
+    _cliente()
     for attempt in range(max_retries + 1):
         try:
-            response = client.models.generate_content(model=GENERATION_MODEL, contents=prompt)
+            response = await _generar(prompt)
             response_text = response.text
 
             if not response.text:
                 # Manejar el caso de que no haya contenido o la respuesta esté bloqueada.
                 print("Advertencia: Respuesta vacía o bloqueada por configuración de seguridad.")
                 response_text = "No se pudo obtener respuesta del LLM."
+            else:
+                _guardar_respuesta(clave, response_text)
 
             print(f"\n-------------------------------------------------------------------")
             print(f"Respuesta de Gemini: {response_text}")
@@ -50,10 +254,15 @@ def ask_gemini(prompt: str, task_hint: str = "", max_retries: int = 8, base_dela
                 # Calcular delay con backoff exponencial y jitter
                 delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
                 print(f"Reintentando en {delay:.2f} segundos...")
-                time.sleep(delay)
+                await asyncio.sleep(delay)
             else:
                 print("Se agotaron todos los reintentos.")
                 return f"Error después de {max_retries + 1} intentos: {e}"
+
+
+def ask_gemini(prompt: str, task_hint: str = "", max_retries: int = 8, base_delay: float = 1.0):
+    """Versión bloqueante de `ask_gemini_async`."""
+    return _ejecutar_sincrono(ask_gemini_async(prompt, task_hint, max_retries, base_delay))
     
 def parse_gemini_json_response(response_text: str) -> dict:
     """
@@ -68,7 +277,7 @@ def parse_gemini_json_response(response_text: str) -> dict:
             print(f"Error al parsear la respuesta JSON de Gemini: {response_text}")
             return None
         
-def ask_gemini_json(prompt: str, task_hint: str = "", config: dict = None, max_retries: int = 8, base_delay: float = 1.0):
+async def ask_gemini_json_async(prompt: str, task_hint: str = "", config: dict = None, max_retries: int = 8, base_delay: float = 1.0):
     """
     Función para hacer una pregunta a Gemini y obtener una respuesta en formato JSON con reintentos automáticos.
     max_retries: número máximo de reintentos
@@ -78,14 +287,21 @@ def ask_gemini_json(prompt: str, task_hint: str = "", config: dict = None, max_r
     print(f"\n--- Pregunta a Gemini JSON ({task_hint if task_hint else 'general'}) ---")
     print(f"Prompt: {prompt}")
     print(f"\n-------------------------------------------------------------------")
-    
+
+    clave = _clave_respuesta(prompt, config)
+    response_text = _respuesta_cacheada(clave)
+    if response_text is not None:
+        parsed_response = parse_gemini_json_response(response_text)
+        if parsed_response is not None:
+            print(f"Respuesta JSON de Gemini: {response_text}")
+            return parsed_response
+        if CONFIG["gemini_cache_mode"] == "reproducir":
+            raise RespuestaNoCacheadaError(f"La respuesta cacheada de Gemini no es JSON válido: {clave}")
+
+    _cliente()
     for attempt in range(max_retries + 1):
         try:
-            response = client.models.generate_content(
-                model=GENERATION_MODEL,
-                contents=prompt,
-                config=config
-            )
+            response = await _generar(prompt, config)
             response_text = response.text
             if not response_text:
                 print("Advertencia: Respuesta vacía o bloqueada por configuración de seguridad.")
@@ -98,6 +314,7 @@ def ask_gemini_json(prompt: str, task_hint: str = "", config: dict = None, max_r
 
             parsed_response = parse_gemini_json_response(response_text)
             if parsed_response is not None:
+                _guardar_respuesta(clave, response_text)
                 return parsed_response
             else:
                 print("Error al parsear la respuesta JSON de Gemini.")
@@ -110,7 +327,12 @@ def ask_gemini_json(prompt: str, task_hint: str = "", config: dict = None, max_r
                 # Calcular delay con backoff exponencial y jitter
                 delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
                 print(f"Reintentando en {delay:.2f} segundos...")
-                time.sleep(delay)
+                await asyncio.sleep(delay)
             else:
                 print("Se agotaron todos los reintentos.")
-                return None
\ No newline at end of file
+                return None
+
+
+def ask_gemini_json(prompt: str, task_hint: str = "", config: dict = None, max_retries: int = 8, base_delay: float = 1.0):
+    """Versión bloqueante de `ask_gemini_json_async`."""
+    return _ejecutar_sincrono(ask_gemini_json_async(prompt, task_hint, config, max_retries, base_delay))
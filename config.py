@@ -10,9 +10,41 @@ CONFIG = {
     "force_run_mmrc": True,     # Si True, siempre ejecuta MMRC.
     "force_run_ohi": True,      # Si True, siempre ejecuta OHI ignorando checkpoint.
     "save_checkpoints": True,    # Si True, guarda checkpoints después de ejecutar módulos.
+    "checkpoints_backend": "sqlite", # "sqlite": checkpoints e historial en checkpoints.sqlite3 (WAL); "pickle": un archivo por módulo
+    "checkpoints_formato_ramas": True, # Si True, los resultados de MISA-J se guardan como tabla de nodos comprimida por rama (misa_j/archivo_ramas.py), no con pickle
+    "llm_history_diario": True,  # Si True, el historial del LLM se añade a un diario JSONL por problema (diario_historial.py)
+    "llm_history_compactar_cada": 50, # Registros del diario tras los que se reescribe como un único estado (None: nunca)
     "max_refinement_cycles": 3,   # Número máximo de ciclos de refinamiento
     "log_to_file": True,         # Si True, guarda la salida en un archivo
     "log_directory": "logs",     # Directorio donde se guardarán los logs
+    "isolate_runs": False,       # Si True, cada ejecución usa su propio espacio de trabajo en runs_directory
+    "runs_directory": "runs",    # Raíz de los espacios de trabajo de las ejecuciones aisladas
+    "misa_j_trace_mode": "nivel", # "nivel": árbol por nivel/frame de la traza; "nombre": reconstrucción por nombres
+    "misa_j_max_ramas": None,     # Si es un número, MISA-J detiene Prolog al reunir esa cantidad de ramas
+    "misa_j_swipl_pool": 0,       # Procesos swipl persistentes para MISA-J; 0 lanza un swipl por consulta
+    "misa_j_cache_mb": 64,        # Tamaño máximo (MB) de la caché en disco de resultados de MISA-J; 0 la desactiva
+    "misa_j_cache_dir": "cache/misa_j", # Directorio de la caché de resultados de MISA-J
+    "misa_j_arbol_compacto": True, # Si True, las ramas de MISA-J se guardan en arrays paralelos (misa_j/arbol_compacto.py)
+    "misa_j_formato_traza": "tramas", # Eventos del hook: "tramas" (compactas, sin regex) o "texto" (legibles)
+    "misa_j_captura_max_eventos": None,     # Eventos de la traza que escribe el hook antes de dejar de trazar (None: todos)
+    "misa_j_captura_max_profundidad": None, # Profundidad desde la consulta a partir de la cual las metas no se trazan por dentro
+    "misa_j_captura_excluir_modulos": [],   # Módulos cuyas llamadas internas no se trazan, p. ej. ["lists", "apply"]
+    "misa_j_captura_muestra_fallos": None,  # Ramas fallidas que se conservan (muestra uniforme); las exitosas se conservan todas
+    "misa_j_verificar_programa": True, # Si True, MISA-J verifica el programa antes de lanzar swipl y no lo ejecuta si tiene errores
+    "misa_j_exportar_json": False, # Si True, solve escribe también solutions/ramas_de_pensamiento.json; si no, se exporta con python -m misa_j.archivo_ramas
+    "mfsa_recortar_programa": True, # Si True, MISA-J y los prompts de MMRC solo reciben las cláusulas de las que depende la consulta
+    "mmrc_render_mode": "bajo_demanda", # Gráficos de ramas: "bajo_demanda" (solo DOT), "segundo_plano", "sincrono" o "desactivado"
+    "mmrc_render_procesos": 2,    # Llamadas a dot en paralelo al renderizar en segundo plano
+    "mmrc_compactar_ramas": True, # Si True, las ramas van a los prompts de MMRC resumidas (mmrc/compactador.py) en vez de en JSON
+    "mmrc_presupuesto_tokens_ramas": 6000, # Tokens (estimados) como máximo para las ramas de cada prompt (None: sin límite)
+    "mmrc_max_longitud_termino": 160, # Caracteres a partir de los cuales se recortan los términos de las ramas (None: nunca)
+    "gemini_modelo": "gemini-2.5-flash-preview-04-17", # Modelo de generación (consulta la documentación de Gemini)
+    "gemini_cache_mode": "usar",  # "usar": lee y guarda respuestas; "reproducir": solo caché, falla si falta; "desactivada"
+    "gemini_cache_dir": "cache/gemini", # Directorio de la caché de respuestas de Gemini
+    "gemini_cache_mb": 256,       # Tamaño máximo (MB) de la caché de respuestas de Gemini
+    "gemini_cache_ttl_horas": None, # Caducidad de las respuestas cacheadas (None: no caducan)
+    "gemini_max_concurrencia": 4, # Peticiones a Gemini en vuelo a la vez (en todo el proceso)
+    "gemini_peticiones_por_minuto": 60, # Límite global de peticiones por minuto (None: sin límite); ajústalo a la cuota
 }
 
 @contextlib.contextmanager
@@ -30,25 +62,25 @@ def redirect_output(log_file):
         sys.stdout = original_stdout
         sys.stderr = original_stderr
 
-def setup_logging():
+def setup_logging(log_directory=None):
     """Configura el sistema de logging."""
     if CONFIG["log_to_file"]:
+        log_directory = log_directory or CONFIG["log_directory"]
         # Crear directorio de logs si no existe
-        if not os.path.exists(CONFIG["log_directory"]):
-            os.makedirs(CONFIG["log_directory"])
+        if not os.path.exists(log_directory):
+            os.makedirs(log_directory)
         
         # Crear nombre de archivo con timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         log_filename = f"insight_run_{timestamp}.log"
-        log_path = os.path.join(CONFIG["log_directory"], log_filename)
+        log_path = os.path.join(log_directory, log_filename)
         
         print(f"Guardando log en: {log_path}")
         return log_path
     return None
 
-def clear_solutions():
-    """Limpia las soluciones anteriores."""
-    solutions_dir = os.path.join(os.path.dirname(__file__), "solutions")
+def clear_solutions(solutions_dir="solutions"):
+    """Limpia las soluciones anteriores de `solutions_dir` (por defecto, relativo al directorio actual)."""
     success_dir = os.path.join(solutions_dir, "success")
     fails_dir = os.path.join(solutions_dir, "fails")
     
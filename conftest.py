@@ -0,0 +1,16 @@
+import sys
+import types
+
+# google-genai y python-dotenv no hacen falta para las pruebas (el cliente de
+# Gemini se sustituye por uno falso), pero common/gemini_interface.py los
+# importa al cargarse: sin ellos se usan módulos vacíos
+try:
+    from google import genai  # noqa: F401
+except ImportError:
+    google = sys.modules.get("google") or types.ModuleType("google")
+    google.genai = types.ModuleType("google.genai")
+    sys.modules.update({"google": google, "google.genai": google.genai})
+try:
+    import dotenv  # noqa: F401
+except ImportError:
+    sys.modules["dotenv"] = types.SimpleNamespace(load_dotenv=lambda *args, **kwargs: None)
@@ -0,0 +1,153 @@
+"""
+Diario del historial del LLM: un fichero JSONL por problema al que solo se
+añaden líneas.
+
+`save_llm_history` se llama tras MFSA y tras cada ciclo de MMRC con el
+historial completo; guardarlo entero cada vez hace que la E/S crezca de forma
+cuadrática. Aquí cada llamada añade un único registro con lo que cambió
+desde el anterior:
+
+    {"añadir": {"responses": [...], "timestamps": [...]}, "fijar": {"cycle_count": 2}}
+
+Las listas solo crecen (se añaden los elementos nuevos) y el resto de claves
+se fijan. Si el historial no es una continuación del guardado (una lista
+más corta), se escribe el estado completo: `{"estado": {...}}`.
+
+Cada `compactar_cada` registros el diario se reescribe de forma atómica con
+un único registro de estado. Para cargar se reproducen los registros sobre un
+índice en memoria por fichero que recuerda hasta qué byte se leyó: las
+cargas siguientes solo leen lo añadido después. Una línea incompleta al final
+(una escritura interrumpida) se ignora hasta que se complete.
+"""
+import copy
+import json
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+from identidad import identificador
+
+EXTENSION = ".jsonl"
+
+
+def ruta_diario(directorio: str, problem_description: str) -> str:
+    return os.path.join(directorio, f"llm_history_{identificador(problem_description)}{EXTENSION}")
+
+
+class DiarioHistorial:
+    """Estado reproducido de un diario y posición hasta la que se ha leído."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.estado: Dict[str, Any] = {}
+        self.posicion = 0
+        self.inodo: Optional[int] = None
+        self.registros = 0  # registros desde el último estado completo
+
+    def _reiniciar(self):
+        self.estado, self.posicion, self.inodo, self.registros = {}, 0, None, 0
+
+    def _aplicar(self, registro: Dict[str, Any]):
+        if "estado" in registro:
+            self.estado = registro["estado"]
+            self.registros = 0
+            return
+        for clave, elementos in registro.get("añadir", {}).items():
+            self.estado.setdefault(clave, []).extend(elementos)
+        self.estado.update(registro.get("fijar", {}))
+        self.registros += 1
+
+    def actualizar(self):
+        """Reproduce los registros añadidos desde la última lectura (o todo el diario si se reescribió)."""
+        try:
+            info = os.stat(self.ruta)
+        except FileNotFoundError:
+            self._reiniciar()
+            return
+        if info.st_ino != self.inodo or info.st_size < self.posicion:
+            # Diario compactado o reemplazado: se vuelve a leer desde el principio
+            self._reiniciar()
+            self.inodo = info.st_ino
+        if info.st_size == self.posicion:
+            return
+        with open(self.ruta, "rb") as f:
+            f.seek(self.posicion)
+            nuevos = f.read()
+        completos = nuevos[:nuevos.rfind(b"\n") + 1]
+        for linea in completos.splitlines():
+            if linea.strip():
+                self._aplicar(json.loads(linea))
+        self.posicion += len(completos)
+
+    def cargar(self) -> Dict[str, Any]:
+        """Copia del historial reproducido ({} si no hay diario)."""
+        self.actualizar()
+        return copy.deepcopy(self.estado)
+
+    def _registro(self, history: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Registro con los cambios de `history` respecto a lo guardado (None si no hay ninguno)."""
+        añadir, fijar = {}, {}
+        for clave, valor in history.items():
+            anterior = self.estado.get(clave)
+            if isinstance(valor, list) and isinstance(anterior, list):
+                if len(valor) < len(anterior):
+                    return {"estado": history}
+                if len(valor) > len(anterior):
+                    añadir[clave] = valor[len(anterior):]
+            elif isinstance(valor, list) and anterior is None:
+                añadir[clave] = valor
+            elif valor != anterior:
+                fijar[clave] = valor
+        if any(clave not in history for clave in self.estado):
+            return {"estado": history}
+        if not añadir and not fijar:
+            return None
+        return {"añadir": añadir, "fijar": fijar}
+
+    def guardar(self, history: Dict[str, Any], compactar_cada: Optional[int] = None):
+        """Añade un registro con lo que cambió en `history` y compacta si toca."""
+        self.actualizar()
+        registro = self._registro(history)
+        if registro is None:
+            return
+        linea = json.dumps(registro, ensure_ascii=False, default=str) + "\n"
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        # Una sola escritura en modo append por registro
+        with open(self.ruta, "ab") as f:
+            f.write(linea.encode("utf-8"))
+        self.actualizar()
+        if compactar_cada and self.registros >= compactar_cada:
+            self.compactar()
+
+    def compactar(self):
+        """Reescribe el diario de forma atómica como un único registro de estado."""
+        self.actualizar()
+        directorio = os.path.dirname(self.ruta) or "."
+        temporal = tempfile.NamedTemporaryFile(dir=directorio, suffix=".tmp", delete=False)
+        try:
+            with temporal:
+                temporal.write((json.dumps({"estado": self.estado}, ensure_ascii=False, default=str) + "\n")
+                               .encode("utf-8"))
+            os.replace(temporal.name, self.ruta)
+        except Exception:
+            if os.path.exists(temporal.name):
+                os.remove(temporal.name)
+            raise
+        self._reiniciar()
+        self.actualizar()
+
+
+# Índice en memoria: un diario por fichero, compartido por todas las llamadas del proceso
+_DIARIOS: Dict[str, DiarioHistorial] = {}
+
+
+def diario(ruta: str) -> DiarioHistorial:
+    ruta = os.path.abspath(ruta)
+    if ruta not in _DIARIOS:
+        _DIARIOS[ruta] = DiarioHistorial(ruta)
+    return _DIARIOS[ruta]
+
+
+def olvidar(ruta: str):
+    """Quita un diario del índice en memoria (al borrar su fichero)."""
+    _DIARIOS.pop(os.path.abspath(ruta), None)
@@ -0,0 +1,187 @@
+"""
+Identidad de un problema para checkpoints e historial.
+
+La clave de un problema es el sha256 de su descripción normalizada junto con
+la huella de la configuración que produce los resultados:
+
+- la descripción se normaliza (Unicode NFC, espacios y saltos de línea
+  colapsados), de modo que la misma descripción copiada con otra sangría da
+  la misma clave y dos descripciones que solo comparten el principio no;
+- la huella reúne el modelo de Gemini, un hash del código de los prompts
+  (`PROMPTS`) y las claves de CONFIG que cambian los prompts o los
+  resultados (`CLAVES_HUELLA`). Si cambia cualquiera de ellas la clave
+  cambia y los checkpoints anteriores dejan de usarse sin borrar nada.
+
+Cada directorio de checkpoints tiene un manifiesto (`manifest.json`) con la
+descripción resumida y la huella de cada clave, para saber a qué problema y
+configuración corresponde cada checkpoint. Varias ejecuciones pueden
+compartir el directorio: el manifiesto se lee y se reescribe con un bloqueo
+de fichero (`manifest.json.lock`), así que ningún registro se pierde.
+Listado:
+
+    python -m identidad checkpoints
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+from config import CONFIG
+
+VERSION = 1  # Cambiarla invalida todas las claves
+NOMBRE_MANIFIESTO = "manifest.json"
+
+# Código que genera los prompts, relativo al directorio del proyecto
+PROMPTS = ("mfsa/promts.py", "mmrc/promts.py", "ohi/promts.py", "mmrc/compactador.py")
+
+# Claves de CONFIG que cambian lo que se envía al LLM o lo que produce MISA-J
+# (las de MISA-J son las mismas que entran en la clave de la caché de `PrologSolver.solve`)
+CLAVES_HUELLA = ("gemini_modelo", "misa_j_trace_mode", "misa_j_verificar_programa", "mfsa_recortar_programa",
+                 "misa_j_max_ramas", "misa_j_captura_max_eventos", "misa_j_captura_max_profundidad",
+                 "misa_j_captura_excluir_modulos", "misa_j_captura_muestra_fallos",
+                 "mmrc_compactar_ramas", "mmrc_presupuesto_tokens_ramas", "mmrc_max_longitud_termino")
+
+
+def normalizar_descripcion(problem_description: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", problem_description).split())
+
+
+@lru_cache(maxsize=None)
+def hash_prompts() -> str:
+    """sha256 del código de los prompts (se calcula una vez por proceso)."""
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    resumen = hashlib.sha256()
+    for relativa in PROMPTS:
+        resumen.update(relativa.encode("utf-8") + b"\0")
+        try:
+            with open(os.path.join(raiz, relativa), "rb") as f:
+                resumen.update(f.read())
+        except OSError:
+            resumen.update(b"<ausente>")
+    return resumen.hexdigest()
+
+
+def huella_configuracion() -> Dict[str, Any]:
+    return {"version": VERSION, "prompts": hash_prompts(), "config": {clave: CONFIG.get(clave) for clave in CLAVES_HUELLA}}
+
+
+def _sha256_json(valor: Any) -> str:
+    return hashlib.sha256(json.dumps(valor, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def clave_problema(problem_description: str, huella: Optional[Dict[str, Any]] = None) -> str:
+    """sha256 de la descripción normalizada y la huella (por defecto, la de la configuración actual)."""
+    huella = huella_configuracion() if huella is None else huella
+    return _sha256_json({"descripcion": normalizar_descripcion(problem_description), "huella": huella})
+
+
+def identificador(problem_description: str) -> str:
+    """Parte de la clave que se usa en nombres de fichero (128 bits)."""
+    return clave_problema(problem_description)[:32]
+
+
+@contextmanager
+def _bloqueo(ruta: str) -> Iterator[None]:
+    """Bloqueo exclusivo entre procesos sobre el fichero `ruta` (se crea si no existe)."""
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    with open(ruta, "a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# (manifiesto, clave) ya registradas por este proceso: guardar otra vez no vuelve a leer el manifiesto
+_REGISTRADAS = set()
+
+
+class Manifiesto:
+    """`manifest.json` de un directorio: clave -> descripción resumida, huella y fecha."""
+
+    def __init__(self, directorio: str):
+        self.ruta = os.path.join(directorio, NOMBRE_MANIFIESTO)
+
+    def entradas(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                return json.load(f).get("problemas", {})
+        except (OSError, ValueError):
+            return {}
+
+    def registrar(self, problem_description: str) -> str:
+        """
+        Añade la clave del problema con la configuración actual si no está y
+        avisa si el mismo problema tenía checkpoints con otra huella. Devuelve
+        la clave.
+        """
+        huella = huella_configuracion()
+        clave = clave_problema(problem_description, huella)
+        if (self.ruta, clave) in _REGISTRADAS:
+            return clave
+        # Leer y reescribir con el bloqueo: otra ejecución puede estar registrando a la vez
+        with _bloqueo(self.ruta + ".lock"):
+            entradas = self.entradas()
+            _REGISTRADAS.add((self.ruta, clave))
+            if clave in entradas:
+                return clave
+            descripcion = _sha256_json(normalizar_descripcion(problem_description))
+            for anterior in entradas.values():
+                if anterior.get("descripcion") == descripcion:
+                    cambios = sorted(set(_diferencias(anterior.get("huella", {}), huella)))
+                    print(f"INFO: La configuración del problema cambió ({', '.join(cambios)}); "
+                          f"no se reutilizan sus checkpoints anteriores.")
+                    break
+            entradas[clave] = {"descripcion": descripcion, "resumen": normalizar_descripcion(problem_description)[:120],
+                               "huella": huella, "creado": datetime.now().isoformat()}
+            self._escribir(entradas)
+        return clave
+
+    def _escribir(self, entradas: Dict[str, Dict[str, Any]]):
+        directorio = os.path.dirname(self.ruta) or "."
+        os.makedirs(directorio, exist_ok=True)
+        # Escritura atómica: otro proceso nunca lee un manifiesto a medias
+        temporal = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directorio, suffix=".tmp", delete=False)
+        try:
+            with temporal:
+                json.dump({"version": VERSION, "problemas": entradas}, temporal, ensure_ascii=False, indent=1)
+            os.replace(temporal.name, self.ruta)
+        except Exception:
+            if os.path.exists(temporal.name):
+                os.remove(temporal.name)
+            raise
+
+
+def _diferencias(anterior: Dict[str, Any], actual: Dict[str, Any], prefijo: str = ""):
+    """Nombres de los componentes de la huella que difieren."""
+    for clave in set(anterior) | set(actual):
+        a, b = anterior.get(clave), actual.get(clave)
+        if isinstance(a, dict) and isinstance(b, dict):
+            yield from _diferencias(a, b, f"{prefijo}{clave}.")
+        elif a != b:
+            yield f"{prefijo}{clave}"
+
+
+if __name__ == "__main__":
+    for clave, entrada in Manifiesto(sys.argv[1] if len(sys.argv) > 1 else "checkpoints").entradas().items():
+        print(f"{clave[:32]}  {entrada['creado'][:19]}  {entrada['huella']['config'].get('gemini_modelo')}  "
+              f"{entrada['resumen'][:60]}")
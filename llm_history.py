@@ -2,29 +2,56 @@ import pickle
 import os
 from datetime import datetime
 
+from checkpoints_sqlite import MODULO_HISTORIAL, AlmacenCheckpoints
+from config import CONFIG
+from diario_historial import EXTENSION as EXTENSION_DIARIO, diario, olvidar, ruta_diario
+from identidad import Manifiesto, clave_problema, identificador
+
 HISTORY_DIR = "checkpoints"  # Mismo directorio que otros checkpoints
 
-def _ensure_history_dir():
+def _ensure_history_dir(history_dir: str = None):
     """Asegura que el directorio de historial exista."""
-    if not os.path.exists(HISTORY_DIR):
+    history_dir = history_dir or HISTORY_DIR
+    if not os.path.exists(history_dir):
         try:
-            os.makedirs(HISTORY_DIR)
-            print(f"Directorio de historial creado: {HISTORY_DIR}")
+            os.makedirs(history_dir)
+            print(f"Directorio de historial creado: {history_dir}")
         except OSError as e:
-            print(f"Error al crear el directorio de historial {HISTORY_DIR}: {e}")
+            print(f"Error al crear el directorio de historial {history_dir}: {e}")
 
-def get_history_filepath(problem_description: str) -> str:
-    """Genera una ruta de archivo para el historial."""
-    _ensure_history_dir()
-    # Crear un identificador único basado en la descripción del problema
-    problem_identifier = problem_description[:50].replace(" ", "_").replace("/", "_")
+def get_history_filepath(problem_description: str, history_dir: str = None) -> str:
+    """Genera una ruta de archivo para el historial.
+    `history_dir` permite usar el directorio de una ejecución concreta (por defecto, HISTORY_DIR)."""
+    history_dir = history_dir or HISTORY_DIR
+    _ensure_history_dir(history_dir)
+    # Identificador de la clave del problema y de la configuración (identidad.py)
+    problem_identifier = identificador(problem_description)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"llm_history_{problem_identifier}_{timestamp}.pkl"
-    return os.path.join(HISTORY_DIR, filename)
+    return os.path.join(history_dir, filename)
 
-def save_llm_history(history: dict, problem_description: str):
+def save_llm_history(history: dict, problem_description: str, history_dir: str = None):
     """Guarda el historial de respuestas del LLM."""
-    filepath = get_history_filepath(problem_description)
+    Manifiesto(history_dir or HISTORY_DIR).registrar(problem_description)
+    if CONFIG["llm_history_diario"]:
+        ruta = ruta_diario(history_dir or HISTORY_DIR, problem_description)
+        try:
+            # Solo se añade al diario lo que cambió desde el último guardado
+            diario(ruta).guardar(history, CONFIG["llm_history_compactar_cada"])
+            print(f"INFO: Historial del LLM guardado: {ruta}")
+        except Exception as e:
+            print(f"ERROR: No se pudo guardar el historial del LLM en {ruta}: {e}")
+        return
+    if CONFIG["checkpoints_backend"] == "sqlite":
+        almacen = AlmacenCheckpoints(history_dir or HISTORY_DIR)
+        try:
+            # Se conservan todas las versiones, como con un pickle por fecha
+            almacen.guardar(clave_problema(problem_description), MODULO_HISTORIAL, 0, history, reemplazar=False)
+            print(f"INFO: Historial del LLM guardado en {almacen.ruta}")
+        except Exception as e:
+            print(f"ERROR: No se pudo guardar el historial del LLM en {almacen.ruta}: {e}")
+        return
+    filepath = get_history_filepath(problem_description, history_dir)
     try:
         with open(filepath, 'wb') as f:
             pickle.dump(history, f)
@@ -32,20 +59,44 @@ def save_llm_history(history: dict, problem_description: str):
     except Exception as e:
         print(f"ERROR: No se pudo guardar el historial del LLM en {filepath}: {e}")
 
-def load_latest_llm_history(problem_description: str) -> dict:
+def load_latest_llm_history(problem_description: str, history_dir: str = None) -> dict:
     """Carga el historial más reciente para un problema específico."""
-    _ensure_history_dir()
-    prefix = f"llm_history_{problem_description[:50].replace(' ', '_').replace('/', '_')}"
+    history_dir = history_dir or HISTORY_DIR
+    if CONFIG["llm_history_diario"]:
+        ruta = ruta_diario(history_dir, problem_description)
+        try:
+            history = diario(ruta).cargar()
+        except Exception as e:
+            print(f"ERROR: No se pudo cargar el historial del LLM desde {ruta}: {e}")
+            return {}
+        if history:
+            print(f"INFO: Historial del LLM cargado: {ruta}")
+            return history
+        # Sin diario todavía: el historial guardado antes en SQLite o en pickles pasa al diario al guardarlo
+    if CONFIG["checkpoints_backend"] == "sqlite":
+        almacen = AlmacenCheckpoints(history_dir)
+        try:
+            history = almacen.cargar([clave_problema(problem_description)], MODULO_HISTORIAL)
+        except Exception as e:
+            print(f"ERROR: No se pudo cargar el historial del LLM desde {almacen.ruta}: {e}")
+            return {}
+        if history is None:
+            print(f"INFO: No se encontró historial previo para el problema.")
+            return {}
+        print(f"INFO: Historial del LLM cargado desde {almacen.ruta}")
+        return history
+    _ensure_history_dir(history_dir)
+    prefix = f"llm_history_{identificador(problem_description)}"
     
     # Buscar el archivo más reciente que coincida con el prefijo
-    matching_files = [f for f in os.listdir(HISTORY_DIR) if f.startswith(prefix) and f.endswith('.pkl')]
+    matching_files = [f for f in os.listdir(history_dir) if f.startswith(prefix) and f.endswith('.pkl')]
     if not matching_files:
         print(f"INFO: No se encontró historial previo para el problema.")
         return {}
     
     # Ordenar por fecha de modificación y tomar el más reciente
-    latest_file = max(matching_files, key=lambda f: os.path.getmtime(os.path.join(HISTORY_DIR, f)))
-    filepath = os.path.join(HISTORY_DIR, latest_file)
+    latest_file = max(matching_files, key=lambda f: os.path.getmtime(os.path.join(history_dir, f)))
+    filepath = os.path.join(history_dir, latest_file)
     
     try:
         with open(filepath, 'rb') as f:
@@ -56,21 +107,29 @@ def load_latest_llm_history(problem_description: str) -> dict:
         print(f"ERROR: No se pudo cargar el historial del LLM desde {filepath}: {e}")
         return {}
 
-def clear_llm_history(problem_description: str = None):
+def clear_llm_history(problem_description: str = None, history_dir: str = None):
     """Elimina archivos de historial.
     Si se proporciona problem_description, solo elimina el historial de ese problema.
     Si no, elimina todo el historial."""
-    _ensure_history_dir()
+    history_dir = history_dir or HISTORY_DIR
+    _ensure_history_dir(history_dir)
     
     if problem_description:
-        prefix = f"llm_history_{problem_description[:50].replace(' ', '_').replace('/', '_')}"
-        files_to_delete = [f for f in os.listdir(HISTORY_DIR) if f.startswith(prefix) and f.endswith('.pkl')]
+        prefix = f"llm_history_{identificador(problem_description)}"
+        files_to_delete = [f for f in os.listdir(history_dir) if f.startswith(prefix) and f.endswith('.pkl')]
+        diarios = [os.path.basename(ruta_diario(history_dir, problem_description))]
     else:
-        files_to_delete = [f for f in os.listdir(HISTORY_DIR) if f.startswith('llm_history_') and f.endswith('.pkl')]
+        files_to_delete = [f for f in os.listdir(history_dir) if f.startswith('llm_history_') and f.endswith('.pkl')]
+        diarios = [f for f in os.listdir(history_dir) if f.startswith('llm_history_') and f.endswith(EXTENSION_DIARIO)]
+    for filename in diarios:
+        olvidar(os.path.join(history_dir, filename))
+    files_to_delete += [f for f in diarios if os.path.exists(os.path.join(history_dir, f))]
     
-    count = 0
+    # Historial del almacén SQLite
+    claves = [clave_problema(problem_description)] if problem_description else None
+    count = AlmacenCheckpoints(history_dir).eliminar(claves, MODULO_HISTORIAL)
     for filename in files_to_delete:
-        filepath = os.path.join(HISTORY_DIR, filename)
+        filepath = os.path.join(history_dir, filename)
         try:
             os.remove(filepath)
             count += 1
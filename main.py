@@ -2,25 +2,35 @@ from mfsa.mfsa_module import SemanticFormalizationAxiomatizationModule
 from mfsa.kr_store import KnowledgeRepresentationStore
 from ohi.ohi import HeuristicInferenceOrchestrator
 from misa_j.cfcs import PrologSolver
+from misa_j.captura import PoliticaCaptura
 from mmrc.mmrc_module import MetaCognitionKnowledgeRefinementModule
 from checkpoints_utils import save_checkpoint, load_checkpoint
 from config import CONFIG, redirect_output, setup_logging, clear_solutions
 from llm_history import save_llm_history, load_latest_llm_history
+from run_context import RunContext
 from datetime import datetime
 
-def run_main_with_problem(problem_description: str) -> str:
+def run_main_with_problem(problem_description: str, context: RunContext = None) -> str:
     """
     Ejecuta el sistema completo con un problema específico y devuelve la respuesta final.
     
     Args:
         problem_description: Descripción del problema a resolver
+        context: Espacio de trabajo de la ejecución (soluciones, checkpoints, historial).
+            Si es None se usa RunContext.from_config()
         
     Returns:
         str: Respuesta final del sistema
     """
+    if context is None:
+        context = RunContext.from_config()
+
     # Instanciación de módulos principales
     ohi = HeuristicInferenceOrchestrator()
-    misa_j_solver = PrologSolver()
+    misa_j_solver = PrologSolver(CONFIG["misa_j_trace_mode"], CONFIG["misa_j_max_ramas"], CONFIG["misa_j_swipl_pool"],
+                                 CONFIG["misa_j_cache_mb"], CONFIG["misa_j_cache_dir"], CONFIG["misa_j_arbol_compacto"],
+                                 PoliticaCaptura.desde_config(CONFIG), CONFIG["misa_j_formato_traza"],
+                                 CONFIG["misa_j_verificar_programa"], CONFIG["misa_j_exportar_json"])
     mmrc_module = MetaCognitionKnowledgeRefinementModule()
 
     problem_topic_hint = None
@@ -35,7 +45,7 @@ def run_main_with_problem(problem_description: str) -> str:
     goal_clauses_mfsa = []
     
     # Cargar historial previo o inicializar uno nuevo
-    history = load_latest_llm_history(problem_description)
+    history = load_latest_llm_history(problem_description, context.history_dir)
     if not history:
         history = {
             'responses': [],
@@ -47,8 +57,8 @@ def run_main_with_problem(problem_description: str) -> str:
     checkpoint_kr_store_name = "mfsa_kr_store"
     loaded_kr = None
     if not CONFIG["force_run_mfsa"]:
-        loaded_kr = load_checkpoint(checkpoint_kr_store_name, problem_description)
-        history = load_latest_llm_history(problem_description)
+        loaded_kr = load_checkpoint(checkpoint_kr_store_name, problem_description, context.checkpoint_dir)
+        history = load_latest_llm_history(problem_description, context.history_dir)
     
     if loaded_kr:
         current_kr_store = loaded_kr
@@ -76,30 +86,49 @@ def run_main_with_problem(problem_description: str) -> str:
             history['cycle_count'] = 0  # MFSA es pre-ciclos
         
         if CONFIG["save_checkpoints"]:
-            save_checkpoint(current_kr_store, checkpoint_kr_store_name, problem_description)
-            save_llm_history(history, problem_description)
+            save_checkpoint(current_kr_store, checkpoint_kr_store_name, problem_description, context.checkpoint_dir)
+            save_llm_history(history, problem_description, context.history_dir)
     
+    solver_result = None
     for cycle in range(CONFIG["max_refinement_cycles"]):
         print(f"\n--- CICLO DE REFINAMIENTO {cycle + 1} / {CONFIG['max_refinement_cycles']} ---")
 
+        goal_clauses_mfsa = current_kr_store.get_clauses_by_category("goal_clause")
+        # Si el último `update` del KR-Store no cambió ninguna cláusula (`ultimo_diff`), el
+        # programa es el mismo: se reutiliza el resultado de MISA-J del ciclo anterior
+        reutilizar_misa_j = (solver_result is not None and bool(goal_clauses_mfsa)
+                             and not current_kr_store.hay_cambios())
+
         # --- Limpieza de soluciones anteriores ---
-        clear_solutions()
+        if not reutilizar_misa_j:
+            clear_solutions(context.solutions_dir)
 
-        goal_clauses_mfsa = current_kr_store.get_clauses_by_category("goal_clause")
-        selected_clauses = current_kr_store.get_clauses_by_category("problem_clause")
+        if CONFIG["mfsa_recortar_programa"]:
+            selected_clauses = current_kr_store.clausulas_relevantes()
+        else:
+            selected_clauses = current_kr_store.get_clauses_by_category("problem_clause")
 
         # --- 2. MISA-J (Motor de Inferencia Simbólica Asistido por Justificación) ---
         checkpoint_misa_trace_name = f"misa_j_trace_cycle{cycle}"
         solver_errors = []  # Lista para capturar errores del solver
         thought_tree = {}
-        if CONFIG["force_run_misa_j"]:
+        if reutilizar_misa_j:
+            print("INFO: Las cláusulas no cambiaron en el último refinamiento; se reutiliza el resultado de MISA-J.")
+            thought_tree = solver_result["ramas"]
+            solver_errors.append(solver_result["errors"])
+            solver_errors.extend(solver_result.get("diagnosticos", []))
+            if CONFIG["save_checkpoints"]:
+                save_checkpoint(solver_result, checkpoint_misa_trace_name, problem_description, context.checkpoint_dir)
+        elif CONFIG["force_run_misa_j"]:
             print("\n--- Ejecutando MISA-J (CFCS) ---")
             if goal_clauses_mfsa:
-                solver_result = misa_j_solver.solve(selected_clauses, goal_clauses_mfsa[0])
+                solver_result = misa_j_solver.solve(selected_clauses, goal_clauses_mfsa[0],
+                                                     directorio_soluciones=context.solutions_dir)
                 thought_tree = solver_result["ramas"]
                 solver_errors.append(solver_result["errors"])
+                solver_errors.extend(solver_result.get("diagnosticos", []))
                 if CONFIG["save_checkpoints"] and solver_result:
-                    save_checkpoint(solver_result, checkpoint_misa_trace_name, problem_description)
+                    save_checkpoint(solver_result, checkpoint_misa_trace_name, problem_description, context.checkpoint_dir)
             else:
                 solver_errors.append("No se encontraron cláusulas de objetivo (goal_clause)")
                 solver_result = {"ramas": [], "errors": solver_errors}
@@ -107,9 +136,10 @@ def run_main_with_problem(problem_description: str) -> str:
 
         else:
             print("INFO: MISA-J omitido, traza cargada desde checkpoint.")
-            solver_result = load_checkpoint(checkpoint_misa_trace_name, problem_description)
+            solver_result = load_checkpoint(checkpoint_misa_trace_name, problem_description, context.checkpoint_dir)
             thought_tree = solver_result["ramas"]
             solver_errors.append(solver_result["errors"])
+            solver_errors.extend(solver_result.get("diagnosticos", []))
 
         # Verificar si thought_tree es None o thought_tree.valor está vacío
         if not thought_tree:
@@ -121,31 +151,33 @@ def run_main_with_problem(problem_description: str) -> str:
         mmrc_result = None
 
         if CONFIG["force_run_mmrc"]:
-            mmrc_result = mmrc_module.analyze_thought_tree(solver_result, problem_description, selected_clauses, solver_errors, history)
+            mmrc_result = mmrc_module.analyze_thought_tree(solver_result, problem_description, selected_clauses, solver_errors, history,
+                                                             solutions_dir=context.solutions_dir)
             if CONFIG["save_checkpoints"] and mmrc_result:
-                save_checkpoint(mmrc_result, checkpoint_mmrc_name, problem_description)
+                save_checkpoint(mmrc_result, checkpoint_mmrc_name, problem_description, context.checkpoint_dir)
                 
                 # Guardar la respuesta en el historial
                 if mmrc_result["response"]:
                     history['responses'].append(mmrc_result["response"])
                     history['timestamps'].append(datetime.now().isoformat())
                     history['cycle_count'] = cycle + 1
-                    save_llm_history(history, problem_description)
+                    save_llm_history(history, problem_description, context.history_dir)
         else:
             print("INFO: MMRC omitido, resultado cargado desde checkpoint.")
-            mmrc_result = load_checkpoint(checkpoint_mmrc_name, problem_description)
+            mmrc_result = load_checkpoint(checkpoint_mmrc_name, problem_description, context.checkpoint_dir)
             if not mmrc_result:
                 print("No se encontró checkpoint para MMRC, ejecutando módulo...")
-                mmrc_result = mmrc_module.analyze_thought_tree(solver_result, problem_description, selected_clauses, solver_errors, history)
+                mmrc_result = mmrc_module.analyze_thought_tree(solver_result, problem_description, selected_clauses, solver_errors, history,
+                                                             solutions_dir=context.solutions_dir)
                 if CONFIG["save_checkpoints"] and mmrc_result:
-                    save_checkpoint(mmrc_result, checkpoint_mmrc_name, problem_description)
+                    save_checkpoint(mmrc_result, checkpoint_mmrc_name, problem_description, context.checkpoint_dir)
                     
                     # Guardar la respuesta en el historial
                     if mmrc_result["response"]:
                         history['responses'].append(mmrc_result["response"])
                         history['timestamps'].append(datetime.now().isoformat())
                         history['cycle_count'] = cycle + 1
-                        save_llm_history(history, problem_description)
+                        save_llm_history(history, problem_description, context.history_dir)
         
         print("\n=== RESULTADO DEL ANÁLISIS MMRC ===")
         if mmrc_result["status"] == "success":
@@ -169,7 +201,10 @@ def run_main_with_problem(problem_description: str) -> str:
 def main_original():
     # Instanciación de módulos principales
     ohi = HeuristicInferenceOrchestrator()
-    misa_j_solver = PrologSolver()
+    misa_j_solver = PrologSolver(CONFIG["misa_j_trace_mode"], CONFIG["misa_j_max_ramas"], CONFIG["misa_j_swipl_pool"],
+                                 CONFIG["misa_j_cache_mb"], CONFIG["misa_j_cache_dir"], CONFIG["misa_j_arbol_compacto"],
+                                 PoliticaCaptura.desde_config(CONFIG), CONFIG["misa_j_formato_traza"],
+                                 CONFIG["misa_j_verificar_programa"], CONFIG["misa_j_exportar_json"])
     mmrc_module = MetaCognitionKnowledgeRefinementModule()
 
 
@@ -256,7 +291,10 @@ def main_original():
         clear_solutions()
 
         goal_clauses_mfsa = current_kr_store.get_clauses_by_category("goal_clause")
-        selected_clauses = current_kr_store.get_clauses_by_category("problem_clause")
+        if CONFIG["mfsa_recortar_programa"]:
+            selected_clauses = current_kr_store.clausulas_relevantes()
+        else:
+            selected_clauses = current_kr_store.get_clauses_by_category("problem_clause")
 
         # --- 2. MISA-J (Motor de Inferencia Simbólica Asistido por Justificación) ---
         checkpoint_misa_trace_name = f"misa_j_trace_cycle{cycle}"
@@ -268,6 +306,7 @@ def main_original():
                 solver_result = misa_j_solver.solve(selected_clauses, goal_clauses_mfsa[0])
                 thought_tree = solver_result["ramas"]
                 solver_errors.append(solver_result["errors"])
+                solver_errors.extend(solver_result.get("diagnosticos", []))
                 if CONFIG["save_checkpoints"] and solver_result:
                     save_checkpoint(solver_result, checkpoint_misa_trace_name, problem_description)
             else:
@@ -280,6 +319,7 @@ def main_original():
             solver_result = load_checkpoint(checkpoint_misa_trace_name, problem_description)
             thought_tree = solver_result["ramas"]
             solver_errors.append(solver_result["errors"])
+            solver_errors.extend(solver_result.get("diagnosticos", []))
 
         # Verificar si thought_tree es None o thought_tree.valor está vacío
         if not thought_tree:
@@ -377,7 +417,7 @@ def main_original():
     
     return final_answer
 
-def main():
+def main(context: RunContext = None):
     """Función main simplificada que usa el problema por defecto"""
     problem_description = f"""
         Una cierta isla G está habitada exclusivamente por caballeros que dicen siempre
@@ -402,17 +442,20 @@ def main():
     """
     
     # Usar la nueva función
-    final_answer = run_main_with_problem(problem_description)
+    final_answer = run_main_with_problem(problem_description, context)
     print(f"\nRESPUESTA FINAL: {final_answer}")
     return final_answer
 
 if __name__ == "__main__":
+    # Espacio de trabajo de la ejecución
+    context = RunContext.from_config()
+
     # Configurar logging
-    log_file = setup_logging()
+    log_file = setup_logging(context.log_dir)
     
     # Si se activó el logging a archivo, redirigir la salida
     if log_file:
         with redirect_output(log_file):
-            main()  # Usar la nueva función main simplificada
+            main(context)  # Usar la nueva función main simplificada
     else:
-        main()  # Ejecutar sin redirección si no se activó el logging
+        main(context)  # Ejecutar sin redirección si no se activó el logging
@@ -0,0 +1,51 @@
+"""
+Diferencias entre dos versiones de un conjunto de cláusulas del KR-Store.
+
+Una cláusula cambiada es una que desaparece y otra nueva con la misma cabeza
+(functor y aridad), emparejadas en orden: `cofre(X) :- a.` sustituida por
+`cofre(X) :- b.` es un cambio, no un alta y una baja. Como en Prolog el orden
+de las cláusulas importa, también se indica si las que se mantienen cambiaron
+de orden.
+"""
+from typing import Dict, List, NamedTuple, Tuple
+
+from misa_j.terminos import cabeza_clausula
+
+
+class DiffClausulas(NamedTuple):
+    agregadas: List[str]
+    eliminadas: List[str]
+    cambiadas: List[Tuple[str, str]]  # (anterior, nueva)
+    reordenadas: bool = False
+
+    @property
+    def vacio(self) -> bool:
+        return not (self.agregadas or self.eliminadas or self.cambiadas or self.reordenadas)
+
+    def resumen(self) -> str:
+        texto = f"+{len(self.agregadas)} -{len(self.eliminadas)} ~{len(self.cambiadas)}"
+        return texto + " (reordenadas)" if self.reordenadas else texto
+
+
+def calcular_diff(anteriores: List[str], nuevas: List[str]) -> DiffClausulas:
+    """Diferencia entre dos listas de cláusulas, en tiempo lineal."""
+    previas = dict.fromkeys(anteriores)
+    actuales = dict.fromkeys(nuevas)
+    eliminadas = [clausula for clausula in previas if clausula not in actuales]
+    agregadas = [clausula for clausula in actuales if clausula not in previas]
+
+    por_cabeza: Dict[Tuple[str, int], List[str]] = {}
+    for clausula in reversed(eliminadas):
+        por_cabeza.setdefault(cabeza_clausula(clausula), []).append(clausula)
+    cambiadas = []
+    solo_agregadas = []
+    for clausula in agregadas:
+        candidatas = por_cabeza.get(cabeza_clausula(clausula))
+        if candidatas:
+            cambiadas.append((candidatas.pop(), clausula))
+        else:
+            solo_agregadas.append(clausula)
+    emparejadas = {anterior for anterior, _ in cambiadas}
+
+    reordenadas = ([c for c in previas if c in actuales] != [c for c in actuales if c in previas])
+    return DiffClausulas(solo_agregadas, [c for c in eliminadas if c not in emparejadas], cambiadas, reordenadas)
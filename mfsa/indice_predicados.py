@@ -0,0 +1,354 @@
+"""
+Índice de predicados y grafo de llamadas de las cláusulas del KR-Store.
+
+Cada cláusula se analiza una sola vez al añadirla: la cabeza da el predicado
+que define (functor/aridad) y el cuerpo los predicados a los que llama,
+atravesando las construcciones de control (`,`, `;`, `->`, `\\+`) y los
+metapredicados habituales (`findall/3`, `forall/2`, `maplist/N`, `predsort/3`,
+`freeze/2`...), y `phrase/2,3` llama al no terminal con dos argumentos más. El grafo
+se mantiene al añadir y quitar cláusulas, contando cuántas llamadas aporta
+cada una, así que nunca hay que reconstruirlo.
+
+El recorte de una consulta son las cláusulas de los predicados alcanzables
+desde ella más las directivas (`:- ...`), que se cargan siempre. Si alguna
+cláusula alcanzable llama a una meta que solo se conoce al ejecutar
+(`call(G)` con `G` variable) o a algo que no es un functor invocable (una
+meta que no se ha podido analizar), el recorte no es fiable y se usa el
+programa completo. Los operadores que declara el programa (`:- op(700, xfx, <->).`)
+se tienen en cuenta al analizar las cláusulas que vienen detrás.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from misa_j.terminos import (Operadores, analizar_termino, argumentos, cabeza_clausula, clave_functor,
+                              declaracion_operadores, es_invocable)
+
+Predicado = Tuple[str, int]
+
+# Llamada a una meta desconocida hasta la ejecución (una variable)
+DESCONOCIDA: Predicado = ("_", -1)
+
+# Argumentos que son metas: (posición, argumentos que se añaden al llamarla)
+_METAARGUMENTOS: Dict[Predicado, Tuple[Tuple[int, int], ...]] = {
+    (",", 2): ((0, 0), (1, 0)), (";", 2): ((0, 0), (1, 0)), ("|", 2): ((0, 0), (1, 0)),
+    ("->", 2): ((0, 0), (1, 0)), ("*->", 2): ((0, 0), (1, 0)),
+    ("\\+", 1): ((0, 0),), ("not", 1): ((0, 0),), ("once", 1): ((0, 0),), ("ignore", 1): ((0, 0),),
+    ("findall", 3): ((1, 0),), ("findall", 4): ((1, 0),), ("forall", 2): ((0, 0), (1, 0)),
+    ("bagof", 3): ((1, 0),), ("setof", 3): ((1, 0),), ("^", 2): ((1, 0),),
+    ("aggregate_all", 3): ((1, 0),), ("aggregate_all", 4): ((2, 0),),
+    ("catch", 3): ((0, 0), (2, 0)), ("call_cleanup", 2): ((0, 0), (1, 0)),
+    ("setup_call_cleanup", 3): ((0, 0), (1, 0), (2, 0)),
+    ("with_output_to", 2): ((1, 0),), ("limit", 2): ((1, 0),), ("offset", 2): ((1, 0),),
+    ("initialization", 1): ((0, 0),), ("initialization", 2): ((0, 0),),
+    ("include", 3): ((0, 1),), ("exclude", 3): ((0, 1),), ("partition", 4): ((0, 1),),
+    ("partition", 6): ((0, 2),), ("predsort", 3): ((0, 3),),
+    ("max_member", 3): ((0, 2),), ("min_member", 3): ((0, 2),),
+    ("aggregate", 3): ((1, 0),), ("aggregate", 4): ((2, 0),), ("call_cleanup", 3): ((0, 0), (2, 0)),
+    ("catch_with_backtrace", 3): ((0, 0), (2, 0)), ("call_nth", 2): ((0, 0),),
+    ("distinct", 1): ((0, 0),), ("distinct", 2): ((1, 0),), ("order_by", 2): ((1, 0),),
+    ("freeze", 2): ((1, 0),), ("when", 2): ((1, 0),),
+}
+# Metapredicados cuyo primer argumento es un cuerpo DCG (no terminal con dos argumentos más)
+_FRASES = {("phrase", 2), ("phrase", 3), ("call_dcg", 3)}
+for _aridad in range(1, 9):
+    _METAARGUMENTOS[("call", _aridad)] = ((0, _aridad - 1),)
+for _aridad in range(2, 8):
+    _METAARGUMENTOS[("maplist", _aridad)] = ((0, _aridad - 1),)
+for _aridad in range(4, 8):
+    _METAARGUMENTOS[("foldl", _aridad)] = ((0, _aridad - 1),)
+
+_VARIABLE = re.compile(r"[A-Z_]\w*")
+
+# Predicados que reciben una cláusula como dato: su cuerpo se llamará más tarde
+_ASERCIONES = {("assert", 1), ("asserta", 1), ("assertz", 1)}
+_RETRACCIONES = {("retract", 1), ("retractall", 1)}
+
+
+def _es_variable(texto: str) -> bool:
+    return _VARIABLE.fullmatch(texto) is not None
+
+
+def _llamadas_meta(meta: str, extra: int, llamadas: List[Predicado], dinamicos: Optional[List[Predicado]] = None,
+                   operadores: Operadores = ()):
+    """
+    Añade a `llamadas` los predicados que llama la meta (con `extra`
+    argumentos más) y a `dinamicos`, si se indica, los que modifica con
+    assert/retract.
+    """
+    meta = meta.strip()
+    if not meta:
+        return
+    if _es_variable(meta):
+        llamadas.append(DESCONOCIDA)
+        return
+    termino = analizar_termino(meta, operadores)
+    clave = (termino.functor, termino.aridad)
+    if extra:
+        if clave == (">>", 2):
+            # Lambda de yall: `[X]>>meta`
+            _llamadas_meta(argumentos(meta, operadores)[1], 0, llamadas, dinamicos, operadores)
+        else:
+            llamadas.append((termino.functor, termino.aridad + extra))
+        return
+    if clave in _ASERCIONES or clave in _RETRACCIONES:
+        clausula = argumentos(meta, operadores)[0]
+        es_regla = analizar_termino(clausula, operadores).functor == ":-"
+        if dinamicos is not None and not _es_variable(clausula):
+            dinamicos.append(cabeza_clausula(clausula, operadores))
+        if clave in _ASERCIONES and es_regla:
+            _llamadas_meta(argumentos(clausula, operadores)[1], 0, llamadas, dinamicos, operadores)
+        if clave in _RETRACCIONES:
+            llamadas.append(clave)
+        return
+    if clave in _FRASES:
+        _llamadas_dcg(argumentos(meta, operadores)[0], llamadas, operadores)
+        return
+    metaargumentos = _METAARGUMENTOS.get(clave)
+    if metaargumentos is None:
+        llamadas.append(clave)
+        return
+    args = argumentos(meta, operadores)
+    for posicion, argumentos_extra in metaargumentos:
+        _llamadas_meta(args[posicion], argumentos_extra, llamadas, dinamicos, operadores)
+
+
+def _llamadas_dcg(cuerpo: str, llamadas: List[Predicado], operadores: Operadores = ()):
+    """Predicados que llama el cuerpo de una regla DCG (`cabeza --> cuerpo`)."""
+    cuerpo = cuerpo.strip()
+    if _es_variable(cuerpo):
+        llamadas.append(DESCONOCIDA)
+        return
+    if not cuerpo:
+        return
+    termino = analizar_termino(cuerpo, operadores)
+    if termino.functor in (",", ";", "|", "->") and termino.aridad == 2:
+        for parte in argumentos(cuerpo, operadores):
+            _llamadas_dcg(parte, llamadas, operadores)
+    elif cuerpo == "!" or cuerpo[0] in "[\"":
+        # Terminales (también `[a], resto`, que empieza por un terminal) y corte
+        return
+    elif (termino.functor, termino.aridad) == ("\\+", 1):
+        _llamadas_dcg(argumentos(cuerpo, operadores)[0], llamadas, operadores)
+    elif (termino.functor, termino.aridad) == ("{}", 1):
+        _llamadas_meta(argumentos(cuerpo, operadores)[0], 0, llamadas, operadores=operadores)
+    else:
+        llamadas.append((termino.functor, termino.aridad + 2))
+
+
+def analizar_clausula(clausula: str, operadores: Operadores = ()) -> Tuple[Optional[Predicado], List[Predicado]]:
+    """
+    Predicado que define la cláusula (None si es una directiva) y predicados
+    a los que llama, en orden y con repeticiones.
+    """
+    texto = clausula.strip()
+    if texto.endswith("."):
+        texto = texto[:-1]
+    llamadas: List[Predicado] = []
+    termino = analizar_termino(texto, operadores)
+    if (termino.functor, termino.aridad) in ((":-", 1), ("?-", 1)):
+        _llamadas_meta(argumentos(texto, operadores)[0], 0, llamadas, operadores=operadores)
+        return None, llamadas
+    if (termino.functor, termino.aridad) == ("-->", 2):
+        cabeza, cuerpo = argumentos(texto, operadores)
+        # Los no terminales reciben dos argumentos más; la cabeza puede llevar un pushback (`a, [x] --> ...`)
+        if analizar_termino(cabeza, operadores).functor == ",":
+            cabeza = argumentos(cabeza, operadores)[0]
+        functor, aridad = analizar_termino(cabeza, operadores)[:2]
+        _llamadas_dcg(cuerpo, llamadas, operadores)
+        return (functor, aridad + 2), llamadas
+    if (termino.functor, termino.aridad) == (":-", 2):
+        _llamadas_meta(argumentos(texto, operadores)[1], 0, llamadas, operadores=operadores)
+    return cabeza_clausula(texto, operadores), llamadas
+
+
+def predicados_dinamicos(clausula: str, operadores: Operadores = ()) -> List[Predicado]:
+    """
+    Predicados que la cláusula declara dinámicos (`:- dynamic p/1.`) o que
+    modifica con assert/retract: pueden no tener cláusulas en el programa.
+    """
+    texto = clausula.strip()
+    if texto.endswith("."):
+        texto = texto[:-1]
+    termino = analizar_termino(texto, operadores)
+    dinamicos: List[Predicado] = []
+    if (termino.functor, termino.aridad) in ((":-", 1), ("?-", 1)):
+        directiva = argumentos(texto, operadores)[0]
+        if clave_functor(directiva) in (("dynamic", 1), ("discontiguous", 1), ("multifile", 1)):
+            _indicadores(argumentos(directiva)[0], dinamicos)
+            return dinamicos
+        cuerpo = directiva
+    elif (termino.functor, termino.aridad) == (":-", 2):
+        cuerpo = argumentos(texto, operadores)[1]
+    else:
+        return dinamicos
+    _llamadas_meta(cuerpo, 0, [], dinamicos, operadores)
+    return dinamicos
+
+
+def _indicadores(texto: str, indicadores: List[Predicado]):
+    """Añade los indicadores `nombre/aridad` de `p/1, q/2` o `[p/1, q/2]`."""
+    texto = texto.strip()
+    if texto.startswith("[") and texto.endswith("]"):
+        texto = texto[1:-1]
+    termino = analizar_termino(texto)
+    if (termino.functor, termino.aridad) == (",", 2):
+        for parte in argumentos(texto):
+            _indicadores(parte, indicadores)
+    elif (termino.functor, termino.aridad) == ("/", 2):
+        nombre, aridad = argumentos(texto)
+        if aridad.isdigit():
+            indicadores.append((analizar_termino(nombre).functor, int(aridad)))
+
+
+def llamadas_consulta(consulta: str, operadores: Operadores = ()) -> List[Predicado]:
+    """Predicados a los que llama una consulta (`solucion(X), write(X).`)."""
+    texto = consulta.strip()
+    if texto.startswith("?-"):
+        texto = texto[2:]
+    if texto.endswith("."):
+        texto = texto[:-1]
+    llamadas: List[Predicado] = []
+    _llamadas_meta(texto, 0, llamadas, operadores=operadores)
+    return llamadas
+
+
+class IndicePredicados:
+    """
+    Predicado -> cláusulas que lo definen, y grafo de llamadas entre
+    predicados, actualizados cláusula a cláusula. Una misma cláusula puede
+    estar en varias categorías: se cuenta y solo sale del índice con la
+    última. Los operadores declarados se conservan aunque se quite su
+    directiva, como en Prolog.
+    """
+
+    def __init__(self):
+        self._referencias: Dict[str, int] = {}
+        self._cabezas: Dict[str, Optional[Predicado]] = {}
+        self._llamadas: Dict[str, List[Predicado]] = {}
+        self._definiciones: Dict[Predicado, Dict[str, None]] = {}
+        self._directivas: Dict[str, None] = {}
+        # llamador -> llamado -> número de llamadas (para poder quitarlas)
+        self._aristas: Dict[Predicado, Dict[Predicado, int]] = {}
+        self._llamadores: Dict[Predicado, Dict[Predicado, int]] = {}
+        self.operadores: Operadores = ()
+
+    def agregar(self, clausula: str):
+        referencias = self._referencias.get(clausula, 0)
+        self._referencias[clausula] = referencias + 1
+        if referencias:
+            return
+        self.operadores += declaracion_operadores(clausula)
+        cabeza, llamadas = analizar_clausula(clausula, self.operadores)
+        self._cabezas[clausula] = cabeza
+        self._llamadas[clausula] = llamadas
+        if cabeza is None:
+            self._directivas[clausula] = None
+            return
+        self._definiciones.setdefault(cabeza, {})[clausula] = None
+        for llamado in llamadas:
+            salientes = self._aristas.setdefault(cabeza, {})
+            salientes[llamado] = salientes.get(llamado, 0) + 1
+            entrantes = self._llamadores.setdefault(llamado, {})
+            entrantes[cabeza] = entrantes.get(cabeza, 0) + 1
+
+    def eliminar(self, clausula: str):
+        referencias = self._referencias.get(clausula, 0)
+        if referencias > 1:
+            self._referencias[clausula] = referencias - 1
+            return
+        if not referencias:
+            return
+        del self._referencias[clausula]
+        cabeza = self._cabezas.pop(clausula)
+        llamadas = self._llamadas.pop(clausula)
+        if cabeza is None:
+            del self._directivas[clausula]
+            return
+        definiciones = self._definiciones[cabeza]
+        del definiciones[clausula]
+        if not definiciones:
+            del self._definiciones[cabeza]
+        for llamado in llamadas:
+            _descontar(self._aristas, cabeza, llamado)
+            _descontar(self._llamadores, llamado, cabeza)
+
+    def vaciar(self):
+        for tabla in (self._referencias, self._cabezas, self._llamadas, self._definiciones,
+                      self._directivas, self._aristas, self._llamadores):
+            tabla.clear()
+        self.operadores = ()
+
+    def __len__(self):
+        return len(self._referencias)
+
+    def __contains__(self, clausula: str) -> bool:
+        return clausula in self._referencias
+
+    def predicados(self) -> List[Predicado]:
+        """Predicados definidos por alguna cláusula."""
+        return list(self._definiciones)
+
+    def clausulas_de(self, functor: str, aridad: int) -> List[str]:
+        """Cláusulas que definen functor/aridad, en el orden en que se añadieron."""
+        return list(self._definiciones.get((functor, aridad), ()))
+
+    def llamados_por(self, functor: str, aridad: int) -> List[Predicado]:
+        """Predicados a los que llaman directamente las cláusulas de functor/aridad."""
+        return list(self._aristas.get((functor, aridad), ()))
+
+    def llamadores_de(self, functor: str, aridad: int) -> List[Predicado]:
+        """Predicados cuyas cláusulas llaman directamente a functor/aridad."""
+        return list(self._llamadores.get((functor, aridad), ()))
+
+    def cabeza(self, clausula: str) -> Optional[Predicado]:
+        """Predicado que define una cláusula del índice (None si es una directiva)."""
+        return self._cabezas.get(clausula)
+
+    def alcanzables(self, llamadas: Iterable[Predicado]) -> Set[Predicado]:
+        """
+        Predicados alcanzables desde las llamadas dadas, definidos o no;
+        incluye DESCONOCIDA si alguno llama a una meta variable.
+        """
+        pendientes = list(llamadas)
+        alcanzados: Set[Predicado] = set()
+        while pendientes:
+            predicado = pendientes.pop()
+            if predicado in alcanzados:
+                continue
+            alcanzados.add(predicado)
+            pendientes.extend(self._aristas.get(predicado, ()))
+        return alcanzados
+
+    def dependencias(self, consulta: str) -> Optional[Set[Predicado]]:
+        """
+        Predicados alcanzables desde la consulta y desde las directivas, o
+        None si alguno llama a una meta variable o a una meta que no es un
+        functor invocable (DESCONOCIDA tampoco lo es).
+        """
+        pendientes = llamadas_consulta(consulta, self.operadores)
+        for directiva in self._directivas:
+            pendientes.extend(self._llamadas[directiva])
+        alcanzados = self.alcanzables(pendientes)
+        return None if any(not es_invocable(functor) for functor, _ in alcanzados) else alcanzados
+
+    def recorte(self, clausulas: Iterable[str], consulta: str) -> List[str]:
+        """
+        Cláusulas (de las dadas, en su orden) de las que depende la consulta;
+        todas si las dependencias no se pueden saber de antemano.
+        """
+        alcanzados = self.dependencias(consulta)
+        if alcanzados is None:
+            return list(clausulas)
+        return [clausula for clausula in clausulas
+                if clausula not in self._cabezas or self._cabezas[clausula] is None
+                or self._cabezas[clausula] in alcanzados]
+
+
+def _descontar(grafo: Dict[Predicado, Dict[Predicado, int]], origen: Predicado, destino: Predicado):
+    vecinos = grafo[origen]
+    if vecinos[destino] > 1:
+        vecinos[destino] -= 1
+        return
+    del vecinos[destino]
+    if not vecinos:
+        del grafo[origen]
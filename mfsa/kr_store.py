@@ -2,15 +2,62 @@ import importlib.util
 import os
 from typing import List, Dict, Optional
 
+from mfsa.diff_clausulas import DiffClausulas, calcular_diff
+from mfsa.indice_predicados import IndicePredicados
 from mfsa.promts import extract_problem_clauses_promt
 from common.gemini_interface import ask_gemini_json
 
+CATEGORIAS = ("base_axiom", "problem_clause", "goal_clause")
+# Categorías que definen predicados; las cláusulas objetivo son consultas
+CATEGORIAS_PROGRAMA = ("base_axiom", "problem_clause")
+
+
 class KnowledgeRepresentationStore:
+    """
+    Cláusulas por categoría. Cada categoría es un dict ordenado (cláusula ->
+    None): conserva el orden de inserción, que en Prolog importa, y permite
+    comprobar duplicados y buscar o borrar una cláusula en O(1). `indice`
+    mantiene qué cláusulas definen cada predicado y el grafo de llamadas.
+    """
+
     def __init__(self):
-        self.base_axioms: List[str] = []
-        self.problem_clauses: List[str] = []
-        self.goal_clauses: List[str] = [] # Podría ser una sola, pero lo dejamos como lista por flexibilidad
-    
+        self._clausulas: Dict[str, Dict[str, None]] = {categoria: {} for categoria in CATEGORIAS}
+        # Cambios de la última llamada a `update`, por categoría
+        self.ultimo_diff: Dict[str, DiffClausulas] = {}
+        self.version = 0
+        self.indice = IndicePredicados()
+
+    @property
+    def base_axioms(self) -> List[str]:
+        return list(self._clausulas["base_axiom"])
+
+    @property
+    def problem_clauses(self) -> List[str]:
+        return list(self._clausulas["problem_clause"])
+
+    @property
+    def goal_clauses(self) -> List[str]: # Podría ser una sola, pero lo dejamos como lista por flexibilidad
+        return list(self._clausulas["goal_clause"])
+
+    def __setstate__(self, estado):
+        # Los checkpoints anteriores guardan una lista por categoría
+        if "_clausulas" not in estado:
+            estado = {
+                "_clausulas": {
+                    "base_axiom": dict.fromkeys(estado.get("base_axioms", [])),
+                    "problem_clause": dict.fromkeys(estado.get("problem_clauses", [])),
+                    "goal_clause": dict.fromkeys(estado.get("goal_clauses", [])),
+                },
+                "ultimo_diff": {},
+                "version": 0,
+            }
+        self.__dict__.update(estado)
+        if "indice" not in estado:
+            self.indice = IndicePredicados()
+            for categoria in CATEGORIAS_PROGRAMA:
+                for clausula in self._clausulas[categoria]:
+                    self.indice.agregar(clausula)
+
     def _llm_kge_extract_problem_clauses(self, problem_description_nl: str, problem_reformulation: str) -> List[str]:
         """Extrae cláusulas (hechos y reglas) específicas del problema."""
         all_clauses = []
@@ -45,24 +92,34 @@ class KnowledgeRepresentationStore:
         return all_clauses, objective
 
     def update(self, problem_description: str, preview_response: str):
+        anteriores = {categoria: list(clausulas) for categoria, clausulas in self._clausulas.items()}
         self.clear_all()
         problem_clauses_extracted, objetive = self._llm_kge_extract_problem_clauses(problem_description, preview_response)
         for pc in problem_clauses_extracted:
             self.add_clause(pc, "problem_clause")
         self.add_clause(objetive, "goal_clause")
         print(f"MFSA: Cláusulas del Problema Extraídas: {len(problem_clauses_extracted)}")
+
+        self.ultimo_diff = {categoria: calcular_diff(anteriores[categoria], list(self._clausulas[categoria]))
+                            for categoria in CATEGORIAS}
+        self.version += 1
+        for categoria, diff in self.ultimo_diff.items():
+            if not diff.vacio:
+                print(f"MFSA: Cambios en {categoria}: {diff.resumen()}")
+        if not self.hay_cambios():
+            print("MFSA: Las cláusulas no cambiaron respecto a la versión anterior.")
         return problem_clauses_extracted, objetive
 
-    def _get_target_list_by_category(self, category: str) -> Optional[List[str]]:
-        """Helper interno para obtener la lista de cláusulas correcta por categoría."""
-        if category == "base_axiom":
-            return self.base_axioms
-        elif category == "problem_clause":
-            return self.problem_clauses
-        elif category == "goal_clause":
-            return self.goal_clauses
-        print(f"KR-Store Warning: Categoría desconocida '{category}' en _get_target_list_by_category.")
-        return None
+    def hay_cambios(self, categorias=CATEGORIAS) -> bool:
+        """Si la última llamada a `update` cambió alguna de las categorías."""
+        return any(not self.ultimo_diff[categoria].vacio for categoria in categorias if categoria in self.ultimo_diff)
+
+    def _get_target_list_by_category(self, category: str) -> Optional[Dict[str, None]]:
+        """Helper interno para obtener las cláusulas de una categoría (dict ordenado)."""
+        target = self._clausulas.get(category)
+        if target is None:
+            print(f"KR-Store Warning: Categoría desconocida '{category}' en _get_target_list_by_category.")
+        return target
 
     def add_clause(self, clause: str, category: str):
         """
@@ -77,12 +134,14 @@ class KnowledgeRepresentationStore:
             return
 
         if clause not in target_list: # Evitar duplicados exactos
-            target_list.append(clause)
+            target_list[clause] = None
+            if category in CATEGORIAS_PROGRAMA:
+                self.indice.agregar(clause)
         else:
             print(f"Info KR-Store: Cláusula duplicada no añadida a {category}: {clause}")
 
     def get_all_clauses(self) -> List[str]:
-        return self.base_axioms + self.problem_clauses + self.goal_clauses
+        return [clause for categoria in CATEGORIAS for clause in self._clausulas[categoria]]
 
     def get_clauses_by_category(self, category: str) -> List[str]:
         target_list = self._get_target_list_by_category(category)
@@ -96,41 +155,56 @@ class KnowledgeRepresentationStore:
         target_list = self._get_target_list_by_category(category)
         if target_list is None:
             return False
-        
-        initial_len = len(target_list)
-        # Es más seguro construir una nueva lista que modificarla mientras se itera
-        # o encontrar el índice y usar pop, pero str() puede no ser único si no se incluyen IDs/fuentes.
-        # Esta implementación simple busca por la representación de string exacta.
-        new_list = [c for c in target_list if str(c) != clause_str]
-        
-        if len(new_list) < initial_len:
-            if category == "base_axiom": self.base_axioms = new_list
-            elif category == "problem_clause": self.problem_clauses = new_list
-            elif category == "goal_clause": self.goal_clauses = new_list
-            return True
-        return False
+        # Las cláusulas no se repiten dentro de una categoría: basta con borrar la clave
+        if target_list.pop(clause_str, False) is not None:
+            return False
+        if category in CATEGORIAS_PROGRAMA:
+            self.indice.eliminar(clause_str)
+        return True
 
     def get_clause_by_string(self, clause_str: str, category: str) -> Optional[str]:
         """Obtiene la primera ocurrencia de una cláusula que coincida con el string en la categoría especificada."""
         target_list = self._get_target_list_by_category(category)
-        if target_list is not None:
-            for c_obj in target_list:
-                if str(c_obj) == clause_str:
-                    return c_obj
+        if target_list is not None and clause_str in target_list:
+            return clause_str
         return None
 
     def clear_category(self, category: str):
         target_list = self._get_target_list_by_category(category)
         if target_list is not None:
+            if category in CATEGORIAS_PROGRAMA:
+                for clausula in target_list:
+                    self.indice.eliminar(clausula)
             target_list.clear()
         else:
             # ValueError ya se maneja o se imprime warning en _get_target_list_by_category
             pass # No hacer nada si la categoría es inválida
     
     def clear_all(self):
-        self.base_axioms.clear()
-        self.problem_clauses.clear()
-        self.goal_clauses.clear()
+        for clausulas in self._clausulas.values():
+            clausulas.clear()
+        self.indice.vaciar()
+
+    def clausulas_de(self, functor: str, aridad: int) -> List[str]:
+        """Axiomas y cláusulas del problema que definen functor/aridad."""
+        return self.indice.clausulas_de(functor, aridad)
+
+    def clausulas_relevantes(self, consulta: Optional[str] = None, category: str = "problem_clause") -> List[str]:
+        """
+        Cláusulas de la categoría de las que depende la consulta (por defecto,
+        la primera cláusula objetivo), en su orden. Si no hay consulta o sus
+        dependencias no se conocen de antemano, devuelve la categoría entera.
+        """
+        clausulas = self.get_clauses_by_category(category)
+        if consulta is None:
+            objetivos = self.goal_clauses
+            if not objetivos:
+                return clausulas
+            consulta = objetivos[0]
+        relevantes = self.indice.recorte(clausulas, consulta)
+        if len(relevantes) < len(clausulas):
+            print(f"MFSA: {len(clausulas) - len(relevantes)} de {len(clausulas)} cláusulas no intervienen en la consulta {consulta}")
+        return relevantes
 
     def __str__(self):
         return (f"KR-Store:\n"
@@ -0,0 +1,192 @@
+"""
+Almacén compacto de las ramas de pensamiento.
+
+Los nodos de todas las ramas se guardan en arrays paralelos en lugar de un
+objeto `Clausula` por nodo. Un subárbol compartido por varias ramas (copia en
+escritura de `ConstructorArbolSLD`) aparece una sola vez; por eso los hijos se
+guardan como rangos de una lista de índices (`inicio_hijos`/`hijos`) y no con
+enlaces primer-hijo/siguiente-hermano: un nodo compartido tiene hermanos
+distintos en cada rama.
+
+`ClausulaCompacta` es una vista de solo lectura con la interfaz de `Clausula`
+(`nombre`, `veracidad`, `valor`, `profundidad`, `padre`, `to_dict`), que es lo
+que recorren MMRC, la visualización y la caché.
+"""
+from array import array
+from typing import Dict, List
+
+from misa_j.cfcs import Clausula, EstadisticasSubarbol, ramas_a_tabla
+
+ESTADOS = ("", "verde", "rojo")
+_CODIGO_ESTADO = {estado: codigo for codigo, estado in enumerate(ESTADOS)}
+
+
+class ArbolCompacto:
+    """
+    Nodos en arrays paralelos, en post-orden (los hijos antes que el padre),
+    con el mismo orden que la tabla de `ramas_a_tabla`. Los nombres de las
+    metas se guardan una sola vez (`nombres`) y cada nodo tiene su índice.
+    """
+
+    def __init__(self):
+        self.nombres: List[str] = []
+        self.id_nombre = array('i')
+        self.estado = array('b')
+        self.profundidad = array('i')
+        self.padre = array('i')  # -1 en las raíces
+        # Los hijos del nodo i son hijos[inicio_hijos[i]:inicio_hijos[i + 1]]
+        self.inicio_hijos = array('i', [0])
+        self.hijos = array('i')
+        self.ramas = array('i')
+        self._estadisticas = None
+        self._vistas: Dict[int, "ClausulaCompacta"] = {}
+
+    @classmethod
+    def desde_tabla(cls, tabla: dict) -> "ArbolCompacto":
+        """Construye el árbol a partir de la tabla de `ramas_a_tabla` (p. ej. la de la caché)."""
+        arbol = cls()
+        arbol.nombres = list(tabla["nombres"])
+        for indice_nombre, veracidad, hijos in tabla["nodos"]:
+            indice = len(arbol.id_nombre)
+            arbol.id_nombre.append(indice_nombre)
+            arbol.estado.append(_CODIGO_ESTADO.get(veracidad, 0))
+            arbol.padre.append(-1)
+            arbol.profundidad.append(0)
+            for hijo in hijos:
+                # Un subárbol compartido conserva como padre el de la primera rama
+                if arbol.padre[hijo] < 0:
+                    arbol.padre[hijo] = indice
+            arbol.hijos.extend(hijos)
+            arbol.inicio_hijos.append(len(arbol.hijos))
+        arbol.ramas = array('i', tabla["ramas"])
+
+        # Los padres van después de sus hijos: recorriendo al revés cada padre
+        # ya tiene su profundidad cuando se visitan sus hijos
+        for indice in range(len(arbol.id_nombre) - 1, -1, -1):
+            for hijo in arbol._hijos_de(indice):
+                if arbol.padre[hijo] == indice:
+                    arbol.profundidad[hijo] = arbol.profundidad[indice] + 1
+        return arbol
+
+    @classmethod
+    def desde_ramas(cls, ramas: List[Clausula]) -> "ArbolCompacto":
+        return cls.desde_tabla(ramas_a_tabla(ramas))
+
+    def a_tabla(self) -> dict:
+        """Tabla equivalente a `ramas_a_tabla` de las mismas ramas."""
+        return {
+            "nombres": list(self.nombres),
+            "nodos": [[self.id_nombre[i], ESTADOS[self.estado[i]], list(self._hijos_de(i))]
+                      for i in range(len(self))],
+            "ramas": list(self.ramas),
+        }
+
+    def __len__(self):
+        return len(self.id_nombre)
+
+    def _hijos_de(self, indice: int) -> array:
+        return self.hijos[self.inicio_hijos[indice]:self.inicio_hijos[indice + 1]]
+
+    def nodo(self, indice: int) -> "ClausulaCompacta":
+        """Vista del nodo; siempre la misma para un índice, así `is` refleja la compartición."""
+        vista = self._vistas.get(indice)
+        if vista is None:
+            vista = self._vistas[indice] = ClausulaCompacta(self, indice)
+        return vista
+
+    def vistas_ramas(self) -> List["ClausulaCompacta"]:
+        """Raíces de las ramas de pensamiento, en su orden original."""
+        return [self.nodo(indice) for indice in self.ramas]
+
+    def estadisticas(self, indice: int) -> EstadisticasSubarbol:
+        """`estadisticas_subarbol` de un nodo; todas se calculan en una pasada lineal."""
+        if self._estadisticas is None:
+            self._calcular_estadisticas()
+        profundidad, verdes, rojos, nodos = self._estadisticas
+        return EstadisticasSubarbol(profundidad[indice], verdes[indice], rojos[indice], nodos[indice])
+
+    def _calcular_estadisticas(self):
+        total = len(self)
+        profundidad, verdes, rojos, nodos = (array('i', bytes(4 * total)) for _ in range(4))
+        # Post-orden: los hijos de cada nodo ya están calculados
+        for indice in range(total):
+            max_profundidad, n_verdes, n_rojos, n_nodos = 0, 0, 0, 1
+            for hijo in self._hijos_de(indice):
+                max_profundidad = max(max_profundidad, profundidad[hijo])
+                n_verdes += verdes[hijo]
+                n_rojos += rojos[hijo]
+                n_nodos += nodos[hijo]
+            estado = ESTADOS[self.estado[indice]]
+            profundidad[indice] = max_profundidad + 1
+            verdes[indice] = n_verdes + (estado == "verde")
+            rojos[indice] = n_rojos + (estado == "rojo")
+            nodos[indice] = n_nodos
+        self._estadisticas = (profundidad, verdes, rojos, nodos)
+
+    def a_dict(self, indice: int) -> dict:
+        """Lo mismo que `Clausula.to_dict()` del nodo, sin recursión ni vistas."""
+        resultado = {}
+        pila = [(indice, resultado)]
+        while pila:
+            actual, salida = pila.pop()
+            salida["nombre"] = self.nombres[self.id_nombre[actual]]
+            salida["veracidad"] = ESTADOS[self.estado[actual]]
+            hijos = self._hijos_de(actual)
+            if hijos:
+                salida["valor"] = [{} for _ in hijos]
+                pila.extend(zip(hijos, salida["valor"]))
+        return resultado
+
+    def memoria(self) -> int:
+        """Bytes ocupados por los arrays de nodos (sin contar los nombres)."""
+        return sum(a.itemsize * len(a) for a in (self.id_nombre, self.estado, self.profundidad, self.padre,
+                                                   self.inicio_hijos, self.hijos, self.ramas))
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        # Las vistas y las estadísticas se reconstruyen al usarse
+        estado["_vistas"] = {}
+        estado["_estadisticas"] = None
+        return estado
+
+
+class ClausulaCompacta(Clausula):
+    """Vista de solo lectura de un nodo de `ArbolCompacto` con la interfaz de `Clausula`."""
+
+    __slots__ = ("_arbol", "_indice")
+
+    def __init__(self, arbol: ArbolCompacto, indice: int):
+        self._arbol = arbol
+        self._indice = indice
+
+    @property
+    def nombre(self) -> str:
+        return self._arbol.nombres[self._arbol.id_nombre[self._indice]]
+
+    @property
+    def veracidad(self) -> str:
+        return ESTADOS[self._arbol.estado[self._indice]]
+
+    @property
+    def profundidad(self) -> int:
+        return self._arbol.profundidad[self._indice]
+
+    @property
+    def padre(self):
+        padre = self._arbol.padre[self._indice]
+        return self._arbol.nodo(padre) if padre >= 0 else None
+
+    @property
+    def valor(self) -> List["ClausulaCompacta"]:
+        return [self._arbol.nodo(hijo) for hijo in self._arbol._hijos_de(self._indice)]
+
+    @property
+    def _stats(self) -> EstadisticasSubarbol:
+        return self._arbol.estadisticas(self._indice)
+
+    def to_dict(self):
+        return self._arbol.a_dict(self._indice)
+
+    def __reduce__(self):
+        # Al cargar se recupera la vista única del árbol para ese índice
+        return (ArbolCompacto.nodo, (self._arbol, self._indice))
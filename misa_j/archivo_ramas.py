@@ -0,0 +1,363 @@
+"""
+Formato de archivo versionado para los resultados de MISA-J (checkpoints
+`misa_j_trace_cycle{n}`).
+
+Con pickle el checkpoint guarda cada `Clausula` con sus punteros al padre y
+depende de la disposición de las clases; para leer una rama hay que
+deserializarlo todo. Este formato guarda:
+
+    MAGIA "MJRA" | versión (uint16) | longitud de la cabecera (uint32)
+    cabecera: JSON comprimido con el resto del resultado (status, resultados,
+              errors, diagnosticos...) y, por rama, su segmento, su raíz,
+              sus estadísticas (`EstadisticasSubarbol`) y si es exitosa
+    segmentos: uno por rama, comprimido por separado
+
+Los nodos forman una tabla plana global, como la de `ramas_a_tabla` (post-
+orden, hijos antes que el padre, subárboles compartidos una sola vez). El
+segmento de cada rama solo tiene los nodos y nombres que aparecen por
+primera vez en ella (el delta respecto a las anteriores); los hijos se
+refieren a índices globales, que pueden estar en segmentos anteriores. Para
+que el acceso a una rama tardía no dependa de todas las anteriores, una rama
+que necesitaría más de `LIMITE_SEGMENTOS` segmentos se guarda completa (un
+fotograma clave) y la cabecera indica qué segmentos necesita cada rama.
+
+`ArchivoRamas.resultado()` devuelve el resultado con `RamasArchivadas`: una
+secuencia que descomprime cada rama al acceder a ella. MMRC elige las ramas
+exitosas y las más prometedoras con los datos de la cabecera, sin
+deserializar las demás.
+
+`solve` escribe el mismo formato en `solutions/ramas_de_pensamiento.ramas`.
+`abrir` lo proyecta en memoria (mmap): solo se leen del disco la cabecera y
+los segmentos de las ramas o subárboles a los que se accede. El JSON de
+antes se genera solo cuando se pide:
+
+    python -m misa_j.archivo_ramas solutions/ramas_de_pensamiento.ramas
+    python -m misa_j.archivo_ramas solutions/ramas_de_pensamiento.ramas --json ramas.json [--rama 3 ...]
+
+El primero lista las ramas con sus estadísticas; el segundo exporta todas
+(o las indicadas) en el formato de `Clausula.to_dict`.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from bisect import bisect_right
+from collections.abc import Sequence
+from typing import Any, Dict, List, Optional, Set
+
+from misa_j.captura import rama_exitosa
+from misa_j.cfcs import Clausula, EstadisticasSubarbol, estadisticas_subarbol
+
+MAGIA = b"MJRA"
+VERSION = 1
+EXTENSION = ".ramas"
+LIMITE_SEGMENTOS = 8  # segmentos que puede necesitar descomprimir el acceso a una rama
+_PREAMBULO = struct.Struct(">4sHI")
+ESTADOS = ("", "verde", "rojo")
+_CODIGO_ESTADO = {estado: codigo for codigo, estado in enumerate(ESTADOS)}
+
+
+def _comprimir(valor: Any) -> bytes:
+    return zlib.compress(json.dumps(valor, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _descomprimir(datos: bytes) -> Any:
+    return json.loads(zlib.decompress(datos).decode("utf-8"))
+
+
+def es_archivo_ramas(datos: bytes) -> bool:
+    return datos[:len(MAGIA)] == MAGIA
+
+
+def es_resultado_con_ramas(valor: Any) -> bool:
+    """Si `valor` tiene la forma del resultado de `PrologSolver.solve`."""
+    return isinstance(valor, dict) and "ramas" in valor and all(hasattr(rama, "valor") for rama in valor["ramas"])
+
+
+def _emitir(raiz, indices: Dict[int, int], nombres: Dict[str, int], primer_nodo: int, primer_nombre: int):
+    """
+    Filas (post-orden) de los nodos de `raiz` que no están en `indices` (id ->
+    índice global), numeradas desde `primer_nodo`, y nombres que no están en
+    `nombres`, numerados desde `primer_nombre`. Devuelve las filas, los
+    índices y nombres nuevos, el índice de la raíz y los índices de nodos y
+    nombres anteriores a los que se refieren las filas.
+    """
+    nuevos: Dict[int, int] = {}
+    nuevos_nombres: Dict[str, int] = {}
+    filas = []
+    nodos_previos, nombres_previos = set(), set()
+
+    def indice(nodo) -> int:
+        if id(nodo) in nuevos:
+            return nuevos[id(nodo)]
+        nodos_previos.add(indices[id(nodo)])
+        return indices[id(nodo)]
+
+    pila = [(raiz, False)]
+    while pila:
+        nodo, hijos_listos = pila.pop()
+        if id(nodo) in nuevos or id(nodo) in indices:
+            continue
+        if not hijos_listos:
+            pila.append((nodo, True))
+            pila.extend((hijo, False) for hijo in reversed(nodo.valor)
+                        if id(hijo) not in nuevos and id(hijo) not in indices)
+            continue
+        nuevos[id(nodo)] = primer_nodo + len(filas)
+        if nodo.nombre in nuevos_nombres:
+            indice_nombre = nuevos_nombres[nodo.nombre]
+        elif nodo.nombre in nombres:
+            indice_nombre = nombres[nodo.nombre]
+            nombres_previos.add(indice_nombre)
+        else:
+            indice_nombre = nuevos_nombres[nodo.nombre] = primer_nombre + len(nuevos_nombres)
+        estado = _CODIGO_ESTADO.get(nodo.veracidad)
+        if estado is None:
+            raise ValueError(f"veracidad {nodo.veracidad!r} de `{nodo.nombre}` fuera de {ESTADOS}")
+        filas.append([indice_nombre, estado, [indice(hijo) for hijo in nodo.valor]])
+    return filas, nuevos, nuevos_nombres, indice(raiz), nodos_previos, nombres_previos
+
+
+def archivar_resultado(resultado: Dict[str, Any]) -> bytes:
+    """
+    Serializa el resultado de `solve` en este formato. Lanza TypeError si el
+    resto del resultado no se puede escribir como JSON y ValueError si un
+    nodo tiene una veracidad que no está en `ESTADOS`.
+
+    Una rama que necesitaría leer más de `LIMITE_SEGMENTOS` segmentos se
+    guarda completa en el suyo (con sus propios nodos y nombres), y las ramas
+    siguientes se refieren a esa copia: así el acceso a cualquier rama
+    descomprime como mucho `LIMITE_SEGMENTOS` segmentos.
+    """
+    indices: Dict[int, int] = {}
+    nombres: Dict[str, int] = {}
+    primeros_nodos: List[int] = []
+    primeros_nombres: List[int] = []
+    dependencias: List[Set[int]] = []  # segmentos que hay que leer para construir los nodos de cada segmento
+    total_nodos = total_nombres = 0
+    segmentos: List[bytes] = []
+    ramas = []
+    desplazamiento = 0
+    for numero, raiz in enumerate(resultado["ramas"]):
+        filas, nuevos, nuevos_nombres, indice_raiz, nodos_previos, nombres_previos = \
+            _emitir(raiz, indices, nombres, total_nodos, total_nombres)
+        necesarios = {numero}
+        for nodo in nodos_previos:
+            necesarios |= dependencias[bisect_right(primeros_nodos, nodo) - 1]
+        necesarios.update(bisect_right(primeros_nombres, nombre) - 1 for nombre in nombres_previos)
+        if len(necesarios) > LIMITE_SEGMENTOS:
+            filas, nuevos, nuevos_nombres, indice_raiz, _, _ = _emitir(raiz, {}, {}, total_nodos, total_nombres)
+            necesarios = {numero}
+        primeros_nodos.append(total_nodos)
+        primeros_nombres.append(total_nombres)
+        dependencias.append(necesarios)
+        indices.update(nuevos)
+        nombres.update(nuevos_nombres)
+        total_nodos += len(filas)
+        total_nombres += len(nuevos_nombres)
+
+        segmento = _comprimir({"nombres": list(nuevos_nombres), "nodos": filas})
+        segmentos.append(segmento)
+        stats = estadisticas_subarbol(raiz)
+        ramas.append({"inicio": desplazamiento, "longitud": len(segmento), "primer_nodo": primeros_nodos[-1],
+                      "primer_nombre": primeros_nombres[-1], "raiz": indice_raiz, "segmentos": sorted(necesarios),
+                      "stats": list(stats), "exitosa": rama_exitosa(raiz)})
+        desplazamiento += len(segmento)
+    cabecera = _comprimir({"resultado": {clave: valor for clave, valor in resultado.items() if clave != "ramas"},
+                           "ramas": ramas})
+    return b"".join([_PREAMBULO.pack(MAGIA, VERSION, len(cabecera)), cabecera] + segmentos)
+
+
+def escribir_archivo(ruta: str, resultado: Dict[str, Any]):
+    """Escribe `archivar_resultado(resultado)` en `ruta` de forma atómica."""
+    datos = archivar_resultado(resultado)
+    directorio = os.path.dirname(ruta) or "."
+    os.makedirs(directorio, exist_ok=True)
+    temporal = tempfile.NamedTemporaryFile(dir=directorio, suffix=".tmp", delete=False)
+    try:
+        with temporal:
+            temporal.write(datos)
+        os.replace(temporal.name, ruta)
+    except Exception:
+        if os.path.exists(temporal.name):
+            os.remove(temporal.name)
+        raise
+
+
+def abrir(ruta: str) -> "ArchivoRamas":
+    """`ArchivoRamas` sobre el fichero proyectado en memoria (de solo lectura)."""
+    with open(ruta, "rb") as f:
+        # El mmap sigue válido después de cerrar el fichero
+        return ArchivoRamas(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class ArchivoRamas:
+    """Lectura perezosa de un archivo de `archivar_resultado` (bytes o mmap)."""
+
+    def __init__(self, datos):
+        magia, version, longitud = _PREAMBULO.unpack_from(datos)
+        if magia != MAGIA:
+            raise ValueError("no es un archivo de ramas de MISA-J")
+        if version != VERSION:
+            raise ValueError(f"versión {version} del archivo de ramas no soportada (se espera {VERSION})")
+        self.datos = datos
+        cabecera = _descomprimir(datos[_PREAMBULO.size:_PREAMBULO.size + longitud])
+        self._base = _PREAMBULO.size + longitud
+        self._resultado = cabecera["resultado"]
+        self._ramas = cabecera["ramas"]
+        self._primeros_nodos = [rama["primer_nodo"] for rama in self._ramas]
+        self._primeros_nombres = [rama["primer_nombre"] for rama in self._ramas]
+        self._segmentos: Dict[int, dict] = {}
+        self._clausulas: Dict[int, Clausula] = {}
+
+    def __reduce__(self):
+        return (ArchivoRamas, (bytes(self.datos),))
+
+    def __len__(self):
+        return len(self._ramas)
+
+    def resultado(self) -> Dict[str, Any]:
+        """El resultado de `solve`, con las ramas como `RamasArchivadas` ([] si no hay ninguna)."""
+        return dict(self._resultado, ramas=RamasArchivadas(self) if self._ramas else [])
+
+    def estadisticas(self, indice: int) -> EstadisticasSubarbol:
+        return EstadisticasSubarbol(*self._ramas[indice]["stats"])
+
+    def exitosa(self, indice: int) -> bool:
+        return self._ramas[indice]["exitosa"]
+
+    def segmentos(self, indice: int) -> Optional[List[int]]:
+        """Segmentos que descomprime el acceso a la rama `indice` (None en archivos que no lo guardan)."""
+        return self._ramas[indice].get("segmentos")
+
+    def _segmento(self, indice: int) -> dict:
+        if indice not in self._segmentos:
+            rama = self._ramas[indice]
+            inicio = self._base + rama["inicio"]
+            self._segmentos[indice] = _descomprimir(self.datos[inicio:inicio + rama["longitud"]])
+        return self._segmentos[indice]
+
+    def _fila(self, nodo: int) -> list:
+        segmento = bisect_right(self._primeros_nodos, nodo) - 1
+        return self._segmento(segmento)["nodos"][nodo - self._primeros_nodos[segmento]]
+
+    def _nombre(self, indice: int) -> str:
+        segmento = bisect_right(self._primeros_nombres, indice) - 1
+        return self._segmento(segmento)["nombres"][indice - self._primeros_nombres[segmento]]
+
+    def _construir(self, raiz: int) -> Clausula:
+        """
+        Nodo `raiz` de la tabla como árbol de `Clausula`. Solo se descomprimen
+        los segmentos que contienen sus nodos; los subárboles ya cargados son
+        los mismos objetos.
+        """
+        pila = [(raiz, False)]
+        while pila:
+            nodo, hijos_listos = pila.pop()
+            if nodo in self._clausulas:
+                continue
+            indice_nombre, estado, hijos = self._fila(nodo)
+            if not hijos_listos:
+                pila.append((nodo, True))
+                pila.extend((hijo, False) for hijo in hijos if hijo not in self._clausulas)
+                continue
+            clausula = Clausula(self._nombre(indice_nombre), [self._clausulas[hijo] for hijo in hijos], ESTADOS[estado])
+            for hijo in clausula.valor:
+                # Un subárbol compartido conserva como padre el de la primera rama
+                if hijo.padre is None:
+                    hijo.padre = clausula
+            self._clausulas[nodo] = clausula
+        resultado = self._clausulas[raiz]
+        if resultado.padre is None:
+            # Profundidades desde la raíz, solo en los nodos que cuelgan de ella
+            pila = [resultado]
+            while pila:
+                nodo = pila.pop()
+                for hijo in nodo.valor:
+                    if hijo.padre is nodo:
+                        hijo.profundidad = nodo.profundidad + 1
+                        pila.append(hijo)
+        return resultado
+
+    def rama(self, indice: int) -> Clausula:
+        """Rama `indice` como árbol de `Clausula`, con las estadísticas de la cabecera."""
+        resultado = self._construir(self._ramas[indice]["raiz"])
+        resultado._stats = self.estadisticas(indice)
+        return resultado
+
+    def subarbol(self, indice: int, ruta: List[int]) -> Clausula:
+        """
+        Subárbol de la rama `indice` al que se llega desde su raíz bajando por
+        los hijos de las posiciones de `ruta` (p. ej. [0, 2]: tercer hijo del
+        primer hijo). Solo se construyen los nodos de ese subárbol.
+        """
+        nodo = self._ramas[indice]["raiz"]
+        for posicion in ruta:
+            hijos = self._fila(nodo)[2]
+            if not 0 <= posicion < len(hijos):
+                raise IndexError(f"la rama {indice} no tiene el nodo {list(ruta)}")
+            nodo = hijos[posicion]
+        return self._construir(nodo)
+
+    def exportar_json(self, ruta: str, indices: Optional[List[int]] = None):
+        """Escribe las ramas `indices` (todas por defecto) como el antiguo ramas_de_pensamiento.json."""
+        indices = range(len(self)) if indices is None else indices
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump([self.rama(i).to_dict() for i in indices], f, indent=2, ensure_ascii=False)
+
+
+class RamasArchivadas(Sequence):
+    """Secuencia de las ramas de un `ArchivoRamas` que las deserializa al acceder a cada una."""
+
+    def __init__(self, archivo: ArchivoRamas):
+        self.archivo = archivo
+
+    def __reduce__(self):
+        return (RamasArchivadas, (self.archivo,))
+
+    def __len__(self):
+        return len(self.archivo)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self.archivo.rama(i) for i in range(*indice.indices(len(self)))]
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError(indice)
+        return self.archivo.rama(indice)
+
+    def estadisticas(self, indice: int) -> EstadisticasSubarbol:
+        return self.archivo.estadisticas(indice)
+
+    def exitosa(self, indice: int) -> bool:
+        return self.archivo.exitosa(indice)
+
+
+def leer_resultado(datos: bytes) -> Optional[Dict[str, Any]]:
+    """Resultado de un archivo de ramas, o None si `datos` no lo es."""
+    if not es_archivo_ramas(datos):
+        return None
+    return ArchivoRamas(datos).resultado()
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    if not argumentos:
+        print("Uso: python -m misa_j.archivo_ramas ARCHIVO [--json SALIDA [--rama N ...]]")
+        sys.exit(1)
+    archivo = abrir(argumentos[0])
+    if "--json" in argumentos:
+        salida = argumentos[argumentos.index("--json") + 1]
+        seleccion = [int(argumentos[i + 1]) for i, argumento in enumerate(argumentos) if argumento == "--rama"]
+        archivo.exportar_json(salida, seleccion or None)
+        print(f"INFO: {len(seleccion) or len(archivo)} ramas exportadas a {salida}")
+    else:
+        print(f"{archivo.resultado().get('status', '')}: {len(archivo)} ramas")
+        for i in range(len(archivo)):
+            stats = archivo.estadisticas(i)
+            print(f"{i:5}  {'✓' if archivo.exitosa(i) else '✗'}  profundidad={stats.profundidad} "
+                  f"verdes={stats.verdes} rojos={stats.rojos} nodos={stats.nodos}")
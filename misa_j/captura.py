@@ -0,0 +1,202 @@
+"""
+Políticas de captura de la traza de Prolog.
+
+Una traza completa registra cada puerto de cada meta, incluidas las internas
+de las bibliotecas (`lists:member_/3`...), y en los problemas combinatorios
+crece hasta cientos de MB aunque MMRC solo analice unas pocas ramas. La
+política se aplica en el propio hook `prolog_trace_interception`, antes de
+escribir nada, de modo que el volumen de la traza y el coste de procesarla en
+Python dependen de lo que se conserva:
+
+- `max_eventos`: al escribir tantos eventos el hook deja de trazar (`nodebug`);
+  la consulta sigue hasta el final y sus resultados no cambian.
+- `max_profundidad`: las metas a esa profundidad (contada desde la meta de la
+  consulta) se trazan como una caja negra (`skip`): se ven su llamada y su
+  salida, no sus submetas.
+- `modulos_excluidos`: no se escriben los frames de esos módulos llamados desde
+  esos mismos módulos. La entrada a la biblioteca (`lists:member/2` llamado
+  desde el programa) y las metas del programa que la biblioteca vuelve a
+  llamar (`maplist/2`) se conservan.
+
+Además, `MuestreoFallos` conserva todas las ramas exitosas y solo una muestra
+uniforme (reservoir sampling) de `muestra_fallos` ramas fallidas.
+
+El hook escribe cada evento como texto (`call: meta @ fichero:línea [N/F/P]`)
+o, con la directiva de `directiva_formato("tramas")`, como una trama con el
+código del puerto, el nivel, los frames, la cláusula, la longitud de la meta
+y la meta escrita con `~q`, sin `~p` ni la consulta del fichero y la línea.
+"""
+import random
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+# Tramas de la traza en formato "tramas": una por línea, empiezan por RS y
+# separan sus campos con US (`~q` escapa los caracteres de control de la meta)
+MARCA_TRAMA = "\x1e"
+SEPARADOR_TRAMA = "\x1f"
+
+# Predicados del hook comunes al proceso por consulta y al pool. La política
+# la fija el propio programa con `PoliticaCaptura.directiva()`; con `none` se
+# escribe la traza completa, como siempre.
+CAPTURA_PROLOG = r"""
+:- nb_setval(misa_politica, none).
+:- nb_setval(misa_eventos, 0).
+:- nb_setval(misa_formato, texto).
+
+misa_accion(Port, Frame, Profundidad, Accion) :-
+    nb_getval(misa_politica, Politica),
+    (   Politica == none
+    ->  Accion = continue
+    ;   Politica = politica(MaxEventos, MaxProfundidad, Modulos),
+        nb_getval(misa_eventos, Eventos),
+        (   MaxEventos >= 0, Eventos >= MaxEventos
+        ->  Accion = nodebug
+        ;   MaxProfundidad >= 0, Profundidad > MaxProfundidad
+        ->  Accion = omitir
+        ;   misa_modulo(Frame, Modulo), memberchk(Modulo, Modulos),
+            prolog_frame_attribute(Frame, parent, Padre),
+            misa_modulo(Padre, ModuloPadre), memberchk(ModuloPadre, Modulos)
+        ->  Accion = omitir
+        ;   Eventos1 is Eventos + 1,
+            nb_setval(misa_eventos, Eventos1),
+            (   Port == call, MaxProfundidad >= 0, Profundidad >= MaxProfundidad
+            ->  Accion = skip
+            ;   Accion = continue
+            )
+        )
+    ).
+
+misa_modulo(Frame, Modulo) :-
+    prolog_frame_attribute(Frame, predicate_indicator, Indicador),
+    ( Indicador = Modulo:_ -> true ; Modulo = user ).
+
+misa_escribir_evento(Port, Frame, Lvl) :-
+    nb_getval(misa_formato, tramas),
+    !,
+    misa_escribir_trama(Port, Frame, Lvl).
+misa_escribir_evento(Port, Frame, Lvl) :-
+    Indent is Lvl * 2,
+    ( prolog_frame_attribute(Frame, parent, Parent) -> true ; Parent = none ),
+    prolog_frame_attribute(Frame, goal,  Goal),
+    ( prolog_frame_attribute(Frame, clause, ClRef),
+    clause_property(ClRef, file(File)),
+    clause_property(ClRef, line_count(Line))
+    -> true
+    ; File = '<dynamic>', Line = 0
+    ),
+    format(user_error, '~N~*|~w: ~p @ ~w:~d [~w/~w/~w]~n', [Indent, Port, Goal, File, Line, Lvl, Frame, Parent]).
+
+% Trama: RS puerto US alternativa US nivel US frame US padre US cláusula US longitud US meta
+misa_escribir_trama(Port, Frame, Lvl) :-
+    misa_codigo_puerto(Port, Codigo, Alternativa),
+    ( prolog_frame_attribute(Frame, parent, Parent) -> true ; Parent = none ),
+    ( prolog_frame_attribute(Frame, clause, ClRef) -> true ; ClRef = none ),
+    prolog_frame_attribute(Frame, goal, Goal),
+    format(string(Meta), '~q', [Goal]),
+    string_length(Meta, Longitud),
+    format(user_error, '~N\x1e\~w\x1f\~w\x1f\~w\x1f\~w\x1f\~w\x1f\~w\x1f\~d\x1f\~w~n',
+           [Codigo, Alternativa, Lvl, Frame, Parent, ClRef, Longitud, Meta]).
+
+misa_codigo_puerto(call, c, '') :- !.
+misa_codigo_puerto(exit, e, '') :- !.
+misa_codigo_puerto(fail, f, '') :- !.
+misa_codigo_puerto(redo(N), r, N) :- !.
+misa_codigo_puerto(redo, r, '') :- !.
+misa_codigo_puerto(_, '?', '').
+
+misa_registrar(Port, Frame, Lvl, Profundidad, Accion) :-
+    misa_accion(Port, Frame, Profundidad, Decision),
+    (   Decision == omitir
+    ->  Accion = continue
+    ;   Decision == nodebug
+    ->  Accion = nodebug
+    ;   misa_escribir_evento(Port, Frame, Lvl),
+        Accion = Decision
+    ).
+"""
+
+
+class PoliticaCaptura(NamedTuple):
+    """Límites de la captura de la traza; None (o vacío) es sin límite."""
+    max_eventos: Optional[int] = None
+    max_profundidad: Optional[int] = None
+    modulos_excluidos: Tuple[str, ...] = ()
+    muestra_fallos: Optional[int] = None
+
+    @classmethod
+    def desde_config(cls, config: dict) -> "PoliticaCaptura":
+        return cls(config.get("misa_j_captura_max_eventos"),
+                   config.get("misa_j_captura_max_profundidad"),
+                   tuple(config.get("misa_j_captura_excluir_modulos") or ()),
+                   config.get("misa_j_captura_muestra_fallos"))
+
+    @property
+    def filtra_traza(self) -> bool:
+        """Si el hook tiene que aplicar algún límite."""
+        return self.max_eventos is not None or self.max_profundidad is not None or bool(self.modulos_excluidos)
+
+    def directiva(self) -> str:
+        """Directiva que fija la política en el hook al cargar el programa ("" si no filtra)."""
+        if not self.filtra_traza:
+            return ""
+        modulos = ", ".join("'" + modulo.replace("'", "''") + "'" for modulo in self.modulos_excluidos)
+        max_eventos = self.max_eventos if self.max_eventos is not None else -1
+        max_profundidad = self.max_profundidad if self.max_profundidad is not None else -1
+        return (f":- nb_setval(misa_politica, politica({max_eventos}, {max_profundidad}, [{modulos}])), "
+                f"nb_setval(misa_eventos, 0).\n")
+
+
+def directiva_formato(formato: str) -> str:
+    """Directiva que elige el formato de los eventos del hook ("" para el texto de siempre)."""
+    return ":- nb_setval(misa_formato, tramas).\n" if formato == "tramas" else ""
+
+
+def rama_exitosa(rama: Any) -> bool:
+    """
+    Si la rama es exitosa: su primera meta (o la envuelta por `catch/3`) es
+    verde. Es el criterio de MMRC y el de la marca `exitosa` del archivo de ramas.
+    """
+    if not rama.valor:
+        return False
+    primero = rama.valor[0]
+    if "catch(" in primero.nombre:
+        return bool(primero.valor) and primero.valor[0].veracidad == "verde"
+    return primero.veracidad == "verde"
+
+
+class MuestreoFallos:
+    """
+    Conserva todas las ramas exitosas y una muestra uniforme de como mucho
+    `tamano` ramas fallidas (algoritmo R), sin retener las descartadas. Con
+    la misma semilla y la misma traza la muestra es siempre la misma, así que
+    se puede guardar en la caché.
+    """
+
+    def __init__(self, tamano: int, semilla: int = 0):
+        self.tamano = max(0, tamano)
+        self._azar = random.Random(semilla)
+        self._exitosas: List[Tuple[int, Any]] = []
+        self._fallidas: List[Tuple[int, Any]] = []
+        self.total = 0
+        self.fallidas_vistas = 0
+
+    def agregar(self, rama: Any):
+        indice = self.total
+        self.total += 1
+        if rama_exitosa(rama):
+            self._exitosas.append((indice, rama))
+            return
+        self.fallidas_vistas += 1
+        if len(self._fallidas) < self.tamano:
+            self._fallidas.append((indice, rama))
+            return
+        posicion = self._azar.randrange(self.fallidas_vistas)
+        if posicion < self.tamano:
+            self._fallidas[posicion] = (indice, rama)
+
+    @property
+    def descartadas(self) -> int:
+        return self.fallidas_vistas - len(self._fallidas)
+
+    def ramas(self) -> List[Any]:
+        """Ramas conservadas en su orden original."""
+        return [rama for _, rama in sorted(self._exitosas + self._fallidas, key=lambda par: par[0])]
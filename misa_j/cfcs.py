@@ -2,31 +2,56 @@ import os
 import tempfile
 import subprocess
 import re
-import copy
-from typing import List, Dict, Optional, Set, Tuple
+import heapq
+import hashlib
+import zlib
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple, NamedTuple, Iterable, Iterator
 import json
 from pathlib import Path
 from collections import deque
-from typing import List, Optional
+from misa_j.swipl_pool import PoolSwipl, ProcesoSwipl, PROGRAMA_TRABAJADOR
+from misa_j.captura import (CAPTURA_PROLOG, MARCA_TRAMA, SEPARADOR_TRAMA, MuestreoFallos, PoliticaCaptura,
+                             directiva_formato)
+from common.cache_disco import CacheDisco
+from misa_j.terminos import TablaSimbolos, clave_functor
+from misa_j.verificacion import hay_errores, verificar_programa
 
 class Clausula:
+    # Sin __dict__ por instancia: las trazas grandes generan millones de nodos
+    __slots__ = ("nombre", "valor", "veracidad", "profundidad", "padre", "_generacion", "_seq", "_stats")
+
     def __init__(self, nombre, valor=None, veracidad="", profundidad = 0, padre=None):
         self.nombre = nombre
         self.valor = valor if valor is not None else []  # array de Clausula
         self.veracidad = veracidad  # string
         self.profundidad = profundidad
         self.padre = padre  # Clausula
+        self._generacion = 0  # generación de copia en escritura (ConstructorArbolSLD)
+        self._seq = 0  # identidad lógica del nodo, compartida por sus copias
+        self._stats = None  # EstadisticasSubarbol, se calcula al congelar el nodo
 
     def __eq__(self, other):
         if not isinstance(other, Clausula):
             return False
-        self_nombre = self.nombre.split('(')[0].strip()
-        self_aridad = len(self.nombre.split('(')[1].split(',')) if '(' in self.nombre else 0
+        return (clave_functor(self.nombre) == clave_functor(other.nombre) and self.veracidad == other.veracidad
+                and len(self.valor) == len(other.valor))
+
+    def __getstate__(self):
+        return {atributo: getattr(self, atributo, None) for atributo in Clausula.__slots__}
 
-        # Extraer nombre y aridad del contenido
-        other_nombre = other.nombre.split('(')[0].strip()
-        other_aridad = len(other.nombre.split('(')[1].split(',')) if '(' in other.nombre else 0
-        return (self_nombre == other_nombre and self_aridad == other_aridad and self.veracidad == other.veracidad and len(self.valor) == len(other.valor))
+    def __setstate__(self, estado):
+        # También acepta los checkpoints guardados cuando Clausula tenía __dict__
+        if isinstance(estado, tuple):
+            estado = {**(estado[0] or {}), **(estado[1] or {})}
+        for atributo in Clausula.__slots__:
+            setattr(self, atributo, estado.get(atributo, 0 if atributo in ("_generacion", "_seq") else None))
+        if self.valor is None:
+            self.valor = []
+        if self.profundidad is None:
+            self.profundidad = 0
+        if self.veracidad is None:
+            self.veracidad = ""
 
     def to_dict(self):
         output_dict = {
@@ -69,38 +94,728 @@ class Clausula:
         return (f"Clausula(nombre='{self.nombre}', veracidad='{self.veracidad}', "
                 f"num_hijos={len(self.valor)}, padre='{padre_nombre}')")
 
+
+class EstadisticasSubarbol(NamedTuple):
+    profundidad: int  # niveles del subárbol, contando el propio nodo
+    verdes: int
+    rojos: int
+    nodos: int
+
+
+def estadisticas_subarbol(nodo: Clausula) -> EstadisticasSubarbol:
+    """
+    Profundidad, nodos verdes, rojos y total del subárbol de `nodo`, en
+    post-orden y sin recursión. El resultado se guarda en cada nodo: los
+    nodos de una rama congelada ya no cambian, así que un subárbol compartido
+    por varias ramas se calcula una sola vez.
+    """
+    if getattr(nodo, "_stats", None) is not None:
+        return nodo._stats
+    pila = [(nodo, False)]
+    while pila:
+        actual, hijos_listos = pila.pop()
+        if getattr(actual, "_stats", None) is not None:
+            continue
+        if not hijos_listos:
+            pila.append((actual, True))
+            pila.extend((hijo, False) for hijo in actual.valor if getattr(hijo, "_stats", None) is None)
+            continue
+        profundidad = verdes = rojos = 0
+        nodos = 1
+        for hijo in actual.valor:
+            stats_hijo = hijo._stats
+            profundidad = max(profundidad, stats_hijo.profundidad)
+            verdes += stats_hijo.verdes
+            rojos += stats_hijo.rojos
+            nodos += stats_hijo.nodos
+        actual._stats = EstadisticasSubarbol(profundidad + 1,
+                                             verdes + (actual.veracidad == "verde"),
+                                             rojos + (actual.veracidad == "rojo"),
+                                             nodos)
+    return nodo._stats
+
+
+def ramas_a_tabla(ramas: List[Clausula]) -> dict:
+    """
+    Convierte las ramas en una tabla plana de nodos en la que cada subárbol
+    compartido entre ramas aparece una sola vez. Los hijos de un nodo siempre
+    están antes que él en la tabla.
+    """
+    nombres: Dict[str, int] = {}
+    nodos = []
+    indices: Dict[int, int] = {}
+    raices = []
+    for raiz in ramas:
+        pila = [(raiz, False)]
+        while pila:
+            nodo, hijos_listos = pila.pop()
+            if id(nodo) in indices:
+                continue
+            if not hijos_listos:
+                pila.append((nodo, True))
+                pila.extend((hijo, False) for hijo in reversed(nodo.valor) if id(hijo) not in indices)
+                continue
+            indices[id(nodo)] = len(nodos)
+            indice_nombre = nombres.setdefault(nodo.nombre, len(nombres))
+            nodos.append([indice_nombre, nodo.veracidad, [indices[id(hijo)] for hijo in nodo.valor]])
+        raices.append(indices[id(raiz)])
+    return {"nombres": list(nombres), "nodos": nodos, "ramas": raices}
+
+
+def ramas_de_tabla(tabla: dict) -> List[Clausula]:
+    """Reconstruye las ramas de `ramas_a_tabla`, compartiendo de nuevo los subárboles."""
+    nombres = tabla["nombres"]
+    nodos: List[Clausula] = []
+    for indice_nombre, veracidad, hijos in tabla["nodos"]:
+        nodo = Clausula(nombres[indice_nombre], [nodos[h] for h in hijos], veracidad)
+        for hijo in nodo.valor:
+            # Un subárbol compartido conserva como padre el de la primera rama
+            if hijo.padre is None:
+                hijo.padre = nodo
+        nodos.append(nodo)
+    ramas = [nodos[i] for i in tabla["ramas"]]
+
+    pila = list(ramas)
+    while pila:
+        nodo = pila.pop()
+        for hijo in nodo.valor:
+            if hijo.padre is nodo:
+                hijo.profundidad = nodo.profundidad + 1
+                pila.append(hijo)
+    return ramas
+
+
+class EventoTraza(NamedTuple):
+    """Un evento de puerto de la traza de Prolog."""
+    puerto: str                        # call | exit | fail | redo
+    meta: str                          # texto de la meta
+    nivel: Optional[int] = None        # nivel del frame en la pila de Prolog
+    frame: Optional[int] = None        # referencia del frame
+    padre: Optional[int] = None        # referencia del frame padre
+    alternativa: Optional[int] = None  # N de redo(N)
+
+
+# Regex para parsear: Tipo, Contenido (se ignora todo lo que sigue a '@')
+_LINEA_TRAZA = re.compile(r'^\s*(call|exit|fail|redo)(?:\(\d+\))?:\s*([^@]+?)\s*(?:@.*)?$')
+
+# Igual que la anterior pero conserva la sangría, la alternativa de redo(N) y
+# el sufijo [Nivel/Frame/FramePadre] que escribe el hook de la traza
+_LINEA_TRAZA_NIVEL = re.compile(
+    r'^(?P<sangria>\s*)(?P<puerto>call|exit|fail|redo)(?:\((?P<alternativa>\d+)\))?:\s*(?P<meta>[^@]+?)\s*'
+    r'(?:@\s*[^\[]*?)?\s*(?:\[(?P<nivel>\d+)/(?P<frame>\d+)/(?P<padre>\d+|none)\])?\s*$'
+)
+
+
+def parsear_linea_traza(linea: str, con_nivel: bool = False) -> Optional[EventoTraza]:
+    """
+    Convierte una línea de la traza en un EventoTraza, o None si la línea no
+    es un evento de puerto. Con `con_nivel` se lee además el nivel (del sufijo
+    del hook o, en su defecto, de la sangría) y las referencias de frame.
+    """
+    if not con_nivel:
+        match = _LINEA_TRAZA.match(linea)
+        if not match:
+            return None
+        return EventoTraza(match.group(1), match.group(2).strip())
+
+    match = _LINEA_TRAZA_NIVEL.match(linea)
+    if not match:
+        return None
+    if match.group("nivel") is not None:
+        nivel = int(match.group("nivel"))
+        frame = int(match.group("frame"))
+        padre = int(match.group("padre")) if match.group("padre") != "none" else None
+    else:
+        nivel = len(match.group("sangria").expandtabs(2)) // 2
+        frame = padre = None
+    alternativa = match.group("alternativa")
+    return EventoTraza(match.group("puerto"), match.group("meta").strip(), nivel, frame, padre,
+                       int(alternativa) if alternativa is not None else None)
+
+
+_PUERTOS_TRAMA = {"c": "call", "e": "exit", "f": "fail", "r": "redo"}
+
+
+def parsear_trama(linea: str, con_nivel: bool = False) -> Optional[EventoTraza]:
+    """
+    Decodifica una trama del formato "tramas" del hook (ver `misa_j/captura.py`)
+    sin expresiones regulares: un solo `split` y la meta tal cual la escribió
+    Prolog. Devuelve None si la trama no es de un puerto call/exit/fail/redo
+    o si está incompleta (la longitud declarada de la meta no coincide).
+    """
+    campos = linea.split(SEPARADOR_TRAMA, 7)
+    if len(campos) != 8:
+        return None
+    codigo, alternativa, nivel, frame, padre, _clausula, longitud, meta = campos
+    puerto = _PUERTOS_TRAMA.get(codigo[1:])
+    if puerto is None or not longitud.isdigit() or int(longitud) != len(meta):
+        return None
+    if not con_nivel:
+        return EventoTraza(puerto, meta)
+    return EventoTraza(puerto, meta, int(nivel), int(frame), int(padre) if padre != "none" else None,
+                       int(alternativa) if alternativa else None)
+
+
+def _recortar_traza(lineas: Iterable[str]) -> Iterator[str]:
+    """
+    Emite las líneas de la traza de swipl sin la primera ni las seis últimas
+    (cabecera y cierre), igual que recortar la salida completa una vez
+    quitados los blancos de los extremos. Solo retiene las líneas que aún
+    podrían estar entre las seis últimas.
+    """
+    lineas = iter(lineas)
+    for linea in lineas:
+        if linea.strip():
+            break
+    retenidas = deque()
+    for linea in lineas:
+        linea = linea.rstrip('\n')
+        retenidas.append(linea)
+        # Los blancos finales no cuentan: solo se libera tras una línea con texto
+        if linea.strip():
+            while len(retenidas) > 6:
+                yield retenidas.popleft()
+
+
+# Las tramas se imprimen con sus separadores como espacios
+_TRAMA_LEGIBLE = str.maketrans({MARCA_TRAMA: None, SEPARADOR_TRAMA: " "})
+
+
+def _imprimir_lineas(lineas: Iterable[str]) -> Iterator[str]:
+    for linea in lineas:
+        print(linea.translate(_TRAMA_LEGIBLE) if linea.startswith(MARCA_TRAMA) else linea)
+        yield linea
+
+
+class ConstructorArbolSLD:
+    """
+    Construye el árbol SLD a partir de los eventos de la traza y genera las
+    ramas de pensamiento como instantáneas persistentes (copia en escritura).
+
+    Cada instantánea comparte con la anterior todos los subárboles que no
+    cambiaron: al modificar un nodo ya congelado por una instantánea se copia
+    únicamente ese nodo y la ruta hasta la raíz. En las instantáneas el
+    atributo `padre` puede apuntar a otra versión del mismo nodo lógico;
+    `to_dict()` y MMRC solo recorren `valor`, `nombre` y `veracidad`.
+
+    Para resolver los redo sin recorrer el árbol se mantiene un índice vivo
+    de los nodos conectados a la raíz, por texto completo de la meta y por
+    (functor, aridad). Los textos de las metas se internan en una
+    `TablaSimbolos`: los nodos con la misma meta comparten el str y cada
+    texto se analiza una sola vez, con (functor, aridad) reducido a un
+    entero. El índice por functor solo se usa para los redo que no aparecen
+    por su texto, así que se rellena al consultarlo. Como los nodos nuevos siempre cuelgan de la ruta más a
+    la derecha, el último nodo en orden BFS de una clave es el de mayor
+    (profundidad, orden de creación); cada clave guarda un heap con borrado
+    perezoso de los nodos truncados o renombrados.
+    """
+
+    def __init__(self):
+        self._generacion = 1
+        # Versión más reciente de cada nodo lógico, indexada por su _seq
+        self._nodos: List[Clausula] = []
+        self._conectado = bytearray()
+        self._por_nombre: Dict[str, List[Tuple[int, int]]] = {}
+        self._por_functor: Dict[int, List[Tuple[int, int]]] = {}
+        self._sin_functor: List[Tuple[str, Tuple[int, int]]] = []  # entradas aún no indexadas por functor
+        self.simbolos = TablaSimbolos()
+        self.raiz = self._nuevo_nodo("root", padre=None)
+        self.nodo_actual = self.raiz
+        self.ramas: List[Clausula] = []
+        # Evento redo a la espera del evento siguiente y nodo que rehace
+        self._redo_pendiente: Optional[EventoTraza] = None
+        self._seq_rehecho: Optional[int] = None
+
+    def _nuevo_nodo(self, nombre, veracidad="", padre=None):
+        profundidad = padre.profundidad + 1 if padre is not None else 0
+        nombre = self.simbolos.interna(nombre)
+        nodo = Clausula(nombre=nombre, veracidad=veracidad, profundidad=profundidad, padre=padre)
+        nodo._generacion = self._generacion
+        nodo._seq = len(self._nodos)
+        self._nodos.append(nodo)
+        self._conectado.append(padre is None or self._conectado[padre._seq])
+        self._indexar(nodo)
+        return nodo
+
+    def _indexar(self, nodo: Clausula):
+        if not self._conectado[nodo._seq]:
+            return
+        entrada = (-nodo.profundidad, -nodo._seq)
+        heapq.heappush(self._por_nombre.setdefault(nodo.nombre, []), entrada)
+        self._sin_functor.append((nodo.nombre, entrada))
+
+    def _ultimo_por_functor(self, meta: str) -> Optional[Clausula]:
+        """Último nodo conectado (en orden BFS) con el functor y la aridad de la meta."""
+        for nombre, entrada in self._sin_functor:
+            heapq.heappush(self._por_functor.setdefault(self.simbolos.clave(nombre), []), entrada)
+        self._sin_functor.clear()
+        return self._ultimo_en_bfs(self._por_functor, self.simbolos.clave(meta))
+
+    def _ultimo_en_bfs(self, indice, clave, nombre=None) -> Optional[Clausula]:
+        """Último nodo conectado (en orden BFS) registrado bajo la clave."""
+        heap = indice.get(clave)
+        while heap:
+            nodo = self._nodos[-heap[0][1]]
+            if self._conectado[nodo._seq] and (nombre is None or nodo.nombre == nombre):
+                return nodo
+            heapq.heappop(heap)
+        return None
+
+    def _desconectar(self, nodos: List[Clausula]):
+        """Saca del índice los subárboles truncados del árbol vivo."""
+        pila = list(nodos)
+        while pila:
+            nodo = pila.pop()
+            if not self._conectado[nodo._seq]:
+                continue
+            self._conectado[nodo._seq] = 0
+            pila.extend(nodo.valor)
+
+    def _vigente(self, nodo: Optional[Clausula]) -> Optional[Clausula]:
+        """Devuelve la versión más reciente de un nodo (o None)."""
+        if nodo is None:
+            return None
+        return self._nodos[nodo._seq]
+
+    def _escribible(self, nodo: Clausula) -> Clausula:
+        """
+        Devuelve una versión del nodo que puede modificarse sin alterar
+        ninguna instantánea, copiando la ruta congelada hasta la raíz.
+        """
+        nodo = self._vigente(nodo)
+        if nodo._generacion == self._generacion:
+            return nodo
+
+        # Subir mientras el nodo cuelgue (por identidad) de un padre congelado
+        ruta = [nodo]
+        while True:
+            actual = ruta[-1]
+            padre = self._vigente(actual.padre)
+            if padre is None or padre._generacion == self._generacion:
+                break
+            if not any(hijo is actual for hijo in padre.valor):
+                break
+            ruta.append(padre)
+
+        # Copiar de arriba hacia abajo reemplazando cada versión en su padre
+        padre = self._vigente(ruta[-1].padre)
+        for original in reversed(ruta):
+            copia = Clausula(nombre=original.nombre, valor=list(original.valor), veracidad=original.veracidad,
+                             profundidad=original.profundidad, padre=padre)
+            copia._generacion = self._generacion
+            copia._seq = original._seq
+            self._nodos[original._seq] = copia
+            if padre is None:
+                self.raiz = copia
+            else:
+                for i, hijo in enumerate(padre.valor):
+                    if hijo is original:
+                        padre.valor[i] = copia
+                        break
+            padre = copia
+        return padre
+
+    def instantanea(self):
+        """Congela el árbol actual como una nueva rama de pensamiento."""
+        self.ramas.append(self.raiz)
+        self._generacion += 1
+        # Solo se calculan los nodos nuevos o copiados desde la rama anterior
+        estadisticas_subarbol(self.raiz)
+
+    @property
+    def redo_pendiente(self) -> bool:
+        return self._redo_pendiente is not None
+
+    def procesar(self, evento: Optional[EventoTraza]):
+        """
+        Aplica un evento de la traza (None para una línea que no es un evento).
+        Un redo se completa al recibir el evento siguiente, que decide qué
+        hijos del nodo rehecho se conservan.
+        """
+        if self._redo_pendiente is not None:
+            self._redo_pendiente = None
+            if evento is None:
+                raise ValueError("La línea siguiente a un redo no es un evento de la traza.")
+            self._completar_redo(self._seq_rehecho, evento)
+        if evento is None:
+            return
+
+        if evento.puerto == "call":
+            # Si la linea es de tipo Call y el contenido es fail se salta
+            if evento.meta != "fail":
+                self._llamada(evento)
+        elif evento.puerto == "exit":
+            self._cerrar(evento, "verde")
+        elif evento.puerto == "fail":
+            if evento.meta != "fail":
+                self._cerrar(evento, "rojo")
+        elif evento.puerto == "redo":
+            self._seq_rehecho = self._iniciar_redo(evento)
+            self._redo_pendiente = evento
+
+    def _llamada(self, evento: EventoTraza) -> Clausula:
+        nodo = self._escribible(self.nodo_actual)
+        nueva_clausula = self._nuevo_nodo(evento.meta, padre=nodo)
+        nodo.valor.append(nueva_clausula)
+        self.nodo_actual = nueva_clausula
+        return nueva_clausula
+
+    def _cerrar(self, evento: EventoTraza, veracidad: str, nodo: Optional[Clausula] = None):
+        nodo = self._escribible(nodo if nodo is not None else self.nodo_actual)
+        # Si el array valor está vacío se agrega la cláusula resultado
+        if not nodo.valor:
+            nodo.valor.append(self._nuevo_nodo(evento.meta, veracidad=veracidad, padre=nodo))
+        nodo.veracidad = veracidad
+        if nodo.padre:
+            self.nodo_actual = self._vigente(nodo.padre)
+        else:
+            self.nodo_actual = nodo
+
+    def _guardar_rama_abandonada(self):
+        """Marca en rojo la ruta abandonada y guarda la rama."""
+        nodo = self._vigente(self.nodo_actual)
+        while nodo.padre:
+            nodo = self._escribible(nodo)
+            nodo.veracidad = "rojo"
+            nodo = self._vigente(nodo.padre)
+        self.nodo_actual = nodo
+        self.instantanea()
+
+    def _buscar_por_nombre(self, contenido_str: str) -> Clausula:
+        """
+        Nodo a rehacer: el último (en orden BFS) con el mismo texto o, si no
+        hay ninguno, el último con el mismo nombre y aridad, renombrado.
+        """
+        nodo = self._ultimo_en_bfs(self._por_nombre, contenido_str, nombre=contenido_str)
+        if nodo is None:
+            last_found = self._ultimo_por_functor(contenido_str)
+            nodo = self._escribible(last_found)
+            nodo.nombre = self.simbolos.interna(contenido_str)
+            self._indexar(nodo)
+        return nodo
+
+    def _iniciar_redo(self, evento: EventoTraza) -> int:
+        self._guardar_rama_abandonada()
+        return self._buscar_por_nombre(evento.meta)._seq
+
+    def _completar_redo(self, seq: int, siguiente: Optional[EventoTraza]):
+        """
+        Trunca el árbol en el nodo rehecho. `siguiente` es el evento de la
+        línea siguiente de la traza, o None si el redo era la última línea.
+        """
+        if siguiente is None:
+            return
+
+        nodo = self._escribible(self._nodos[seq])
+        if nodo.valor != []:
+            # Se conserva hasta el primer hijo atómico cuando la meta siguiente
+            # también es atómica; es lo que hacía la comparación original de
+            # nombre y aridad (por precedencia de operadores), y de ello
+            # dependen las ramas que se esperan de las trazas existentes
+            siguiente_atomica = '(' not in siguiente.meta
+            for index, clausula in enumerate(nodo.valor):
+                if siguiente_atomica and '(' not in clausula.nombre:
+                    self._desconectar(nodo.valor[index + 1:])
+                    nodo.valor = nodo.valor[:index + 1]
+                    break
+            else:
+                # Limpiar el array de valor del nodo encontrado
+                self._desconectar(nodo.valor)
+                nodo.valor = []
+        nodo.veracidad = ""  # Reiniciar su estado de veracidad
+        self.nodo_actual = nodo
+
+        # Truncar los hermanos posteriores en la ruta hasta la raíz
+        current = nodo
+        while current.padre:
+            padre = self._escribible(current.padre)
+            indice = 0
+            for son in padre.valor:
+                if son.nombre == current.nombre:
+                    break
+                indice += 1
+            self._desconectar(padre.valor[indice + 1:])
+            padre.valor = padre.valor[:indice + 1]
+            current = padre
+
+    def finalizar(self) -> List[Clausula]:
+        """Guarda la rama final y devuelve todas las ramas de pensamiento."""
+        if self._redo_pendiente is not None:
+            self._redo_pendiente = None
+            self._completar_redo(self._seq_rehecho, None)
+        self.instantanea()
+        self._nodos = []
+        self._por_nombre.clear()
+        self._por_functor.clear()
+        self._sin_functor.clear()
+        return self.ramas
+
+
+class ConstructorArbolPorNivel(ConstructorArbolSLD):
+    """
+    Variante que reconstruye el árbol a partir del nivel y las referencias de
+    frame que escribe el hook de la traza, en una sola pasada y sin buscar
+    nodos por nombre: el padre de cada llamada es su frame padre (o el último
+    frame abierto de nivel inferior) y el nodo de un exit/fail/redo es el de
+    su frame. Si una línea no trae nivel ni frame se recurre al índice por
+    nombre de ConstructorArbolSLD.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._marcos: Dict[int, int] = {}      # frame -> _seq
+        self._nivel_de: Dict[int, int] = {}    # _seq -> nivel en la traza
+        self._pila: List[int] = []             # _seq de los frames abiertos, por nivel creciente
+
+    def _conectado_seq(self, seq: Optional[int]) -> Optional[Clausula]:
+        if seq is None or not self._conectado[seq]:
+            return None
+        return self._nodos[seq]
+
+    def _nodo_de(self, evento: EventoTraza) -> Optional[Clausula]:
+        """Nodo del frame del evento, por referencia o por nivel."""
+        if evento.frame is not None:
+            nodo = self._conectado_seq(self._marcos.get(evento.frame))
+            if nodo is not None:
+                return nodo
+        if evento.nivel is not None:
+            for seq in reversed(self._pila):
+                nivel = self._nivel_de[seq]
+                if nivel == evento.nivel:
+                    return self._conectado_seq(seq)
+                if nivel < evento.nivel:
+                    break
+        return None
+
+    def _llamada(self, evento: EventoTraza) -> Clausula:
+        if evento.nivel is None:
+            return super()._llamada(evento)
+
+        while self._pila and self._nivel_de[self._pila[-1]] >= evento.nivel:
+            self._pila.pop()
+        padre = None
+        if evento.padre is not None:
+            padre = self._conectado_seq(self._marcos.get(evento.padre))
+        if padre is None:
+            padre = self._conectado_seq(self._pila[-1]) if self._pila else self.raiz
+
+        padre = self._escribible(padre)
+        nodo = self._nuevo_nodo(evento.meta, padre=padre)
+        padre.valor.append(nodo)
+        self._nivel_de[nodo._seq] = evento.nivel
+        if evento.frame is not None:
+            self._marcos[evento.frame] = nodo._seq
+        self._pila.append(nodo._seq)
+        self.nodo_actual = nodo
+        return nodo
+
+    def _cerrar(self, evento: EventoTraza, veracidad: str, nodo: Optional[Clausula] = None):
+        super()._cerrar(evento, veracidad, self._nodo_de(evento))
+
+    def _hermano_rehecho(self, evento: EventoTraza) -> Optional[Clausula]:
+        """
+        Sin referencia de frame, el nodo rehecho es un hijo del último frame
+        abierto de nivel inferior: el último con el mismo texto o, si no hay,
+        con el mismo nombre y aridad.
+        """
+        if evento.nivel is None:
+            return None
+        padre = self.raiz
+        for seq in reversed(self._pila):
+            if self._nivel_de[seq] < evento.nivel:
+                padre = self._conectado_seq(seq) or self.raiz
+                break
+        clave = self.simbolos.clave(evento.meta)
+        candidato = None
+        for hijo in reversed(padre.valor):
+            if hijo.nombre == evento.meta:
+                return hijo
+            if candidato is None and hijo._seq in self._nivel_de and self.simbolos.clave(hijo.nombre) == clave:
+                candidato = hijo
+        return candidato
+
+    def _iniciar_redo(self, evento: EventoTraza) -> Optional[int]:
+        self._guardar_rama_abandonada()
+        nodo = self._nodo_de(evento) or self._hermano_rehecho(evento)
+        if nodo is None:
+            # Redo de un frame que no está en el árbol: solo se guarda la rama
+            return None
+        if nodo.nombre != evento.meta:
+            nodo = self._escribible(nodo)
+            nodo.nombre = self.simbolos.interna(evento.meta)
+            self._indexar(nodo)
+        return nodo._seq
+
+    def _completar_redo(self, seq: Optional[int], siguiente: Optional[EventoTraza]):
+        if seq is None or siguiente is None:
+            return
+
+        nodo = self._escribible(self._nodos[seq])
+        # Se conservan los hijos hasta el frame que continúa la ejecución, si
+        # el evento siguiente es de un hijo ya existente; si no, se descartan
+        corte = 0
+        hijo = self._nodo_de(siguiente) if siguiente.puerto != "call" else None
+        if hijo is not None:
+            for index, clausula in enumerate(nodo.valor):
+                if clausula._seq == hijo._seq:
+                    corte = index + 1
+                    break
+        self._desconectar(nodo.valor[corte:])
+        nodo.valor = nodo.valor[:corte]
+        nodo.veracidad = ""
+        self.nodo_actual = nodo
+
+        # Dejar el nodo rehecho en la ruta más a la derecha y rehacer la pila
+        ruta = [nodo._seq]
+        current = nodo
+        while current.padre:
+            padre = self._escribible(current.padre)
+            for index, clausula in enumerate(padre.valor):
+                if clausula._seq == current._seq:
+                    self._desconectar(padre.valor[index + 1:])
+                    padre.valor = padre.valor[:index + 1]
+                    break
+            ruta.append(padre._seq)
+            current = padre
+        self._pila = [s for s in reversed(ruta) if s in self._nivel_de]
+
+
+# Segundos que se deja correr a swipl antes de matarlo
+TIEMPO_LIMITE_PROLOG = 60
+
+# Preámbulo de cada programa ejecutado en un proceso nuevo: hook que escribe la
+# traza en stderr. La profundidad de la política de captura se cuenta desde el
+# primer evento, el envoltorio de la consulta.
+HOOK_TRAZA = r"""
+:- use_module(library(http/json)).
+:- set_prolog_flag(trace_file, true).
+:- leash(-all).
+:- nb_setval(misa_nivel_base, none).
+user:prolog_trace_interception(Port, Frame, _PC, Accion) :-
+    ( prolog_frame_attribute(Frame, level, Lvl) -> true ; Lvl = 0 ),
+    nb_getval(misa_nivel_base, Base),
+    ( Base == none -> nb_setval(misa_nivel_base, Lvl), Profundidad = 0 ; Profundidad is Lvl - Base ),
+    misa_registrar(Port, Frame, Lvl, Profundidad, Accion).
+""" + CAPTURA_PROLOG
+
+@lru_cache(maxsize=None)
+def _version_swipl(ejecutable: str = "swipl") -> str:
+    try:
+        return subprocess.run([ejecutable, "--version"], capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "desconocida"
+
+
+# Se incrementa cuando cambia el contenido de las entradas de la caché de `solve`
+VERSION_CACHE_SOLVE = 1
+DIRECTORIO_CACHE_SOLVE = "cache/misa_j"
+
+
 class PrologSolver:
     """
     Implementa un solver basado en Prolog para inferencia lógica con justificaciones.
     """
 
+    def __init__(self, modo_traza: str = "nivel", max_ramas: Optional[int] = None, tamano_pool: int = 0,
+                 max_mb_cache: float = 0, directorio_cache: str = DIRECTORIO_CACHE_SOLVE,
+                 arbol_compacto: bool = False, politica: Optional[PoliticaCaptura] = None,
+                 formato_traza: str = "texto", verificar: bool = False, exportar_json: bool = False):
+        """
+        Args:
+            modo_traza: "nivel" reconstruye el árbol con el nivel y los frames de
+                la traza; "nombre" usa la reconstrucción original por nombres.
+            max_ramas: Si se indica, `solve` detiene Prolog en cuanto se han
+                construido tantas ramas de pensamiento.
+            tamano_pool: Número de procesos swipl persistentes que atienden las
+                consultas; con 0 cada consulta lanza un swipl nuevo.
+            max_mb_cache: Tamaño máximo de la caché en disco de `solve`; con 0
+                no se usa caché.
+            directorio_cache: Directorio de la caché de `solve`.
+            arbol_compacto: Si es True, `solve` devuelve las ramas como vistas de
+                un `ArbolCompacto` (arrays paralelos) en lugar de objetos Clausula.
+            politica: Límites de la captura de la traza (`misa_j/captura.py`);
+                por defecto se captura la traza completa.
+            formato_traza: "texto" escribe cada evento como una línea legible
+                que se analiza con expresiones regulares; "tramas" usa el
+                formato compacto del hook, que se decodifica sin ellas.
+            verificar: Si es True, `solve` verifica el programa antes de lanzar
+                Prolog (`misa_j/verificacion.py`) y no lo ejecuta si tiene
+                errores; los diagnósticos se devuelven en "diagnosticos".
+            exportar_json: Si es True, `solve` escribe además
+                ramas_de_pensamiento.json; si no, las ramas solo se guardan en
+                ramas_de_pensamiento.ramas (`misa_j/archivo_ramas.py`) y el
+                JSON se exporta cuando se pide.
+        """
+        if modo_traza not in ("nivel", "nombre"):
+            raise ValueError(f"Modo de traza desconocido: {modo_traza}")
+        if formato_traza not in ("texto", "tramas"):
+            raise ValueError(f"Formato de traza desconocido: {formato_traza}")
+        self.modo_traza = modo_traza
+        self.max_ramas = max_ramas
+        self.pool = PoolSwipl(tamano_pool, TIEMPO_LIMITE_PROLOG) if tamano_pool > 0 else None
+        self.cache = CacheDisco(directorio_cache, int(max_mb_cache * 1024 * 1024)) if max_mb_cache > 0 else None
+        self.arbol_compacto = arbol_compacto
+        self.politica = politica if politica is not None else PoliticaCaptura()
+        self.formato_traza = formato_traza
+        self.verificar = verificar
+        self.exportar_json = exportar_json
+        # Clave y resultado de la última llamada a `solve`: si el KR-Store no
+        # cambió entre ciclos se reutiliza sin leer la caché ni lanzar Prolog
+        self._ultimo: Optional[Tuple[str, dict]] = None
+
     def _create_prolog_program(self, clauses: List[str]) -> str:
         """Crea un programa Prolog a partir de una lista de HornClauses."""
         rules = "\n".join([clause for clause in clauses])
         print(f"Programa Prolog: {rules}")
         return rules
     
-    def ejecutar_prolog_con_json(self, prolog_code, consulta):
-        """
-        Ejecuta un código Prolog usando forall/2 para mayor robustez y devuelve
-        un diccionario con los resultados y la traza.
+    def _preparar_ejecucion(self, prolog_code, consulta) -> Tuple[List[str], str]:
         """
-        enriq_trace = r"""
-        :- use_module(library(http/json)).
-        :- set_prolog_flag(trace_file, true).
-        :- leash(-all).
-        user:prolog_trace_interception(Port, Frame, _PC, continue) :-
-            ( prolog_frame_attribute(Frame, level, Lvl) -> Indent is Lvl * 2 ; Indent = 0 ),
-            prolog_frame_attribute(Frame, goal,  Goal),
-            ( prolog_frame_attribute(Frame, clause, ClRef),
-            clause_property(ClRef, file(File)),
-            clause_property(ClRef, line_count(Line))
-            -> true
-            ; File = '<dynamic>', Line = 0
-            ),
-            format(user_error, '~N~*|~w: ~p @ ~w:~d~n', [Indent, Port, Goal, File, Line]).
+        Escribe el programa con el hook de la traza en un fichero temporal y
+        arma la meta, que usa forall/2 para mayor robustez.
+
+        Returns:
+            El comando de swipl y la ruta del fichero temporal, que debe
+            borrar quien lo ejecute.
         """
+        final_goal_logic = self._construir_meta(consulta)
 
+        swipl_executable = "swipl"
+        temp_prolog_file = tempfile.NamedTemporaryFile(mode='w+', suffix='.pl', delete=False)
+        try:
+            temp_prolog_file.write(HOOK_TRAZA)
+            temp_prolog_file.write('\n')
+            temp_prolog_file.write(self._directivas())
+            temp_prolog_file.write(prolog_code)
+            temp_prolog_file.close()
+        except Exception:
+            temp_prolog_file.close()
+            os.remove(temp_prolog_file.name)
+            raise
+        prolog_file_path_escaped = temp_prolog_file.name.replace("'", "''")
+
+        final_goal = (
+            f"consult('{prolog_file_path_escaped}'), "
+            f"trace, "
+            f"{final_goal_logic}"
+        )
+
+        # DEBUG: Imprime la meta final para poder probarla manualmente.
+        print("--- DEBUG: Meta de Prolog a ejecutar ---")
+        print(final_goal)
+        print("-----------------------------------------")
+
+        return [swipl_executable, "-q", "-g", final_goal, "-t", "halt"], temp_prolog_file.name
+
+    def _directivas(self) -> str:
+        """Directivas que configuran el hook de la traza antes del programa."""
+        return self.politica.directiva() + directiva_formato(self.formato_traza)
+
+    def _construir_meta(self, consulta: str) -> str:
+        """
+        Envuelve la consulta para que cada solución se escriba como JSON en
+        stdout y las excepciones de Prolog queden marcadas en la traza.
+        """
         var_names = sorted(list(set(re.findall(r'\b([A-Z_][a-zA-Z0-9_]*)\b', consulta))))
         
         # Se elimina el punto final de la consulta si existe
@@ -132,76 +847,67 @@ class PrologSolver:
 
         # Envolvemos la lógica principal en un catch para capturar errores de Prolog.
         final_goal_logic = f"catch(({goal_logic}), E, (format(user_error, '~N### CAUGHT_PROLOG_EXCEPTION ###~n~w~n### END_EXCEPTION ###~n', [E]), fail))"
+        return final_goal_logic
 
+    def _parsear_resultados(self, stdout_capture: str) -> List[dict]:
+        """Convierte la salida estándar de Prolog en la lista de soluciones JSON."""
+        lista_resultados = []
+        if stdout_capture:
+            # Intentar parsear el JSON completo primero
+            try:
+                # Si todo el stdout es un JSON válido
+                parsed_json = json.loads(stdout_capture.strip())
+                if isinstance(parsed_json, list):
+                    lista_resultados.extend(parsed_json)
+                else:
+                    lista_resultados.append(parsed_json)
+            except json.JSONDecodeError:
+                # Si no, procesar línea por línea y concatenar si es necesario
+                json_buffer = ""
+                for line in stdout_capture.strip().split('\n'):
+                    line = line.strip()
+                    if line:
+                        json_buffer += line
+                        try:
+                            # Intentar parsear el buffer completo
+                            parsed = json.loads(json_buffer)
+                            lista_resultados.append(parsed)
+                            json_buffer = ""  # Limpiar buffer después de éxito
+                        except json.JSONDecodeError:
+                            # Continuar acumulando en el buffer
+                            continue
+
+                # Si queda algo en el buffer al final, intentar parsearlo
+                if json_buffer:
+                    try:
+                        parsed = json.loads(json_buffer)
+                        lista_resultados.append(parsed)
+                    except json.JSONDecodeError:
+                        print(f"Advertencia: No se pudo decodificar el JSON final: {json_buffer}")
+        return lista_resultados
+
+    def ejecutar_prolog_con_json(self, prolog_code, consulta):
+        """
+        Ejecuta un código Prolog usando forall/2 para mayor robustez y devuelve
+        un diccionario con los resultados y la traza completa.
+        """
         stdout_capture = ""
         stderr_capture = ""
-        swipl_executable = "swipl"
-        temp_prolog_file = tempfile.NamedTemporaryFile(mode='w+', suffix='.pl', delete=False)
-        temp_prolog_file_name = temp_prolog_file.name
-        
-        try:
-            temp_prolog_file.write(enriq_trace)
-            temp_prolog_file.write('\n')
-            temp_prolog_file.write(prolog_code)
-            temp_prolog_file.close()
-            prolog_file_path_escaped = temp_prolog_file.name.replace("'", "''")
-            
-            final_goal = (
-                f"consult('{prolog_file_path_escaped}'), "
-                f"trace, "
-                f"{final_goal_logic}"
-            )
-
-            # DEBUG: Imprime la meta final para poder probarla manualmente.
-            print("--- DEBUG: Meta de Prolog a ejecutar ---")
-            print(final_goal)
-            print("-----------------------------------------")
+        temp_prolog_file_name = None
 
+        try:
+            comando, temp_prolog_file_name = self._preparar_ejecucion(prolog_code, consulta)
             process = subprocess.Popen(
-                [swipl_executable, "-q", "-g", final_goal, "-t", "halt"],
+                comando,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
                 encoding='utf-8', errors='replace'
             )
-            stdout_capture, stderr_capture = process.communicate(timeout=60)
-            
-            lista_resultados = []
-            if stdout_capture:
-                # Intentar parsear el JSON completo primero
-                try:
-                    # Si todo el stdout es un JSON válido
-                    parsed_json = json.loads(stdout_capture.strip())
-                    if isinstance(parsed_json, list):
-                        lista_resultados.extend(parsed_json)
-                    else:
-                        lista_resultados.append(parsed_json)
-                except json.JSONDecodeError:
-                    # Si no, procesar línea por línea y concatenar si es necesario
-                    json_buffer = ""
-                    for line in stdout_capture.strip().split('\n'):
-                        line = line.strip()
-                        if line:
-                            json_buffer += line
-                            try:
-                                # Intentar parsear el buffer completo
-                                parsed = json.loads(json_buffer)
-                                lista_resultados.append(parsed)
-                                json_buffer = ""  # Limpiar buffer después de éxito
-                            except json.JSONDecodeError:
-                                # Continuar acumulando en el buffer
-                                continue
-                    
-                    # Si queda algo en el buffer al final, intentar parsearlo
-                    if json_buffer:
-                        try:
-                            parsed = json.loads(json_buffer)
-                            lista_resultados.append(parsed)
-                        except json.JSONDecodeError:
-                            print(f"Advertencia: No se pudo decodificar el JSON final: {json_buffer}")
-            
+            stdout_capture, stderr_capture = process.communicate(timeout=TIEMPO_LIMITE_PROLOG)
+
             output_dict = {
-                "resultados": lista_resultados,
+                "resultados": self._parsear_resultados(stdout_capture),
                 "traza": stderr_capture.strip(),
                 "errors": ""
             }
@@ -213,197 +919,226 @@ class PrologSolver:
         except Exception as e:
             output_dict = { "resultados": [], "traza": "", "errors": f"ERROR: Python exception: {e}" }
         finally:
-            if os.path.exists(temp_prolog_file_name):
+            if temp_prolog_file_name and os.path.exists(temp_prolog_file_name):
                 os.remove(temp_prolog_file_name)
 
         return output_dict
-    
-    def _procesar_traza(self, traza_str):
-        # Inicializamos un array de Clausulas llamado ramas_de_pensamientos
-        ramas_de_pensamientos = []
-        # Inicializamos una variable llamada root con la Clausula root con el nombre root, array vacío, valor = "" y padre = None
-        root = Clausula(nombre="root", veracidad="", padre=None)
-        # Inicializamos una variable llamada nodo_actual que será igual a root
-        nodo_actual = root
-
-        # Regex para parsear: Tipo, Nivel (ignorado por ahora), Contenido
-        line_regex = re.compile(r'^\s*(call|exit|fail|redo)(?:\(\d+\))?:\s*([^@]+?)\s*(?:@.*)?$')
-        
-        traza = traza_str.strip().split('\n')
-        # Por cada linea en la traza:
-        conta = 0
-        for index, line_raw in enumerate(traza):
-            line = line_raw.strip()
-            if not line:
-                continue
 
-            # Parseala para determinar el contenido de la linea y desestrúcturalo en nombre, aridad y tipo de llamada.
-            match = line_regex.match(line)
-            if not match:
-                # print(f"Advertencia: No se pudo parsear la línea: {line}")
-                continue
+    def iterar_ramas(self, prolog_code, consulta, salida: Optional[dict] = None,
+                     max_ramas: Optional[int] = None, eco: bool = False) -> Iterator[Clausula]:
+        """
+        Ejecuta Prolog y construye el árbol SLD a medida que la traza llega por
+        stderr, emitiendo cada rama de pensamiento en cuanto queda congelada.
+        La traza nunca se guarda entera: en memoria solo queda el árbol vivo y
+        las ramas que conserve quien consume el generador.
 
-            tipo_llamada, contenido_str = match.groups()
-            # 'nombre' y 'aridad' se infieren del 'contenido_str' según el contexto.
+        Args:
+            salida: Diccionario que, al terminar el generador, recibe
+                "resultados" y "errors" como en `ejecutar_prolog_con_json`.
+            max_ramas: Si se indica, se detiene Prolog tras emitir tantas ramas.
+                Cerrar el generador antes de agotarlo tiene el mismo efecto.
+                En ambos casos los resultados pueden quedar incompletos.
+            eco: Si True, imprime la traza cruda según se procesa.
+        """
+        if salida is None:
+            salida = {}
+        salida.update({"resultados": [], "errors": ""})
 
+        try:
+            if self.pool is not None:
+                ejecucion = self.pool.consultar(self._directivas() + prolog_code, self._construir_meta(consulta))
+            else:
+                comando, temp_prolog_file_name = self._preparar_ejecucion(prolog_code, consulta)
+                ejecucion = ProcesoSwipl(comando, temp_prolog_file_name, TIEMPO_LIMITE_PROLOG)
+        except Exception as e:
+            salida["errors"] = f"ERROR: Python exception: {e}"
+            return
 
-            if tipo_llamada == "call":
-                # Si la linea es de tipo Call, si el contenido es fail salta la linea
-                if contenido_str == "fail":
-                    continue
-                # si no crea una Clausula con nombre = al contenido y padre = nodo_actual, esta será el nuevo nodo_actual
-                nueva_clausula = Clausula(nombre=contenido_str, padre=nodo_actual)
-                nodo_actual.valor.append(nueva_clausula)
-                nodo_actual = nueva_clausula
-            
-            elif tipo_llamada == "exit":
-                # El nodo_actual es el que fue llamado y ahora está saliendo (Exit)
-                exiting_node = nodo_actual
-                
-                # Si el array valor está vacío crea una Cláusula con el nombre = al contenido, veracidad = "verde" y agrégalo al array de cláusulas de valor del nodo_actual.
-                if not exiting_node.valor: 
-                    clausula_resultado = Clausula(nombre=contenido_str, veracidad="verde", padre=exiting_node)
-                    exiting_node.valor.append(clausula_resultado)
-                exiting_node.veracidad = "verde"
-                
-                # Nodo_actual será nodo_actual.padre (para ambos casos de Exit)
-                if exiting_node.padre:
-                    nodo_actual = exiting_node.padre
-                
-            elif tipo_llamada == "fail":
-                # si el contenido es fail salta la linea
-                if contenido_str == "fail":
-                    continue
-                
-                failing_node = nodo_actual # El nodo que fue llamado y ahora está fallando (Fail)
-                
-                # si no si el array valor está vacío crea una Cláusula con el nombre = al contenido, veracidad = "rojo" y agrégalo al array de cláusulas de valor del nodo_actual.
-                if not failing_node.valor:
-                    clausula_resultado = Clausula(nombre=contenido_str, veracidad="rojo", padre=failing_node)
-                    failing_node.valor.append(clausula_resultado)
-
-                failing_node.veracidad = "rojo"
-                
-                # y el nodo_actual será nodo_actual.padre (para ambos casos de Fail)
-                if failing_node.padre:
-                    nodo_actual = failing_node.padre
-
-            elif tipo_llamada == "redo":
-                # Hacemos una copia del arbol almacenado en root y la guardamos en el array de ramas_de_pensamientos.
-                while nodo_actual.padre:
-                    nodo_actual.veracidad = "rojo"
-                    nodo_actual = nodo_actual.padre
-                ramas_de_pensamientos.append(copy.deepcopy(root))
-                
-                # Luego bajamos por el arbol desde root hasta encontrar una de las cláusulas 
-                # ... con nombre igual al contenido de la linea
-                # (contenido_str es, por ej., "hola(_4668)")
-                
-                q = [root] # Cola para búsqueda BFS para encontrar el nodo
-                node_to_redo_found = None
-                # Usamos un set para evitar ciclos en la búsqueda si la estructura del árbol fuera inesperada,
-                # aunque con padres no debería haber ciclos descendentes.
-                visited_for_bfs = set() 
-
-                last_last_found = None
-                last_found = None
-
-                while q:
-                    curr_search_node = q.pop(0)
-                    
-                    if id(curr_search_node) in visited_for_bfs: # Comprobar por id del objeto
-                        continue
-                    visited_for_bfs.add(id(curr_search_node))
-
-                    # Extraer nombre y aridad del nodo actual
-                    curr_nombre = curr_search_node.nombre.split('(')[0].strip()
-                    curr_aridad = len(curr_search_node.nombre.split('(')[1].split(',')) if '(' in curr_search_node.nombre else 0
-
-                    # Extraer nombre y aridad del contenido
-                    cont_nombre = contenido_str.split('(')[0].strip()
-                    cont_aridad = len(contenido_str.split('(')[1].split(',')) if '(' in contenido_str else 0
-
-                    # Comparar nombre y aridad
-                    if curr_nombre == cont_nombre and curr_aridad == cont_aridad:
-                        last_last_found = last_found
-                        last_found = curr_search_node
-
-                    if curr_search_node.nombre == contenido_str:
-                        node_to_redo_found = curr_search_node
-                    for child in curr_search_node.valor:
-                        if isinstance(child, Clausula): # Asegurarse de que el hijo es una Clausula
-                            q.append(child)
-                if node_to_redo_found == None:
-                        node_to_redo_found = last_found
-                        node_to_redo_found.nombre = contenido_str
-                
-                if node_to_redo_found != None:
-                    #ELIMINAR ESTO DESPUES DE LA PRUEBAs
-                    if index + 1 == len(traza):
-                        break
-                    next_clausule = traza[index + 1]
-                    next_contenido = line_regex.match(next_clausule).group(2).strip()
-                    nombre = next_contenido.split('(')[0].strip()
-                    aridad = len(next_contenido.split('(')[1].split(',')) if '(' in next_contenido else 0
-                    if node_to_redo_found.valor != []:
-                        for index, clausula in enumerate(node_to_redo_found.valor):
-                            if clausula.nombre == nombre and len(clausula.nombre.split('(')[1].split(',')) if '(' in clausula.nombre else 0 == aridad:
-                                node_to_redo_found.valor = node_to_redo_found.valor[:index + 1]
-                                break
-                        else:
-                            # Limpiar el array de valor del nodo encontrado y reiniciar su veracidad
-                            node_to_redo_found.valor = [] 
-                    node_to_redo_found.veracidad = ""  # Reiniciar su estado de veracidad
-                    nodo_actual = node_to_redo_found
-                    current = node_to_redo_found
-                    while current.padre:
-
-                        indice = 0
-                        for son in current.padre.valor:
-                            if son.nombre == current.nombre:
-                                break
-                            indice += 1
-                        # Truncar el array de valor del padre hasta el índice encontrado
-                        current.padre.valor = current.padre.valor[:indice + 1]
-                        current = current.padre
-                        
-                else:
-                    # Este caso idealmente no debería ocurrir si la traza es consistente.
-                    # print(f"Advertencia: Objetivo de REDO '{contenido_str}' no encontrado en el estado actual del árbol.")
+        if eco:
+            print("--- Traza cruda de Prolog ---")
+        try:
+            lineas = ejecucion.lineas()
+            # El pool delimita la traza de cada consulta; un proceso nuevo
+            # añade su cabecera y su cierre
+            if self.pool is None:
+                lineas = _recortar_traza(lineas)
+            if eco:
+                lineas = _imprimir_lineas(lineas)
+            emitidas = 0
+            try:
+                for rama in self._iterar_ramas_de_lineas(lineas):
+                    yield rama
+                    emitidas += 1
+                    if max_ramas is not None and emitidas >= max_ramas:
+                        return
+            except Exception:
+                # Se deja terminar a Prolog para conservar sus resultados
+                for _ in lineas:
                     pass
+                raise
+        finally:
+            ejecucion.terminar()
+            if eco:
+                print("--- Fin de traza cruda ---")
+            if ejecucion.error:
+                salida.update({"resultados": [], "errors": ejecucion.error})
+            else:
+                salida["resultados"] = self._parsear_resultados(ejecucion.salida)
 
-        ramas_de_pensamientos.append(copy.deepcopy(root))
+    def _iterar_ramas_de_lineas(self, lineas: Iterable[str]) -> Iterator[Clausula]:
+        """
+        Construye las ramas de pensamiento línea a línea y las emite en cuanto
+        se congelan.
 
-        return ramas_de_pensamientos
+        En modo "nombre" las relaciones padre/hijo se deducen del orden de los
+        eventos y los redo se resuelven por nombre; en modo "nivel" se usan el
+        nivel y las referencias de frame que escribe el hook de la traza.
+        """
+        con_nivel = self.modo_traza == "nivel"
+        constructor = ConstructorArbolPorNivel() if con_nivel else ConstructorArbolSLD()
 
+        # Las líneas vacías se aplazan: solo cuentan si detrás vienen más
+        # eventos, ya que los blancos del final de la traza se descartan
+        blancos_pendientes = False
+        for linea in lineas:
+            if linea.startswith(MARCA_TRAMA):
+                evento = parsear_trama(linea, con_nivel)
+            else:
+                # En modo "nivel" se conserva la sangría: es el nivel cuando falta el sufijo del hook
+                linea = linea.rstrip() if con_nivel else linea.strip()
+                if not linea.strip():
+                    blancos_pendientes = True
+                    continue
+                evento = parsear_linea_traza(linea, con_nivel)
+            if blancos_pendientes and constructor.redo_pendiente:
+                constructor.procesar(None)
+            blancos_pendientes = False
+            constructor.procesar(evento)
+            # Las ramas emitidas ya no se modifican y el constructor no las retiene
+            yield from constructor.ramas
+            constructor.ramas.clear()
 
-    def solve(self, initial_clauses: List[str], goal_clause_obj: Optional[str] = None, problem_name: str = "Problema") -> List[Clausula]:
-        """
-        Ejecuta el proceso de inferencia usando Prolog.
+        yield from constructor.finalizar()
 
-        Args:
-            initial_clauses: Una lista de HornClauses (hechos y reglas).
-            goal_clause_obj: La HornClause objetivo (opcional).
-            problem_name: Nombre del problema para la traza.
+    def _procesar_traza(self, traza_str):
+        """Construye todas las ramas de pensamiento a partir de la traza cruda."""
+        return list(self._iterar_ramas_de_lineas(traza_str.split('\n')))
 
-        Returns:
-            Una InferenceTrace con todos los pasos de derivación.
+    def _clave_cache(self, initial_clauses: List[str], consulta: str) -> str:
         """
-        # Crear el programa Prolog
-        program_string = self._create_prolog_program(initial_clauses)
-        
-        consulta = f"{goal_clause_obj}"
+        Clave de la caché de `solve`: hash de las cláusulas y la consulta
+        normalizadas junto con todo lo que cambia la traza o las ramas
+        (versión de swipl, hook de la traza, modo de reconstrucción).
+        """
+        hook = PROGRAMA_TRABAJADOR if self.pool is not None else HOOK_TRAZA
+        contenido = {
+            "version": VERSION_CACHE_SOLVE,
+            "clausulas": [c.strip() for c in initial_clauses if c.strip()],
+            "consulta": consulta.strip(),
+            "swipl": _version_swipl(),
+            "hook": hashlib.sha256(hook.encode('utf-8')).hexdigest(),
+            "modo_traza": self.modo_traza,
+            "max_ramas": self.max_ramas,
+            "politica": list(self.politica),
+            "formato_traza": self.formato_traza,
+        }
+        texto = json.dumps(contenido, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    def _compactar(self, ramas: List[Clausula]) -> List[Clausula]:
+        if not self.arbol_compacto:
+            return ramas
+        from misa_j.arbol_compacto import ArbolCompacto
+        return ArbolCompacto.desde_ramas(ramas).vistas_ramas()
+
+    def _ramas_de_tabla(self, tabla: dict) -> List[Clausula]:
+        if not self.arbol_compacto:
+            return ramas_de_tabla(tabla)
+        from misa_j.arbol_compacto import ArbolCompacto
+        return ArbolCompacto.desde_tabla(tabla).vistas_ramas()
+
+    def _tabla_de_ramas(self, ramas: List[Clausula]) -> dict:
+        from misa_j.arbol_compacto import ClausulaCompacta
+        # Las ramas compactadas por `_compactar` ya son la tabla, sin repetir el recorrido
+        if ramas and isinstance(ramas[0], ClausulaCompacta):
+            arbol = ramas[0]._arbol
+            if len(ramas) == len(arbol.ramas) and all(r._arbol is arbol and r._indice == i
+                                                      for r, i in zip(ramas, arbol.ramas)):
+                return arbol.a_tabla()
+        return ramas_a_tabla(ramas)
+
+    def _leer_cache(self, clave: str) -> Optional[dict]:
+        datos = self.cache.obtener(clave)
+        if datos is None:
+            return None
+        try:
+            entrada = json.loads(zlib.decompress(datos).decode('utf-8'))
+            result = {
+                "status": entrada["status"],
+                "resultados": entrada["resultados"],
+                "ramas": self._ramas_de_tabla(entrada["ramas"]),
+                "errors": entrada["errors"]
+            }
+        except Exception as e:
+            print(f"ERROR: Entrada de caché de MISA-J ilegible ({clave}): {e}. Se ejecutará Prolog.")
+            return None
+        print(f"INFO: Resultado de MISA-J cargado de la caché: {clave}")
+        return result
+
+    def _guardar_en_cache(self, clave: str, result: dict):
+        # Los errores del lanzador (timeout, swipl ausente...) no dependen solo del programa
+        if str(result["errors"]).startswith("ERROR:"):
+            return
+        entrada = {
+            "status": result["status"],
+            "resultados": result["resultados"],
+            "ramas": self._tabla_de_ramas(result["ramas"]),
+            "errors": result["errors"]
+        }
+        texto = json.dumps(entrada, ensure_ascii=False, separators=(',', ':'))
+        try:
+            self.cache.guardar(clave, zlib.compress(texto.encode('utf-8')))
+        except Exception as e:
+            print(f"ERROR: No se pudo guardar el resultado de MISA-J en la caché: {e}")
+
+    def _verificar(self, clausulas: List[str], consulta: Optional[str]) -> list:
+        """Diagnósticos de la verificación previa ([] si está desactivada)."""
+        if not self.verificar:
+            return []
+        try:
+            diagnosticos = verificar_programa(clausulas, consulta)
+        except Exception as e:
+            # Un fallo del verificador no debe impedir ejecutar el programa
+            print(f"ERROR: No se pudo verificar el programa: {e}")
+            return []
+        for diagnostico in diagnosticos:
+            print(f"MISA-J: {diagnostico}")
+        return diagnosticos
 
-        # Ejecutar Prolog y obtener la traza
-        dict_traza = self.ejecutar_prolog_con_json(program_string, consulta)
-        raw_trace = dict_traza["traza"]
+    def _ejecutar_y_procesar(self, program_string: str, consulta: str) -> dict:
+        """Ejecuta Prolog y construye las ramas de pensamiento."""
+        # Ejecutar Prolog procesando la traza a medida que llega
+        dict_traza = {}
+        error_traza = None
+        try:
+            ramas_traza = self.iterar_ramas(program_string, consulta, salida=dict_traza,
+                                            max_ramas=self.max_ramas, eco=True)
+            if self.politica.muestra_fallos is None:
+                ramas = list(ramas_traza)
+            else:
+                # Las ramas fallidas que no entran en la muestra se descartan según llegan
+                muestreo = MuestreoFallos(self.politica.muestra_fallos)
+                for rama in ramas_traza:
+                    muestreo.agregar(rama)
+                ramas = muestreo.ramas()
+                print(f"INFO: Muestreo de ramas fallidas: {muestreo.fallidas_vistas - muestreo.descartadas} "
+                      f"de {muestreo.fallidas_vistas} conservadas.")
+        except Exception as e:
+            ramas = []
+            error_traza = e
         print("--- Resultados ----")
         print(dict_traza["resultados"])
         print("--- Fin de resultados ----")
-        raw_trace = "\n".join(raw_trace.split("\n")[1:-6]) if raw_trace else ""
-        print("--- Traza cruda de Prolog ---")
-        print(raw_trace)
-        print("--- Fin de traza cruda ---")
         print("--- Errores ---")
         print(dict_traza["errors"])
         print("--- Fin de errores ---")
@@ -412,28 +1147,78 @@ class PrologSolver:
         result = {
             "status": "success" if dict_traza["resultados"] else "failed",
             "resultados": dict_traza["resultados"],
-            "ramas": [],
+            "ramas": ramas,
             "errors": dict_traza["errors"]
         }
-        # Procesar la traza
-        try:
-            ramas = self._procesar_traza(raw_trace)
-            result["ramas"] = ramas
-        except Exception as e:
-            error_msg = f"Error en MISA-J: {str(e)}"
+        if error_traza is not None:
+            error_msg = f"Error en MISA-J: {str(error_traza)}"
             print(f"ERROR: {error_msg}")
-            result["ramas"] = []
             result["errors"] = "No se pudo procesar la traza."
+        return result
+
+    def solve(self, initial_clauses: List[str], goal_clause_obj: Optional[str] = None, problem_name: str = "Problema",
+              directorio_soluciones: str = "solutions") -> List[Clausula]:
+        """
+        Ejecuta el proceso de inferencia usando Prolog.
+
+        Args:
+            initial_clauses: Una lista de HornClauses (hechos y reglas).
+            goal_clause_obj: La HornClause objetivo (opcional).
+            problem_name: Nombre del problema para la traza.
+            directorio_soluciones: Directorio donde se guarda ramas_de_pensamiento.ramas.
+
+        Returns:
+            Una InferenceTrace con todos los pasos de derivación.
+        """
+        # Crear el programa Prolog
+        program_string = self._create_prolog_program(initial_clauses)
         
+        consulta = f"{goal_clause_obj}"
+
+        diagnosticos = self._verificar(initial_clauses, goal_clause_obj)
+        clave = self._clave_cache(initial_clauses, consulta)
+        result = None
+        if hay_errores(diagnosticos):
+            print("ERROR: La verificación previa encontró errores en el programa; no se ejecuta Prolog.")
+            result = {
+                "status": "failed",
+                "resultados": [],
+                "ramas": [],
+                "errors": "ERROR: El programa no superó la verificación previa."
+            }
+        if result is None and self._ultimo is not None and self._ultimo[0] == clave:
+            print("INFO: Las cláusulas no cambiaron desde la última ejecución de MISA-J; se reutiliza su resultado.")
+            result = self._ultimo[1]
+        if result is None and self.cache is not None:
+            result = self._leer_cache(clave)
+        if result is None:
+            result = self._ejecutar_y_procesar(program_string, consulta)
+            result["ramas"] = self._compactar(result["ramas"])
+            if self.cache is not None:
+                self._guardar_en_cache(clave, result)
+        # Como en la caché, los errores del lanzador no se reutilizan
+        self._ultimo = (clave, result) if not str(result["errors"]).startswith("ERROR:") else None
+        result = dict(result, diagnosticos=[str(diagnostico) for diagnostico in diagnosticos])
+
         # Crear directorios si no existen
-        solutions_dir = Path("solutions")
-
-        # Guardar el JSON
-        json_path = solutions_dir / f"ramas_de_pensamiento.json"
-        with open(json_path, 'w', encoding='utf-8') as f:
-            # Convertir cada objeto Clausula a diccionario antes de guardar
-            ramas_dict = [rama.to_dict() for rama in result["ramas"]]
-            json.dump(ramas_dict, f, indent=2, ensure_ascii=False)
+        solutions_dir = Path(directorio_soluciones)
+        solutions_dir.mkdir(parents=True, exist_ok=True)
+
+        # Archivo binario de ramas con tabla de desplazamientos; se abre con mmap
+        # y el JSON se exporta desde él (python -m misa_j.archivo_ramas)
+        from misa_j.archivo_ramas import EXTENSION, escribir_archivo
+        exportar_json = self.exportar_json
+        try:
+            escribir_archivo(str(solutions_dir / f"ramas_de_pensamiento{EXTENSION}"), result)
+        except (TypeError, ValueError) as e:
+            print(f"ERROR: No se pudo escribir el archivo de ramas ({e}); se guarda el JSON.")
+            exportar_json = True
+        if exportar_json:
+            json_path = solutions_dir / f"ramas_de_pensamiento.json"
+            with open(json_path, 'w', encoding='utf-8') as f:
+                # Convertir cada objeto Clausula a diccionario antes de guardar
+                ramas_dict = [rama.to_dict() for rama in result["ramas"]]
+                json.dump(ramas_dict, f, indent=2, ensure_ascii=False)
 
         return result
 
@@ -0,0 +1,378 @@
+"""
+Ejecución de consultas de MISA-J en swipl.
+
+`ProcesoSwipl` lanza un proceso nuevo por consulta (comportamiento original).
+`PoolSwipl` mantiene procesos swipl persistentes que ya tienen cargados el
+hook de la traza y library(http/json); cada consulta se carga en un módulo
+temporal que se destruye al terminar.
+
+Ambos tipos de ejecución ofrecen la misma interfaz: `lineas()` devuelve la
+traza de stderr línea a línea mientras Prolog se ejecuta, `salida` es la
+salida estándar y `terminar()` (o salir del bloque `with`) libera el proceso.
+"""
+import atexit
+import itertools
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+from typing import Iterator, List, Optional
+
+from misa_j.captura import CAPTURA_PROLOG, MARCA_TRAMA, SEPARADOR_TRAMA
+
+MARCA_LISTO = "### MISA_LISTO ###"
+
+# Programa que carga cada trabajador al arrancar. El hook escribe la meta de
+# la consulta (el envoltorio `catch/3` de `PrologSolver._construir_meta`) y lo
+# que queda por debajo de ella, como el hook de un proceso por consulta; el
+# envoltorio del servidor y lo que se ejecuta después de la meta no se
+# escriben. La profundidad de la política de captura se cuenta desde esa meta.
+PROGRAMA_TRABAJADOR = r"""
+:- use_module(library(http/json)).
+:- use_module(library(modules)).
+:- set_prolog_flag(trace_file, true).
+:- leash(-all).
+:- nb_setval(misa_nivel_base, none).
+
+user:prolog_trace_interception(Port, Frame, _PC, Accion) :-
+    ( prolog_frame_attribute(Frame, level, Lvl) -> true ; Lvl = 0 ),
+    nb_getval(misa_nivel_base, Base),
+    (   Base == none
+    ->  nb_setval(misa_nivel_base, Lvl),
+        misa_registrar(Port, Frame, Lvl, 0, Accion)
+    ;   Base == fin
+    ->  Accion = continue
+    ;   Lvl > Base
+    ->  Profundidad is Lvl - Base,
+        misa_registrar(Port, Frame, Lvl, Profundidad, Accion)
+    ;   Lvl =:= Base
+    ->  misa_registrar(Port, Frame, Lvl, 0, Accion),
+        % Al salir la meta de la consulta termina su traza
+        ( misa_puerto_final(Port) -> nb_setval(misa_nivel_base, fin) ; true )
+    ;   Accion = continue
+    ).
+
+misa_puerto_final(exit).
+misa_puerto_final(fail).
+misa_puerto_final(exception(_)).
+""" + CAPTURA_PROLOG + r"""
+misa_servidor :-
+    set_stream(user_input, encoding(utf8)),
+    set_stream(user_output, encoding(utf8)),
+    set_stream(user_error, encoding(utf8)),
+    format(user_output, '~w~n', ['### MISA_LISTO ###']),
+    flush_output(user_output),
+    repeat,
+    read_term(user_input, Peticion, [double_quotes(string)]),
+    (   Peticion == end_of_file
+    ->  !
+    ;   ignore(misa_atender(Peticion)),
+        fail
+    ).
+
+misa_atender(misa_consulta(Id, Programa, TextoMeta)) :-
+    format(atom(Modulo), 'misa_~w', [Id]),
+    format(atom(Fuente), 'misa_programa_~w', [Id]),
+    catch(ignore(in_temporary_module(Modulo,
+                                     misa_cargar(Modulo, Fuente, Programa),
+                                     misa_ejecutar(Modulo, TextoMeta))),
+          E, print_message(error, E)),
+    notrace,
+    nodebug,
+    nb_setval(misa_politica, none),
+    nb_setval(misa_formato, texto),
+    catch(unload_file(Fuente), _, true),
+    format(atom(Fin), '### MISA_FIN ~w ###', [Id]),
+    format(user_output, '~N~w~n', [Fin]),
+    flush_output(user_output),
+    format(user_error, '~N~w~n', [Fin]),
+    flush_output(user_error).
+
+misa_cargar(Modulo, Fuente, Programa) :-
+    setup_call_cleanup(open_string(Programa, Flujo),
+                       load_files(Modulo:Fuente, [stream(Flujo)]),
+                       close(Flujo)).
+
+misa_ejecutar(Modulo, TextoMeta) :-
+    term_string(Meta, TextoMeta, [module(Modulo)]),
+    nb_setval(misa_nivel_base, none),
+    nb_setval(misa_eventos, 0),
+    trace,
+    ( Modulo:Meta -> true ; true ),
+    notrace,
+    nodebug.
+"""
+
+
+def _cadena_prolog(texto: str) -> str:
+    """Escribe `texto` como cadena Prolog entre comillas dobles."""
+    partes = ['"']
+    for caracter in texto:
+        if caracter in '\\"':
+            partes.append('\\' + caracter)
+        elif ord(caracter) < 32 or ord(caracter) == 127:
+            partes.append(f'\\x{ord(caracter):x}\\')
+        else:
+            partes.append(caracter)
+    partes.append('"')
+    return "".join(partes)
+
+
+class ProcesoSwipl:
+    """Una consulta en un proceso swipl nuevo que se descarta al terminar."""
+
+    def __init__(self, comando: List[str], fichero_temporal: str, tiempo_limite: float):
+        self._fichero_temporal = fichero_temporal
+        try:
+            self._proceso = subprocess.Popen(
+                comando,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding='utf-8', errors='replace'
+            )
+        except Exception:
+            os.remove(fichero_temporal)
+            raise
+        self.expirada = False
+        self.error = ""
+        self._agotada = False
+
+        # stdout se vacía en otro hilo para que Prolog no se bloquee con la tubería llena
+        self._partes_stdout = []
+        self._lector_stdout = threading.Thread(target=self._leer_stdout, daemon=True)
+        self._lector_stdout.start()
+        self._temporizador = threading.Timer(tiempo_limite, self._expirar)
+        self._temporizador.daemon = True
+        self._temporizador.start()
+
+    def _leer_stdout(self):
+        self._partes_stdout.append(self._proceso.stdout.read())
+
+    def _expirar(self):
+        self.expirada = True
+        self._proceso.kill()
+
+    @property
+    def salida(self) -> str:
+        return "".join(self._partes_stdout)
+
+    def lineas(self) -> Iterator[str]:
+        for linea in self._proceso.stderr:
+            yield linea.rstrip('\n')
+        self._agotada = True
+
+    def terminar(self):
+        """Espera a swipl, o lo mata si la traza no se leyó entera."""
+        if not self._agotada and self._proceso.poll() is None:
+            self._proceso.kill()
+        self._proceso.wait()
+        self._temporizador.cancel()
+        self._lector_stdout.join()
+        self._proceso.stdout.close()
+        self._proceso.stderr.close()
+        if self.expirada:
+            self.error = "ERROR: Timeout."
+        if os.path.exists(self._fichero_temporal):
+            os.remove(self._fichero_temporal)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.terminar()
+        return False
+
+
+class _TrabajadorSwipl:
+    """Proceso swipl persistente que atiende consultas leídas de stdin."""
+
+    def __init__(self, ejecutable: str):
+        fichero = tempfile.NamedTemporaryFile(mode='w', suffix='.pl', delete=False, encoding='utf-8')
+        try:
+            fichero.write(PROGRAMA_TRABAJADOR)
+            fichero.close()
+            self.proceso = subprocess.Popen(
+                [ejecutable, "-q", "-g", "misa_servidor", "-t", "halt", fichero.name],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding='utf-8', errors='replace'
+            )
+            linea = self.proceso.stdout.readline()
+            if linea.strip() != MARCA_LISTO:
+                self.matar()
+                self.cerrar_tuberias()
+                raise RuntimeError(f"swipl no arrancó como trabajador del pool: {linea!r}")
+        finally:
+            # El programa ya está cargado; el fichero no hace falta
+            os.remove(fichero.name)
+
+    def vivo(self) -> bool:
+        return self.proceso.poll() is None
+
+    def matar(self):
+        if self.vivo():
+            self.proceso.kill()
+        self.proceso.wait()
+
+    def cerrar_tuberias(self):
+        """Solo cuando ningún hilo está leyendo del proceso."""
+        for flujo in (self.proceso.stdin, self.proceso.stdout, self.proceso.stderr):
+            try:
+                flujo.close()
+            except OSError:
+                pass
+
+    def cerrar(self):
+        """Cierra stdin para que el servidor termine; si no lo hace, se mata."""
+        try:
+            self.proceso.stdin.close()
+            self.proceso.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.matar()
+        self.cerrar_tuberias()
+
+
+class ConsultaPool:
+    """Una consulta atendida por un trabajador del pool."""
+
+    def __init__(self, pool: "PoolSwipl", trabajador: _TrabajadorSwipl, id_consulta: int,
+                 programa: str, meta: str):
+        self._pool = pool
+        self._trabajador = trabajador
+        self._marca_fin = f"### MISA_FIN {id_consulta} ###"
+        # Los predicados del programa viven en el módulo temporal misa_<id>
+        self._prefijo_modulo = f"misa_{id_consulta}:"
+        self.expirada = False
+        self.error = ""
+        self._agotada = False
+        self._lineas_stdout = []
+
+        proceso = trabajador.proceso
+        proceso.stdin.write(f"misa_consulta({id_consulta}, {_cadena_prolog(programa)}, {_cadena_prolog(meta)}).\n")
+        proceso.stdin.flush()
+
+        self._lector_stdout = threading.Thread(target=self._leer_stdout, daemon=True)
+        self._lector_stdout.start()
+        self._temporizador = threading.Timer(pool.tiempo_limite, self._expirar)
+        self._temporizador.daemon = True
+        self._temporizador.start()
+
+    def _leer_stdout(self):
+        for linea in self._trabajador.proceso.stdout:
+            if linea.rstrip('\n') == self._marca_fin:
+                return
+            self._lineas_stdout.append(linea)
+
+    def _expirar(self):
+        self.expirada = True
+        self._trabajador.matar()
+
+    @property
+    def salida(self) -> str:
+        return "".join(self._lineas_stdout)
+
+    def lineas(self) -> Iterator[str]:
+        for linea in self._trabajador.proceso.stderr:
+            linea = linea.rstrip('\n')
+            if linea == self._marca_fin:
+                self._agotada = True
+                return
+            if self._prefijo_modulo in linea:
+                linea = self._sin_prefijo(linea)
+            yield linea
+
+    def _sin_prefijo(self, linea: str) -> str:
+        if not linea.startswith(MARCA_TRAMA):
+            return linea.replace(self._prefijo_modulo, "")
+        # La trama declara la longitud de la meta: se corrige al acortarla
+        campos = linea.split(SEPARADOR_TRAMA, 7)
+        if len(campos) == 8:
+            campos[7] = campos[7].replace(self._prefijo_modulo, "")
+            campos[6] = str(len(campos[7]))
+        return SEPARADOR_TRAMA.join(campos)
+
+    def terminar(self):
+        """
+        Devuelve el trabajador al pool. Si la traza no se leyó hasta la marca
+        de fin (parada anticipada, timeout o caída) el trabajador se mata y
+        su hueco se vuelve a arrancar en la siguiente consulta.
+        """
+        self._temporizador.cancel()
+        caido = not self._agotada and not self._trabajador.vivo()
+        if not self._agotada:
+            self._trabajador.matar()
+        self._lector_stdout.join()
+        if self.expirada:
+            self.error = "ERROR: Timeout."
+        elif caido:
+            self.error = "ERROR: El trabajador swipl terminó inesperadamente."
+        self._pool._devolver(self._trabajador)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.terminar()
+        return False
+
+
+class PoolSwipl:
+    """
+    Pool de procesos swipl persistentes. Los trabajadores se arrancan bajo
+    demanda y un trabajador que muere o expira solo se reemplaza a sí mismo.
+    """
+
+    def __init__(self, tamano: int, tiempo_limite: float, ejecutable: str = "swipl"):
+        if tamano < 1:
+            raise ValueError(f"El pool de swipl necesita al menos un trabajador: {tamano}")
+        self.tiempo_limite = tiempo_limite
+        self._ejecutable = ejecutable
+        self._ids = itertools.count(1)
+        self._libres = queue.Queue()
+        # None es un hueco sin proceso: se arranca al usarlo
+        for _ in range(tamano):
+            self._libres.put(None)
+        atexit.register(self.cerrar)
+
+    def consultar(self, programa: str, meta: str) -> ConsultaPool:
+        """Espera un trabajador libre y le envía el programa y la meta."""
+        trabajador: Optional[_TrabajadorSwipl] = self._libres.get()
+        try:
+            if trabajador is not None and not trabajador.vivo():
+                trabajador.cerrar_tuberias()
+                trabajador = None
+            if trabajador is None:
+                trabajador = _TrabajadorSwipl(self._ejecutable)
+            return ConsultaPool(self, trabajador, next(self._ids), programa, meta)
+        except Exception:
+            if trabajador is not None:
+                trabajador.matar()
+                trabajador.cerrar_tuberias()
+            self._libres.put(None)
+            raise
+
+    def _devolver(self, trabajador: _TrabajadorSwipl):
+        if trabajador.vivo():
+            self._libres.put(trabajador)
+        else:
+            trabajador.cerrar_tuberias()
+            self._libres.put(None)
+
+    def cerrar(self):
+        """Cierra los trabajadores libres; sus huecos se arrancarán de nuevo si se usan."""
+        huecos = 0
+        while True:
+            try:
+                trabajador = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            if trabajador is not None:
+                trabajador.cerrar()
+            huecos += 1
+        for _ in range(huecos):
+            self._libres.put(None)
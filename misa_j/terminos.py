@@ -0,0 +1,491 @@
+"""
+Análisis de las metas que aparecen en la traza de Prolog.
+
+Cada meta se analiza una sola vez para obtener su functor principal, su
+aridad y el tramo de texto de sus argumentos. El análisis respeta el
+anidamiento de paréntesis, listas, llaves y comillas (`p(f(a, b), c)` tiene
+aridad 2) y reconoce los operadores estándar de Prolog tal como los escribe
+`~p` (`X = f(a)` es `=/2`, `\\+ p(x)` es `\\+/1`). Una meta calificada con su
+módulo (`lists:member(X, L)`) conserva el módulo en el functor.
+
+Las cláusulas de un programa pueden declarar sus propios operadores
+(`:- op(700, xfx, <->).`); las funciones que analizan cláusulas reciben esas
+declaraciones en `operadores`, una tupla de (nombre, prioridad, tipo).
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+_SIMBOLOS = set("+-*/\\^<>=~:.?@#&$")
+_APERTURAS = {"(": ")", "[": "]", "{": "}"}
+_ESPECIALES = re.compile(r"""[()\[\]{}'"`,]""")
+_ATOMO = re.compile(r"[a-z]\w*|'(?:[^'\\]|\\.|'')*'|[+\-*/\\^<>=~:.?@#&$]+|!|;|,|\||\[\]|\{\}|\[\|\]")
+
+# Operadores infijos: prioridad y si la rama principal es el de más a la
+# izquierda (xfx, xfy) o el de más a la derecha (yfx)
+_INFIJOS: Dict[str, Tuple[int, bool]] = {
+    ":-": (1200, True), "-->": (1200, True),
+    ";": (1100, True), "|": (1100, True),
+    "->": (1050, True), "*->": (1050, True),
+    ",": (1000, True),
+    "=": (700, True), "\\=": (700, True), "==": (700, True), "\\==": (700, True),
+    "@<": (700, True), "@>": (700, True), "@=<": (700, True), "@>=": (700, True),
+    "=..": (700, True), "is": (700, True), "=:=": (700, True), "=\\=": (700, True),
+    "<": (700, True), ">": (700, True), "=<": (700, True), ">=": (700, True),
+    "as": (700, True), ">:<": (700, True), ":<": (700, True),
+    "+": (500, False), "-": (500, False), "/\\": (500, False), "\\/": (500, False), "xor": (500, False),
+    "*": (400, False), "/": (400, False), "//": (400, False), "mod": (400, False), "rem": (400, False),
+    "<<": (400, False), ">>": (400, False), "div": (400, False), "rdiv": (400, False),
+    "**": (200, True), "^": (200, True),
+    ":": (200, True),
+}
+# Operadores prefijos con su prioridad
+_PREFIJOS: Dict[str, int] = {
+    ":-": 1200, "?-": 1200, "dynamic": 1150, "discontiguous": 1150, "multifile": 1150, "table": 1150,
+    "\\+": 900, "-": 200, "+": 200, "\\": 200,
+}
+
+# Operadores declarados por un programa: (nombre, prioridad, tipo), p. ej. ("<->", 700, "xfx")
+Operadores = Tuple[Tuple[str, int, str], ...]
+
+
+@lru_cache(maxsize=64)
+def _tablas_operadores(operadores: Operadores) -> Tuple[Dict[str, Tuple[int, bool]], Dict[str, int]]:
+    """Tablas de operadores infijos y prefijos con las declaraciones del programa."""
+    if not operadores:
+        return _INFIJOS, _PREFIJOS
+    infijos, prefijos = dict(_INFIJOS), dict(_PREFIJOS)
+    for nombre, prioridad, tipo in operadores:
+        if tipo in ("xfx", "xfy", "yfx"):
+            infijos[nombre] = (prioridad, tipo != "yfx")
+        elif tipo in ("fx", "fy"):
+            prefijos[nombre] = prioridad
+    return infijos, prefijos
+
+
+class Termino(NamedTuple):
+    functor: str
+    aridad: int
+    inicio_args: int  # posición donde empiezan los argumentos en el texto (-1 si no tiene)
+    fin_args: int     # posición donde terminan los argumentos (exclusiva; -1 si no tiene)
+
+
+def _fin_comillas(texto: str, inicio: int) -> int:
+    """Posición siguiente a las comillas que se abren en `inicio`."""
+    fin = _cierre_comillas(texto, inicio)
+    return fin if fin >= 0 else len(texto)
+
+
+def _cierre_comillas(texto: str, inicio: int) -> int:
+    """Posición siguiente a las comillas que se abren en `inicio` (-1 si no se cierran)."""
+    comilla = texto[inicio]
+    i = inicio + 1
+    while i < len(texto):
+        if texto[i] == "\\":
+            i += 2
+            continue
+        if texto[i] == comilla:
+            # Comilla duplicada: forma parte del texto
+            if i + 1 < len(texto) and texto[i + 1] == comilla:
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    return -1
+
+
+_OPERANDO, _NOMBRE = 0, 1
+
+
+def _tokens_nivel_cero(texto: str, infijos: Dict[str, Tuple[int, bool]] = _INFIJOS) -> List[Tuple[int, int, int]]:
+    """
+    Tokens (inicio, fin, tipo) del nivel superior del texto. Los términos
+    compuestos, los grupos entre paréntesis, listas, llaves, comillas,
+    números y variables son un único token `_OPERANDO`; los átomos sueltos,
+    las secuencias de símbolos, las comas, `;` y `!` son `_NOMBRE` (posibles
+    operadores).
+    Un operador infijo pegado a un paréntesis tras un operando (`X=(a, b)`,
+    `p:-(q ; r)`) sigue siendo un operador.
+    """
+    tokens = []
+    i = 0
+    while i < len(texto):
+        c = texto[i]
+        if c.isspace() or c in ")]}":
+            i += 1
+            continue
+        tipo = _NOMBRE
+        if c in "'\"`":
+            fin = _fin_comillas(texto, i)
+            tipo = _OPERANDO
+        elif texto.startswith("0'", i) and i + 2 < len(texto):
+            # Código de carácter 0'c
+            fin = i + (4 if texto[i + 2] == "\\" else 3)
+            tipo = _OPERANDO
+        elif c.isdigit():
+            # Número (incluye 1.5 y 1.0e10): nunca es un operador
+            fin = i
+            while fin < len(texto) and (texto[fin].isalnum() or texto[fin] == "_" or
+                                        (texto[fin] == "." and fin + 1 < len(texto) and texto[fin + 1].isdigit())):
+                fin += 1
+            tipo = _OPERANDO
+        elif c in _APERTURAS:
+            cierre = _cierre(texto, i)
+            fin = cierre + 1 if cierre >= 0 else len(texto)
+            tipo = _OPERANDO
+        elif c in ",|;!":
+            # Caracteres "solo": nunca forman parte de otro átomo (`a;b`, `!,p`)
+            fin = i + 1
+        elif c in _SIMBOLOS:
+            fin = i
+            while fin < len(texto) and texto[fin] in _SIMBOLOS:
+                fin += 1
+        else:
+            fin = i + 1
+            while fin < len(texto) and (texto[fin].isalnum() or texto[fin] == "_"):
+                fin += 1
+            if c.isupper() or c == "_":
+                tipo = _OPERANDO
+        if (tipo == _NOMBRE and c not in ",|" and fin < len(texto) and texto[fin] == "("
+                and not (tokens and tokens[-1][2] == _OPERANDO and texto[i:fin] in infijos)):
+            # Átomo seguido de paréntesis: término compuesto
+            cierre = _cierre(texto, fin)
+            fin = cierre + 1 if cierre >= 0 else len(texto)
+            tipo = _OPERANDO
+        elif tipo == _OPERANDO and c in "'" and fin < len(texto) and texto[fin] == "(":
+            cierre = _cierre(texto, fin)
+            fin = cierre + 1 if cierre >= 0 else len(texto)
+        tokens.append((i, fin, tipo))
+        i = fin
+    return tokens
+
+
+def _escanear(texto: str, inicio: int) -> Tuple[int, int]:
+    """
+    Posición del cierre que corresponde a la apertura en `inicio` (-1 si no
+    hay) y número de comas en el primer nivel de anidamiento. Salta de un
+    carácter especial al siguiente en lugar de recorrer el texto entero.
+    """
+    profundidad = 0
+    comas = 0
+    i = inicio
+    while True:
+        especial = _ESPECIALES.search(texto, i)
+        if especial is None:
+            return -1, comas
+        i = especial.start()
+        c = texto[i]
+        if c == ",":
+            comas += profundidad == 1
+        elif c in "'\"`":
+            if c == "'" and i > 0 and texto[i - 1] == "0" and not texto[i - 2:i - 1].isalnum():
+                # Código de carácter 0'c: el carácter no abre comillas
+                i += 3 if texto[i + 1:i + 2] == "\\" else 2
+            else:
+                i = _fin_comillas(texto, i)
+            continue
+        elif c in _APERTURAS:
+            profundidad += 1
+        else:
+            profundidad -= 1
+            if profundidad == 0:
+                return i, comas
+        i += 1
+
+
+def _cierre(texto: str, inicio: int) -> int:
+    """Posición del cierre que corresponde a la apertura en `inicio` (-1 si no hay)."""
+    return _escanear(texto, inicio)[0]
+
+
+def error_sintaxis(texto: str) -> Optional[str]:
+    """Descripción del primer paréntesis, corchete, llave o comilla sin pareja (None si no hay)."""
+    pila: List[Tuple[str, int]] = []
+    i = 0
+    while True:
+        especial = _ESPECIALES.search(texto, i)
+        if especial is None:
+            break
+        i = especial.start()
+        c = texto[i]
+        if c in "'\"`":
+            if c == "'" and i > 0 and texto[i - 1] == "0" and not texto[i - 2:i - 1].isalnum():
+                i += 3 if texto[i + 1:i + 2] == "\\" else 2
+                continue
+            fin = _cierre_comillas(texto, i)
+            if fin < 0:
+                return f"comillas {c} sin cerrar en la posición {i}"
+            i = fin
+            continue
+        if c in _APERTURAS:
+            pila.append((c, i))
+        elif c in ")]}":
+            if not pila:
+                return f"'{c}' sin abrir en la posición {i}"
+            if _APERTURAS[pila[-1][0]] != c:
+                return f"'{c}' en la posición {i} no cierra el '{pila[-1][0]}' de la posición {pila[-1][1]}"
+            pila.pop()
+        i += 1
+    if pila:
+        apertura, posicion = pila[-1]
+        return f"'{apertura}' sin cerrar en la posición {posicion}"
+    return None
+
+
+def _salto_comillas(texto: str, i: int) -> int:
+    """Posición siguiente a las comillas o al código de carácter (`0'c`) que empieza en `i`."""
+    if texto[i] == "'" and i > 0 and texto[i - 1] == "0" and not texto[i - 2:i - 1].isalnum():
+        return i + (3 if texto[i + 1:i + 2] == "\\" else 2)
+    return _fin_comillas(texto, i)
+
+
+def sin_comentarios(texto: str) -> str:
+    """El texto sin comentarios `% ...` ni `/* ... */` (los que hay dentro de comillas se conservan)."""
+    partes = []
+    inicio = i = 0
+    while i < len(texto):
+        c = texto[i]
+        if c in "'\"`":
+            i = _salto_comillas(texto, i)
+        elif c == "%" or texto.startswith("/*", i):
+            partes.append(texto[inicio:i])
+            if c == "%":
+                fin = texto.find("\n", i)
+                i = len(texto) if fin < 0 else fin
+            else:
+                fin = texto.find("*/", i + 2)
+                i = len(texto) if fin < 0 else fin + 2
+                # El comentario separa lo que hay a sus lados, como un espacio
+                partes.append(" ")
+            inicio = i
+        else:
+            i += 1
+    partes.append(texto[inicio:])
+    return "".join(partes)
+
+
+def separar_clausulas(texto: str) -> List[str]:
+    """
+    Cláusulas de un texto sin comentarios, cada una con su punto final: un
+    punto fuera de paréntesis y comillas, que no forma parte de un átomo de
+    símbolos (`=..`) y va seguido de un espacio o del final del texto. Lo
+    que queda sin punto final al terminar el texto es la última cláusula.
+    """
+    clausulas = []
+    profundidad = 0
+    inicio = i = 0
+    while i < len(texto):
+        c = texto[i]
+        if c in "'\"`":
+            i = _salto_comillas(texto, i)
+            continue
+        if c in _APERTURAS:
+            profundidad += 1
+        elif c in ")]}":
+            profundidad = max(0, profundidad - 1)
+        elif (c == "." and profundidad == 0 and (i + 1 == len(texto) or texto[i + 1].isspace())
+              and not (i > 0 and texto[i - 1] in _SIMBOLOS)):
+            clausulas.append(texto[inicio:i + 1].strip())
+            inicio = i + 1
+        i += 1
+    if texto[inicio:].strip():
+        clausulas.append(texto[inicio:].strip())
+    return clausulas
+
+
+def _atomo_inicial(texto: str) -> int:
+    """Fin del átomo con el que empieza el texto (0 si no empieza por un átomo)."""
+    if not texto:
+        return 0
+    c = texto[0]
+    if c == "'":
+        return _fin_comillas(texto, 0)
+    if c.islower():
+        fin = 1
+        while fin < len(texto) and (texto[fin].isalnum() or texto[fin] == "_"):
+            fin += 1
+        return fin
+    if c in _SIMBOLOS:
+        fin = 1
+        while fin < len(texto) and texto[fin] in _SIMBOLOS:
+            fin += 1
+        return fin
+    return 0
+
+
+def _operador_principal(texto: str, operadores: Operadores = ()) -> Optional[Tuple[str, int, int]]:
+    """Operador infijo principal (nombre, inicio, fin) fuera de cualquier anidamiento."""
+    infijos, prefijos = _tablas_operadores(operadores)
+    tokens = _tokens_nivel_cero(texto, infijos)
+    mejor = None
+    for posicion, (inicio, fin, tipo) in enumerate(tokens):
+        nombre = texto[inicio:fin]
+        if tipo != _NOMBRE or nombre not in infijos or posicion == 0 or posicion == len(tokens) - 1:
+            continue
+        # Solo es infijo si a su izquierda termina un operando (no otro operador)
+        inicio_ant, fin_ant, tipo_ant = tokens[posicion - 1]
+        anterior = texto[inicio_ant:fin_ant]
+        if tipo_ant == _NOMBRE and (anterior in infijos or anterior in prefijos):
+            continue
+        prioridad, izquierda = infijos[nombre]
+        if mejor is None or prioridad > mejor[0] or (prioridad == mejor[0] and not izquierda):
+            mejor = (prioridad, nombre, inicio, fin)
+    if mejor is None:
+        return None
+    return mejor[1], mejor[2], mejor[3]
+
+
+@lru_cache(maxsize=65536)
+def analizar_termino(texto: str, operadores: Operadores = ()) -> Termino:
+    """Functor principal, aridad y tramo de los argumentos de una meta."""
+    desplazamiento = len(texto) - len(texto.lstrip())
+    meta = texto.strip()
+    if not meta:
+        return Termino("", 0, -1, -1)
+
+    # Término canónico: functor(args) ocupando todo el texto
+    fin_atomo = _atomo_inicial(meta)
+    if fin_atomo and fin_atomo < len(meta) and meta[fin_atomo] == "(":
+        cierre, comas = _escanear(meta, fin_atomo)
+        if cierre == len(meta) - 1:
+            aridad = comas + 1 if meta[fin_atomo + 1:cierre].strip() else 0
+            return Termino(meta[:fin_atomo], aridad, desplazamiento + fin_atomo + 1, desplazamiento + cierre)
+
+    infijos, prefijos = _tablas_operadores(operadores)
+    operador = _operador_principal(meta, operadores)
+    prefijo = meta[:fin_atomo] if fin_atomo and fin_atomo < len(meta) and meta[:fin_atomo] in prefijos else None
+    if prefijo is not None and (operador is None or prefijos[prefijo] >= infijos[operador[0]][0]):
+        # Un operador prefijo de más prioridad que el infijo abarca toda la meta (`\+ a = b`)
+        return Termino(prefijo, 1, desplazamiento + fin_atomo, desplazamiento + len(meta))
+    if operador is not None:
+        nombre, inicio, fin = operador
+        izquierda = meta[:inicio].strip()
+        if nombre == ":" and _atomo_inicial(izquierda) == len(izquierda):
+            # Meta calificada con su módulo: módulo:functor/aridad de la meta interna
+            interno = analizar_termino(meta[fin:], operadores)
+            if interno.inicio_args < 0:
+                return Termino(f"{izquierda}:{interno.functor}", interno.aridad, -1, -1)
+            inicio_interno = desplazamiento + fin
+            return Termino(f"{izquierda}:{interno.functor}", interno.aridad,
+                           inicio_interno + interno.inicio_args, inicio_interno + interno.fin_args)
+        return Termino(nombre, 2, desplazamiento, desplazamiento + len(meta))
+
+    if meta[0] == "[" and meta != "[]":
+        return Termino("[|]", 2, desplazamiento + 1, desplazamiento + len(meta) - 1)
+    if meta[0] == "{" and meta != "{}":
+        return Termino("{}", 1, desplazamiento + 1, desplazamiento + len(meta) - 1)
+    if meta[0] == "(" and _cierre(meta, 0) == len(meta) - 1:
+        interno = analizar_termino(meta[1:-1], operadores)
+        return Termino(interno.functor, interno.aridad,
+                       interno.inicio_args + desplazamiento + 1 if interno.inicio_args >= 0 else -1,
+                       interno.fin_args + desplazamiento + 1 if interno.fin_args >= 0 else -1)
+    return Termino(meta, 0, -1, -1)
+
+
+def es_invocable(functor: str) -> bool:
+    """Si el functor es un átomo (o módulo:átomo) y por tanto se puede llamar como meta."""
+    modulo, separador, nombre = functor.partition(":")
+    if separador and _ATOMO.fullmatch(modulo) and _ATOMO.fullmatch(nombre):
+        return True
+    return _ATOMO.fullmatch(functor) is not None
+
+
+def clave_functor(texto: str) -> Tuple[str, int]:
+    """(functor, aridad) de una meta."""
+    termino = analizar_termino(texto)
+    return termino.functor, termino.aridad
+
+
+def argumentos(texto: str, operadores: Operadores = ()) -> List[str]:
+    """
+    Texto de cada argumento de una meta: los de `p(a, f(b))`, los dos lados
+    de un operador infijo (`X = f(a)`) o el operando de uno prefijo. Las
+    listas y los átomos no tienen argumentos ([]).
+    """
+    meta = texto.strip()
+    while meta.startswith("(") and _cierre(meta, 0) == len(meta) - 1:
+        meta = meta[1:-1].strip()
+    termino = analizar_termino(meta, operadores)
+    if termino.inicio_args < 0 or termino.functor == "[|]":
+        return []
+    if termino.inicio_args > 0 and meta[termino.inicio_args - 1] == "(" and termino.fin_args == len(meta) - 1:
+        # Forma canónica (también calificada con su módulo): comas del primer nivel
+        tramo = meta[termino.inicio_args:termino.fin_args]
+        partes, inicio = [], 0
+        for inicio_token, _, tipo in _tokens_nivel_cero(tramo, _tablas_operadores(operadores)[0]):
+            if tipo == _NOMBRE and tramo[inicio_token] == ",":
+                partes.append(tramo[inicio:inicio_token].strip())
+                inicio = inicio_token + 1
+        partes.append(tramo[inicio:].strip())
+        return partes if termino.aridad else []
+    if termino.aridad == 2 and termino.inicio_args == 0:
+        _, inicio, fin = _operador_principal(meta, operadores)
+        return [meta[:inicio].strip(), meta[fin:].strip()]
+    return [meta[termino.inicio_args:termino.fin_args].strip()]
+
+
+def cabeza_clausula(clausula: str, operadores: Operadores = ()) -> Tuple[str, int]:
+    """(functor, aridad) de la cabeza de un hecho o una regla (`cabeza :- cuerpo.`)."""
+    texto = clausula.strip()
+    if texto.endswith("."):
+        texto = texto[:-1]
+    operador = _operador_principal(texto, operadores)
+    if operador is not None and operador[0] == ":-":
+        texto = texto[:operador[1]]
+    termino = analizar_termino(texto, operadores)
+    return termino.functor, termino.aridad
+
+
+def declaracion_operadores(clausula: str) -> Operadores:
+    """Operadores que declara una directiva `:- op(Prioridad, Tipo, Nombres).` (() si no es una)."""
+    texto = clausula.strip()
+    if texto.endswith("."):
+        texto = texto[:-1]
+    if clave_functor(texto) != (":-", 1):
+        return ()
+    directiva = argumentos(texto)[0]
+    if clave_functor(directiva) != ("op", 3):
+        return ()
+    prioridad, tipo, nombres = argumentos(directiva)
+    if not prioridad.isdigit():
+        return ()
+    if nombres.startswith("[") and nombres.endswith("]"):
+        nombres = [nombre.strip() for nombre in nombres[1:-1].split(",")]
+    else:
+        nombres = [nombres]
+    return tuple((nombre[1:-1] if nombre.startswith("'") and nombre.endswith("'") else nombre, int(prioridad), tipo)
+                 for nombre in nombres)
+
+
+class TablaSimbolos:
+    """
+    Tabla de símbolos de una traza, compartida por todas sus ramas. Cada
+    texto de meta se guarda una sola vez (los nodos con la misma meta
+    comparten el mismo objeto str). Su par (functor, aridad) se analiza la
+    primera vez que se pide y se reduce a un entero, que se compara con `==`.
+    """
+
+    def __init__(self):
+        self._textos: Dict[str, str] = {}
+        self._clave_de: Dict[str, int] = {}
+        self._claves: Dict[Tuple[str, int], int] = {}
+        self.functores: List[Tuple[str, int]] = []
+
+    def interna(self, texto: str) -> str:
+        """Devuelve la copia compartida del texto."""
+        return self._textos.setdefault(texto, texto)
+
+    def clave(self, texto: str) -> int:
+        """Entero que identifica (functor, aridad) de la meta."""
+        clave = self._clave_de.get(texto)
+        if clave is None:
+            par = clave_functor(texto)
+            clave = self._claves.get(par)
+            if clave is None:
+                clave = self._claves[par] = len(self.functores)
+                self.functores.append(par)
+            self._clave_de[self.interna(texto)] = clave
+        return clave
+
+    def __len__(self):
+        return len(self._textos)
@@ -0,0 +1,192 @@
+"""
+Verificación previa del programa que genera el LLM, antes de lanzar swipl.
+
+Muchos ciclos de refinamiento se pierden en programas que Prolog rechaza al
+cargarlos o al llamar a la consulta. Estos fallos se detectan en
+milisegundos analizando las cláusulas con `misa_j/terminos.py` y el grafo de
+llamadas de `mfsa/indice_predicados.py`:
+
+- Errores (el programa no se ejecuta): paréntesis, corchetes, llaves o
+  comillas sin pareja, cláusulas sin punto final, cabezas que no se pueden
+  llamar (`3 :- p.`) y llamadas (también desde la consulta) con una aridad
+  que no coincide con ninguna definición (`p(X, Y)` cuando solo se define
+  `p/1`).
+- Avisos (el programa se ejecuta igualmente): metas del cuerpo que no parecen
+  invocables (`p(X) q(X)`; el análisis de operadores no es el de swipl, así
+  que no basta para descartar el programa), predicados llamados desde la
+  consulta o alcanzables desde ella que no se definen ni están en
+  `PREDEFINIDOS` (la lista no es completa) y variables que aparecen una sola
+  vez en una cláusula (singleton), como los que da swipl al cargar.
+
+Los diagnósticos se devuelven en el resultado de `PrologSolver.solve` y MMRC
+los incluye en el análisis del fallo.
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from mfsa.indice_predicados import (DESCONOCIDA, IndicePredicados, Predicado, analizar_clausula,
+                                    llamadas_consulta, predicados_dinamicos)
+from misa_j.terminos import (Operadores, declaracion_operadores, error_sintaxis, es_invocable, separar_clausulas,
+                              sin_comentarios)
+
+# Predicados de SWI-Prolog y de sus bibliotecas habituales (lists, apply,
+# aggregate, clpfd...), por nombre: se aceptan con cualquier aridad
+PREDEFINIDOS = frozenset("""
+    true fail false repeat ! , ; -> *-> \\+ not call once ignore forall findall bagof setof aggregate_all aggregate
+    catch throw halt = \\= == \\== @< @> @=< @>= is =:= =\\= < > =< >= =.. compare dif freeze when
+    var nonvar atom number integer float atomic compound callable is_list ground string is_dict
+    functor arg copy_term term_variables setarg nb_setarg term_to_atom term_string numbervars
+    subsumes_term unify_with_occurs_check name
+    atom_codes atom_chars char_code atom_length atom_concat sub_atom atom_number atom_string atom_to_term
+    number_codes number_chars number_string upcase_atom downcase_atom char_type code_type
+    atomic_list_concat split_string string_concat string_chars string_codes string_code string_to_atom
+    string_length sub_string string_lower string_upper format_atom sformat read_term_from_atom
+    write writeln print nl tab write_canonical writeq write_term print_message format portray_clause
+    read read_term put_char get_char flush_output with_output_to phrase
+    assert asserta assertz retract retractall abolish
+    nb_getval nb_setval b_getval b_setval nb_current recorda recorded erase
+    member memberchk append length nth0 nth1 last reverse msort sort predsort permutation flatten
+    sum_list sumlist max_list min_list max_member min_member list_to_set subtract intersection union
+    delete exclude include partition select selectchk numlist between succ plus maplist foldl
+    nextto is_set call_dcg call_nth catch_with_backtrace distinct order_by
+    list_to_ord_set ord_subtract ord_union ord_memberchk ord_insert ord_del_element ord_subset
+    pairs_keys_values pairs_keys pairs_values keysort transpose clumped proper_length
+    list_to_assoc put_assoc get_assoc empty_assoc
+    random random_between random_member random_permutation get_time statistics garbage_collect
+    use_module ensure_loaded consult dynamic discontiguous multifile initialization table
+    set_prolog_flag current_prolog_flag style_check op current_op module
+    abolish_all_tables limit offset call_cleanup setup_call_cleanup
+    label labeling all_different all_distinct sum tuples_in global_cardinality
+    in ins #= #\\= #< #> #=< #>= #<==> #==> #<== #\\/ #/\\ #\\
+""".split())
+
+_VARIABLES = re.compile(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`\\]|\\.)*`|0'\\?.|\b([A-Z_]\w*)""")
+
+
+class Diagnostico(NamedTuple):
+    gravedad: str  # "error" o "aviso"
+    mensaje: str
+    clausula: Optional[str] = None
+
+    def __str__(self):
+        donde = f" en `{self.clausula}`" if self.clausula is not None else ""
+        return f"{self.gravedad.upper()}{donde}: {self.mensaje}"
+
+
+def _nombre(predicado: Predicado) -> str:
+    return f"{predicado[0]}/{predicado[1]}"
+
+
+def variables_singleton(clausula: str) -> List[str]:
+    """Variables con nombre (sin `_` inicial) que aparecen una sola vez, en orden."""
+    apariciones: Dict[str, int] = {}
+    for coincidencia in _VARIABLES.finditer(clausula):
+        variable = coincidencia.group(1)
+        if variable is not None and not variable.startswith("_"):
+            apariciones[variable] = apariciones.get(variable, 0) + 1
+    return [variable for variable, veces in apariciones.items() if veces == 1]
+
+
+def _verificar_clausula(clausula: str, operadores: Operadores) -> List[Diagnostico]:
+    """Errores de sintaxis y avisos de una cláusula aislada."""
+    texto = clausula.strip()
+    if not texto.endswith("."):
+        return [Diagnostico("error", "falta el punto final", clausula)]
+    problema = error_sintaxis(texto)
+    if problema is not None:
+        return [Diagnostico("error", problema, clausula)]
+    cabeza, llamadas = analizar_clausula(texto, operadores)
+    if cabeza is not None and not es_invocable(cabeza[0]):
+        return [Diagnostico("error", f"la cabeza `{cabeza[0]}` no es un átomo ni un término compuesto "
+                                     f"(¿un operador sin declarar o sin espacios alrededor?)", clausula)]
+    diagnosticos = [Diagnostico("aviso", f"`{llamada[0]}` no parece una meta invocable (¿falta una coma o un operador?)",
+                                clausula)
+                    for llamada in llamadas if llamada != DESCONOCIDA and not es_invocable(llamada[0])]
+    if cabeza is not None:
+        singletons = variables_singleton(texto)
+        if singletons:
+            diagnosticos.append(Diagnostico("aviso", f"variables que aparecen una sola vez: {', '.join(singletons)}",
+                                            clausula))
+    return diagnosticos
+
+
+def verificar_programa(clausulas: List[str], consulta: Optional[str]) -> List[Diagnostico]:
+    """
+    Diagnósticos del programa y la consulta: primero los de cada cláusula y,
+    si todas se pueden analizar, los de las llamadas alcanzables desde la
+    consulta (o desde cualquier predicado, si no hay consulta). Los
+    comentarios se descartan y un texto con varias cláusulas se separa, como
+    al cargarlo en swipl.
+    """
+    clausulas = [parte for clausula in clausulas for parte in separar_clausulas(sin_comentarios(clausula))]
+    diagnosticos: List[Diagnostico] = []
+    indice = IndicePredicados()
+    dinamicos: Set[Predicado] = set()
+    operadores: Operadores = ()
+    for clausula in clausulas:
+        # Como al leer el programa, cada operador vale a partir de su directiva
+        operadores += declaracion_operadores(clausula)
+        diagnosticos.extend(_verificar_clausula(clausula, operadores))
+    if hay_errores(diagnosticos):
+        # Sin todas las cláusulas el grafo de llamadas daría predicados no definidos que sí lo están
+        return diagnosticos
+    for clausula in clausulas:
+        indice.agregar(clausula)
+        dinamicos.update(predicados_dinamicos(clausula, indice.operadores))
+
+    aridades: Dict[str, Set[int]] = {}
+    for nombre, aridad in set(indice.predicados()) | dinamicos:
+        aridades.setdefault(nombre, set()).add(aridad)
+
+    def definido(predicado: Predicado) -> bool:
+        # Las metas no invocables ya tienen su aviso en `_verificar_clausula`
+        return (predicado == DESCONOCIDA or bool(indice.clausulas_de(*predicado)) or predicado in dinamicos
+                or predicado[0] in PREDEFINIDOS or ":" in predicado[0] or not es_invocable(predicado[0]))
+
+    metas_consulta: List[Predicado] = []
+    if consulta is not None:
+        texto = sin_comentarios(consulta).strip().rstrip(".")
+        problema = error_sintaxis(texto)
+        if problema is not None:
+            return diagnosticos + [Diagnostico("error", f"consulta mal formada: {problema}", consulta)]
+        metas_consulta = llamadas_consulta(texto, indice.operadores)
+        for meta in metas_consulta:
+            if definido(meta):
+                continue
+            otras = sorted(aridades.get(meta[0], ()))
+            if otras:
+                diagnosticos.append(Diagnostico("error", f"la consulta llama a {_nombre(meta)}, que no existe; "
+                                                         f"solo se define con aridad {', '.join(map(str, otras))}",
+                                                consulta))
+            else:
+                # Puede ser un predicado de swipl que no está en PREDEFINIDOS: no se descarta el programa
+                diagnosticos.append(Diagnostico("aviso", f"la consulta llama a {_nombre(meta)}, que no está definido",
+                                                consulta))
+
+    raices = list(metas_consulta)
+    for clausula in clausulas:
+        cabeza, llamadas = analizar_clausula(clausula, indice.operadores)
+        if cabeza is None:
+            raices.extend(llamadas)
+            diagnosticos.extend(Diagnostico("aviso", f"la directiva llama a {_nombre(llamada)}, que no está definido",
+                                            clausula)
+                                for llamada in llamadas if not definido(llamada))
+
+    alcanzables = indice.alcanzables(raices) if consulta is not None else indice.predicados()
+    for predicado in sorted(alcanzables, key=_nombre):
+        for llamado in indice.llamados_por(*predicado):
+            if definido(llamado):
+                continue
+            otras = sorted(aridades.get(llamado[0], ()))
+            if otras:
+                diagnosticos.append(Diagnostico(
+                    "error", f"{_nombre(predicado)} llama a {_nombre(llamado)}, pero {llamado[0]} solo se define "
+                             f"con aridad {', '.join(map(str, otras))}"))
+            else:
+                diagnosticos.append(Diagnostico(
+                    "aviso", f"{_nombre(predicado)} llama a {_nombre(llamado)}, que no está definido"))
+    return diagnosticos
+
+
+def hay_errores(diagnosticos: List[Diagnostico]) -> bool:
+    return any(diagnostico.gravedad == "error" for diagnostico in diagnosticos)
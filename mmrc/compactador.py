@@ -0,0 +1,163 @@
+"""
+Resumen compacto de las ramas de pensamiento para los prompts de MMRC.
+
+Los prompts incluían las ramas con `json.dumps(..., indent=2)`: cada nodo
+ocupa cuatro o cinco líneas de JSON y las trazas de Prolog repiten mucho
+(la llamada y su salida con el mismo texto, metas idénticas seguidas, ramas
+fallidas que solo cambian al final). Aquí cada rama se escribe como un árbol
+indentado, un nodo por línea:
+
+    ✓ solucion(_A, _B)
+      ✓ poss_maker(_A) ⇒ poss_maker(bellini)
+      ✓ cellini==cellini (×2)
+      ✗ lists:member(x, [a, b]) [3 metas internas omitidas]
+
+- Un nodo cuyo único hijo es la misma meta ya unificada (una hoja con el
+  mismo functor y veracidad) se escribe en una línea (`llamada ⇒ resultado`,
+  o solo la llamada si el texto coincide).
+- Los hermanos consecutivos con el mismo subárbol se escriben una vez con
+  `(×N)`, y lo mismo las ramas idénticas.
+- Las metas internas de las bibliotecas de SWI-Prolog (`lists:`, `apply:`,
+  `$bags:`...) se omiten; se conserva la llamada del programa.
+- Los términos más largos que `max_termino` se recortan por el centro.
+
+Las ramas se añaden en orden hasta agotar el presupuesto de tokens (estimado
+como caracteres / 4); lo que no cabe se indica al final.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from misa_j.terminos import clave_functor
+
+# Módulos de SWI-Prolog cuyas metas internas no aportan al análisis
+MODULOS_BIBLIOTECA = frozenset({
+    "lists", "apply", "apply_macros", "yall", "aggregate", "pairs", "ordsets", "assoc", "error",
+    "system", "clpfd", "dicts", "strings", "solution_sequences", "nb_set", "rbtrees",
+})
+
+_VERACIDAD = {"verde": "✓", "rojo": "✗"}
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimación barata de tokens (unos 4 caracteres por token)."""
+    return (len(texto) + 3) // 4
+
+
+def recortar_termino(texto: str, max_termino: Optional[int]) -> str:
+    """Recorta un término por el centro para conservar el functor y el cierre."""
+    if max_termino is None or len(texto) <= max_termino:
+        return texto
+    mitad = max(1, (max_termino - 1) // 2)
+    return f"{texto[:mitad]}…{texto[-mitad:]}"
+
+
+def es_meta_de_biblioteca(nombre: str) -> bool:
+    modulo, separador, _ = nombre.partition(":")
+    return nombre.startswith("$") or bool(separador and (modulo in MODULOS_BIBLIOTECA or modulo.startswith("$")))
+
+
+def _misma_meta(llamada: str, resultado: str) -> bool:
+    """Si `resultado` es la misma meta que `llamada` (mismo functor y aridad)."""
+    return llamada == resultado or clave_functor(llamada) == clave_functor(resultado)
+
+
+def _hijos(nodo: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return nodo.get("valor") or []
+
+
+def _descendientes(nodo: Dict[str, Any]) -> int:
+    return sum(1 + _descendientes(hijo) for hijo in _hijos(nodo))
+
+
+def _lineas_nodo(nodo: Dict[str, Any], max_termino: Optional[int]) -> List[str]:
+    """Líneas del subárbol de `nodo` (sin indentar el propio nodo)."""
+    veracidad = nodo.get("veracidad", "")
+    nombre = str(nodo.get("nombre", ""))
+    linea = f"{_VERACIDAD.get(veracidad, '·')} {recortar_termino(nombre, max_termino)}"
+    hijos = _hijos(nodo)
+
+    # Llamada con su único resultado (misma meta, ya unificada): una sola línea
+    if (len(hijos) == 1 and not _hijos(hijos[0]) and hijos[0].get("veracidad", "") == veracidad
+            and _misma_meta(nombre, str(hijos[0].get("nombre", "")))):
+        resultado = str(hijos[0].get("nombre", ""))
+        if resultado != nombre:
+            linea += f" ⇒ {recortar_termino(resultado, max_termino)}"
+        return [linea]
+    if hijos and es_meta_de_biblioteca(nombre):
+        return [f"{linea} [{_descendientes(nodo)} metas internas omitidas]"]
+
+    lineas = [linea]
+    for lineas_hijo, veces in _agrupar([_lineas_nodo(hijo, max_termino) for hijo in hijos]):
+        if veces > 1:
+            lineas_hijo = [f"{lineas_hijo[0]} (×{veces})"] + lineas_hijo[1:]
+        lineas.extend("  " + linea_hijo for linea_hijo in lineas_hijo)
+    return lineas
+
+
+def _agrupar(bloques: List[List[str]]) -> List[tuple]:
+    """Agrupa bloques consecutivos iguales en pares (bloque, repeticiones)."""
+    grupos: List[list] = []
+    for bloque in bloques:
+        if grupos and grupos[-1][0] == bloque:
+            grupos[-1][1] += 1
+        else:
+            grupos.append([bloque, 1])
+    return [tuple(grupo) for grupo in grupos]
+
+
+def resumir_rama(rama: Any, max_termino: Optional[int] = 160) -> List[str]:
+    """
+    Líneas del resumen de una rama (un dict de `Clausula.to_dict()`). Lo que
+    no tiene forma de rama (p. ej. resultados de `solve` sin traza) se escribe
+    como JSON en una línea.
+    """
+    if not isinstance(rama, dict) or "nombre" not in rama:
+        return [recortar_termino(json.dumps(rama, ensure_ascii=False), max_termino)]
+    # La raíz artificial del árbol no aporta nada: se escriben sus hijos
+    if rama.get("nombre") == "root" and not rama.get("veracidad"):
+        lineas = []
+        for lineas_hijo, veces in _agrupar([_lineas_nodo(hijo, max_termino) for hijo in _hijos(rama)]):
+            if veces > 1:
+                lineas_hijo = [f"{lineas_hijo[0]} (×{veces})"] + lineas_hijo[1:]
+            lineas.extend(lineas_hijo)
+        return lineas
+    return _lineas_nodo(rama, max_termino)
+
+
+def compactar_ramas(ramas: List[Any], presupuesto_tokens: Optional[int] = None,
+                    max_termino: Optional[int] = 160) -> str:
+    """
+    Texto compacto de las ramas, en su orden, sin pasar de `presupuesto_tokens`
+    (None: sin límite). Si ni la primera rama cabe, se incluye recortada.
+    """
+    if not ramas:
+        return "(ninguna)"
+    partes = ["Leyenda: ✓ la meta se cumple, ✗ la meta falla, ⇒ resultado de la llamada, (×N) repetido N veces."]
+    usados = estimar_tokens(partes[0])
+    grupos = _agrupar([resumir_rama(rama, max_termino) for rama in ramas])
+    numero = 1
+    for indice, (lineas, veces) in enumerate(grupos):
+        titulo = f"Rama {numero}" if veces == 1 else f"Ramas {numero}-{numero + veces - 1} (idénticas)"
+        bloque = "\n".join([f"{titulo}:"] + ["  " + linea for linea in lineas])
+        coste = estimar_tokens(bloque) + 1
+        if presupuesto_tokens is not None and usados + coste > presupuesto_tokens:
+            restantes = sum(v for _, v in grupos[indice:])
+            if indice == 0:
+                # Sin ninguna rama el prompt no serviría: la primera se recorta
+                incluidas = [f"{titulo}:"]
+                usados += estimar_tokens(incluidas[0]) + 1
+                for linea in lineas:
+                    usados += estimar_tokens(linea) + 1
+                    if usados > presupuesto_tokens:
+                        break
+                    incluidas.append("  " + linea)
+                partes.append("\n".join(incluidas))
+                partes.append(f"… (rama recortada: {len(lineas) - len(incluidas) + 1} líneas omitidas)")
+                restantes -= veces
+            if restantes:
+                partes.append(f"… y {restantes} ramas más omitidas por el presupuesto de tokens")
+            break
+        partes.append(bloque)
+        usados += coste
+        numero += veces
+    return "\n".join(partes)
@@ -1,10 +1,14 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Dict, Any
 from common.gemini_interface import ask_gemini
 from mmrc.promts import generate_successful_response_prompt, _analyze_failure_prompt
+from mmrc.visualizacion import escribir_arboles, cola_renderizado
+from mmrc.compactador import compactar_ramas
+from misa_j.archivo_ramas import RamasArchivadas
+from misa_j.captura import rama_exitosa
+from misa_j.cfcs import estadisticas_subarbol
+from config import CONFIG
 
-import json
-from pathlib import Path
-from graphviz import Digraph
+import heapq
 
 
 
@@ -25,6 +29,7 @@ class MetaCognitionKnowledgeRefinementModule:
         Recursively creates nodes and edges for the Graphviz diagram from the JSON data.
         """
         if graph is None:
+            from graphviz import Digraph  # Solo hace falta para generar gráficos con la librería graphviz
             graph = Digraph(comment='Cadena de Pensamientos', format='png') # You can change 'png' to 'svg', 'jpg', etc.
             graph.attr(rankdir='TB') # Top to bottom layout
             graph.attr('node', shape='box', style='filled', fontname='Arial')
@@ -57,7 +62,7 @@ class MetaCognitionKnowledgeRefinementModule:
 
         return graph
     
-    def analyze_thought_tree(self, solver_result: List[Any], problem_description: str, clauses: List[str], solver_errors: List[str] = None, history: Dict[str, Any] = None) -> Dict[str, Any]:
+    def analyze_thought_tree(self, solver_result: List[Any], problem_description: str, clauses: List[str], solver_errors: List[str] = None, history: Dict[str, Any] = None, solutions_dir: str = "solutions") -> Dict[str, Any]:
         """
         Analiza el árbol de pensamientos y genera una respuesta o análisis de errores.
         
@@ -66,6 +71,7 @@ class MetaCognitionKnowledgeRefinementModule:
             problem_description: Descripción original del problema
             clauses: Lista de cláusulas usadas en el problema
             solver_errors: Lista opcional de errores ocurridos durante la ejecución del solver
+            solutions_dir: Directorio donde se guardan los gráficos de las ramas
             
         Returns:
             Dict con el análisis y la respuesta generada
@@ -81,24 +87,40 @@ class MetaCognitionKnowledgeRefinementModule:
         successful_branches = self._find_successful_branches(thought_tree)
         
         if successful_branches:
-            solutions_dir = Path("solutions")
-            success_dir = solutions_dir / "success"
-            fails_dir = solutions_dir / "fails"
-
-            for i, arbol_pensamiento in enumerate(thought_tree):
-                # Convertir el árbol a diccionario
-                arbol_dict = arbol_pensamiento.to_dict()
-                
-                # Determinar la carpeta basada en la veracidad del primer nodo
-                target_dir = success_dir if arbol_pensamiento.valor[0].veracidad == "verde" else fails_dir
-                
-                # Generar y guardar el gráfico
-                dot = self._create_thought_graph(arbol_dict)
-                dot.render(str(target_dir / f'arbol_pensamiento_{i}'), view=False, cleanup=True)
+            self._save_thought_graphs(thought_tree, solutions_dir)
             return self._generate_successful_response(successful_branches, problem_description, clauses, history)
         else:
             return self._analyze_failure(thought_tree, problem_description, clauses, solver_errors, history)
     
+    def _save_thought_graphs(self, thought_tree: List[Any], solutions_dir: str):
+        """
+        Guarda los gráficos de las ramas según CONFIG["mmrc_render_mode"]. Solo
+        se escribe el código DOT en el camino crítico; la conversión a imagen se
+        hace en segundo plano o cuando se pide.
+        """
+        modo = CONFIG["mmrc_render_mode"]
+        if modo == "desactivado":
+            return
+        rutas = escribir_arboles(thought_tree, solutions_dir)
+        if modo == "bajo_demanda":
+            print(f"INFO: {len(rutas)} gráficos DOT guardados en {solutions_dir}; "
+                  f"para generar las imágenes: python -m mmrc.visualizacion {solutions_dir}")
+            return
+        cola = cola_renderizado(CONFIG["mmrc_render_procesos"])
+        cola.encolar(rutas)
+        if modo == "sincrono":
+            cola.esperar()
+
+    def _ramas_para_prompt(self, ramas: List[Any]) -> Any:
+        """
+        Ramas tal como van en el prompt: resumidas y dentro del presupuesto de
+        tokens si CONFIG["mmrc_compactar_ramas"] está activo (mmrc/compactador.py),
+        o las listas de diccionarios completas (JSON) si no.
+        """
+        if not CONFIG["mmrc_compactar_ramas"]:
+            return ramas
+        return compactar_ramas(ramas, CONFIG["mmrc_presupuesto_tokens_ramas"], CONFIG["mmrc_max_longitud_termino"])
+
     def _find_successful_branches(self, thought_tree: List[Any]) -> List[Any]:
         """
         Encuentra las ramas exitosas en el árbol de pensamientos.
@@ -109,17 +131,11 @@ class MetaCognitionKnowledgeRefinementModule:
         Returns:
             Lista de ramas exitosas (con veracidad "verde")
         """
-        successful_branches = []
-        for branch in thought_tree:
-            if "catch(" in branch.valor[0].nombre:
-                if branch.valor[0].valor[0].veracidad == "verde":
-                    successful_branches.append(branch)
-            else:
-                if branch.valor[0].veracidad == "verde":
-                    successful_branches.append(branch)
-
-        
-        return successful_branches
+        if isinstance(thought_tree, RamasArchivadas):
+            # Checkpoint en formato de archivo: la cabecera dice qué ramas son exitosas
+            # y solo se cargan esas
+            return [thought_tree[i] for i in range(len(thought_tree)) if thought_tree.exitosa(i)]
+        return [branch for branch in thought_tree if rama_exitosa(branch)]
 
     
     def _generate_successful_response(self, successful_branches_clausule: List[Any], problem_description: str, clauses: List[str], history: Dict[str, Any] = None) -> Dict[str, Any]:
@@ -138,7 +154,7 @@ class MetaCognitionKnowledgeRefinementModule:
         except AttributeError:
             print("Error al convertir las ramas exitosas a diccionarios")
             successful_branches = successful_branches_clausule
-        prompt = generate_successful_response_prompt(successful_branches, problem_description, clauses, history["responses"][-1]["content"])
+        prompt = generate_successful_response_prompt(self._ramas_para_prompt(successful_branches), problem_description, clauses, history["responses"][-1]["content"])
         
         try:
             response = ask_gemini(prompt)
@@ -173,7 +189,7 @@ class MetaCognitionKnowledgeRefinementModule:
         # Convertir las ramas más prometedoras a diccionarios
         promising_branches_dict = [branch.to_dict() for branch in promising_branches]
         
-        prompt = _analyze_failure_prompt(promising_branches_dict, problem_description, clauses, solver_errors)
+        prompt = _analyze_failure_prompt(self._ramas_para_prompt(promising_branches_dict), problem_description, clauses, solver_errors)
         
         try:
             response = ask_gemini(prompt)
@@ -203,17 +219,14 @@ class MetaCognitionKnowledgeRefinementModule:
         Returns:
             Lista de las ramas más prometedoras
         """
-        scored_branches = []
-        
-        for branch in thought_tree:
-            score = self._calculate_branch_promise_score(branch)
-            scored_branches.append((branch, score))
-        
-        # Ordenar por puntuación (mayor a menor)
-        scored_branches.sort(key=lambda x: x[1], reverse=True)
-        
-        # Retornar las mejores ramas (hasta max_branches)
-        return [branch for branch, _ in scored_branches[:max_branches]]
+        # Selección con un heap acotado: mismo orden que ordenar todas las ramas
+        # (mayor puntuación primero, empates en el orden original)
+        if isinstance(thought_tree, RamasArchivadas):
+            # Puntuación con las estadísticas de la cabecera; solo se cargan las elegidas
+            indices = heapq.nlargest(max_branches, range(len(thought_tree)),
+                                     key=lambda i: self._puntuacion(thought_tree.estadisticas(i)))
+            return [thought_tree[i] for i in indices]
+        return heapq.nlargest(max_branches, thought_tree, key=self._calculate_branch_promise_score)
     
     def _calculate_branch_promise_score(self, branch: Any) -> float:
         """
@@ -225,51 +238,10 @@ class MetaCognitionKnowledgeRefinementModule:
         Returns:
             Puntuación de la rama (mayor es mejor)
         """
-        # Contar la profundidad de la rama
-        depth = self._calculate_depth(branch)
-        
-        # Contar nodos con veracidad "verde"
-        green_nodes = self._count_green_nodes(branch)
-        
-        return depth * green_nodes
-    
-    def _calculate_depth(self, node: Any) -> int:
-        """
-        Calcula la profundidad máxima de un nodo.
-        
-        Args:
-            node: Objeto Clausula
-            
-        Returns:
-            Profundidad máxima del árbol
-        """
-        if not hasattr(node, 'valor') or not node.valor:
-            return 1
-        
-        max_child_depth = 0
-        for child in node.valor:
-            child_depth = self._calculate_depth(child)
-            max_child_depth = max(max_child_depth, child_depth)
-        
-        return 1 + max_child_depth
-    
-    def _count_green_nodes(self, node: Any) -> int:
-        """
-        Cuenta los nodos con veracidad "verde" en un árbol.
-        
-        Args:
-            node: Objeto Clausula
-            
-        Returns:
-            Número de nodos verdes
-        """
-        count = 0
-        
-        if hasattr(node, 'veracidad') and node.veracidad == "verde":
-            count += 1
-        
-        if hasattr(node, 'valor') and node.valor:
-            for child in node.valor:
-                count += self._count_green_nodes(child)
-        
-        return count
\ No newline at end of file
+        # Profundidad de la rama y nodos con veracidad "verde", en un solo recorrido
+        # (memoizado en los nodos al congelar la rama)
+        return self._puntuacion(estadisticas_subarbol(branch))
+
+    @staticmethod
+    def _puntuacion(stats) -> float:
+        return stats.profundidad * stats.verdes
@@ -1,6 +1,12 @@
 from typing import List, Any
 import json
 
+def _ramas_texto(ramas: Any) -> str:
+    """Las ramas ya resumidas (`mmrc/compactador.py`) se incluyen tal cual; si no, como JSON."""
+    if isinstance(ramas, str):
+        return ramas
+    return json.dumps(ramas, indent=2, ensure_ascii=False)
+
 def generate_successful_response_prompt(successful_branches_clausule: List[Any], problem_description: str, clauses: str, initial_LLM_analysis: str) -> str:
     return f"""
         Como experto en lógica y razonamiento, necesito que analices el siguiente problema y su solución:
@@ -12,7 +18,7 @@ def generate_successful_response_prompt(successful_branches_clausule: List[Any],
         {clauses}
 
         RAMAS DE PENSAMIENTOS EXITOSAS:
-        {json.dumps(successful_branches_clausule, indent=2, ensure_ascii=False)}
+        {_ramas_texto(successful_branches_clausule)}
 
         ANÁLISIS INICIAL LLM:
         {initial_LLM_analysis}
@@ -30,6 +36,13 @@ def generate_successful_response_prompt(successful_branches_clausule: List[Any],
         - Un resumen siendo contundente y breve con la pregunta que se te presentó al principio.
         """
 
+def _errores_solver(solver_errors: List[str] = None) -> str:
+    """Sección del prompt con los errores y diagnósticos del solver ("" si no hay)."""
+    errores = [str(error) for error in (solver_errors or []) if error]
+    if not errores:
+        return ""
+    return "ERRORES Y DIAGNÓSTICOS DEL SOLVER:\n" + "\n".join(f"        - {error}" for error in errores)
+
 def _analyze_failure_prompt(promising_branches_dict: List[Any], problem_description: str, clauses: str, solver_errors: List[str] = None, initial_LLM_analysis: str = None) -> str:
     return f"""
         Como experto en lógica y razonamiento, necesito que analices por qué no se pudo resolver el siguiente problema:
@@ -40,8 +53,10 @@ def _analyze_failure_prompt(promising_branches_dict: List[Any], problem_descript
         CLAUSULAS USADAS:
         {clauses}
 
+        {_errores_solver(solver_errors)}
+
         RAMAS DE PENSAMIENTO MÁS PROMETEDORAS:
-        {json.dumps(promising_branches_dict, indent=2, ensure_ascii=False)}
+        {_ramas_texto(promising_branches_dict)}
 
         ANÁLISIS INICIAL LLM:
         {initial_LLM_analysis}
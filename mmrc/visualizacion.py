@@ -0,0 +1,184 @@
+"""
+Gráficos de las ramas de pensamiento fuera del camino crítico de MMRC.
+
+MMRC solo escribe el código DOT de cada rama (texto, sin lanzar procesos).
+Convertirlo a imagen con `dot` es caro, así que se hace bajo demanda
+(`python -m mmrc.visualizacion [directorio]`) o en segundo plano con
+`ColaRenderizado`, que agrupa varios ficheros en cada llamada a `dot`.
+"""
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Iterable, List, Optional
+
+COLORES = {"verde": "lightgreen", "rojo": "salmon"}
+
+
+def _cita(texto: str) -> str:
+    return '"' + texto.replace('"', '\\"') + '"'
+
+
+def arbol_a_dot(arbol: Any) -> str:
+    """
+    Código DOT de una rama (Clausula o su `to_dict()`), con el mismo aspecto
+    que `MetaCognitionKnowledgeRefinementModule._create_thought_graph`.
+    Se recorre con una pila, sin recursión, para ramas muy profundas.
+    """
+    lineas = [
+        "// Cadena de Pensamientos",
+        "digraph {",
+        "\trankdir=TB",
+        "\tnode [fontname=Arial shape=box style=filled]",
+    ]
+    contador = 0
+    pila = [(arbol, None)]
+    while pila:
+        nodo, id_padre = pila.pop()
+        if isinstance(nodo, dict):
+            nombre = nodo.get("nombre", "N/A")
+            veracidad = nodo.get("veracidad", "")
+            hijos = nodo.get("valor") if isinstance(nodo.get("valor"), list) else []
+        else:
+            nombre, veracidad, hijos = nodo.nombre, nodo.veracidad, nodo.valor
+
+        id_nodo = f"node_{contador}"
+        contador += 1
+        etiqueta = nombre.replace("\\", "\\\\") + f"\\n({veracidad})"
+        lineas.append(f"\t{id_nodo} [label={_cita(etiqueta)} fillcolor={COLORES.get(veracidad, 'lightblue')}]")
+        if id_padre:
+            lineas.append(f"\t{id_padre} -> {id_nodo}")
+        # Apilar en orden inverso para numerar los hijos en preorden, como la versión recursiva
+        for hijo in reversed(hijos):
+            pila.append((hijo, id_nodo))
+    lineas.append("}")
+    return "\n".join(lineas) + "\n"
+
+
+def escribir_arboles(thought_tree: List[Any], solutions_dir: str = "solutions") -> List[str]:
+    """
+    Escribe el código DOT de cada rama en `solutions/success` o `solutions/fails`
+    según la veracidad de su primer nodo. El fichero `arbol_pensamiento_<i>` al
+    renderizarse produce `arbol_pensamiento_<i>.png`.
+
+    Returns:
+        Rutas de los ficheros DOT escritos
+    """
+    success_dir = Path(solutions_dir) / "success"
+    fails_dir = Path(solutions_dir) / "fails"
+    success_dir.mkdir(parents=True, exist_ok=True)
+    fails_dir.mkdir(parents=True, exist_ok=True)
+
+    rutas = []
+    for i, arbol_pensamiento in enumerate(thought_tree):
+        target_dir = success_dir if arbol_pensamiento.valor[0].veracidad == "verde" else fails_dir
+        ruta = target_dir / f"arbol_pensamiento_{i}"
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write(arbol_a_dot(arbol_pensamiento))
+        rutas.append(str(ruta))
+    return rutas
+
+
+def pendientes(solutions_dir: str = "solutions", formato: str = "png") -> List[str]:
+    """Ficheros DOT de `solutions_dir` que aún no tienen imagen."""
+    rutas = []
+    for subdirectorio in ("success", "fails"):
+        directorio = Path(solutions_dir) / subdirectorio
+        if not directorio.is_dir():
+            continue
+        for ruta in sorted(directorio.glob("arbol_pensamiento_*")):
+            if not ruta.suffix and not ruta.with_name(f"{ruta.name}.{formato}").exists():
+                rutas.append(str(ruta))
+    return rutas
+
+
+class ColaRenderizado:
+    """
+    Cola de renderizado en segundo plano. Cada tarea convierte un lote de
+    ficheros DOT con una sola llamada a `dot -T<formato> -O`, y los lotes se
+    reparten entre `procesos` hilos (el trabajo lo hace el proceso `dot`).
+    """
+
+    def __init__(self, procesos: int = 2, formato: str = "png", tamano_lote: int = 16,
+                 limpiar: bool = False, ejecutable: str = "dot"):
+        self.procesos = max(1, procesos)
+        self.formato = formato
+        self.tamano_lote = max(1, tamano_lote)
+        self.limpiar = limpiar
+        self.ejecutable = ejecutable
+        self._ejecutor: Optional[ThreadPoolExecutor] = None
+        self._futuros: List[Future] = []
+        self._lock = threading.Lock()
+
+    def encolar(self, rutas: Iterable[str]) -> List[Future]:
+        """Encola los ficheros DOT; cada futuro devuelve las imágenes generadas por su lote."""
+        rutas = list(rutas)
+        futuros = []
+        with self._lock:
+            if self._ejecutor is None:
+                self._ejecutor = ThreadPoolExecutor(max_workers=self.procesos, thread_name_prefix="render-dot")
+            for inicio in range(0, len(rutas), self.tamano_lote):
+                futuros.append(self._ejecutor.submit(self._renderizar_lote, rutas[inicio:inicio + self.tamano_lote]))
+            self._futuros = [f for f in self._futuros if not f.done()] + futuros
+        return futuros
+
+    def _renderizar_lote(self, rutas: List[str]) -> List[str]:
+        try:
+            proceso = subprocess.run([self.ejecutable, f"-T{self.formato}", "-O", *rutas],
+                                     capture_output=True, text=True)
+        except FileNotFoundError:
+            print(f"ERROR: No se encontró el ejecutable de Graphviz '{self.ejecutable}'.")
+            return []
+        if proceso.returncode != 0:
+            print(f"ERROR: dot falló al renderizar {len(rutas)} gráficos: {proceso.stderr.strip()}")
+        generadas = []
+        for ruta in rutas:
+            imagen = f"{ruta}.{self.formato}"
+            if os.path.exists(imagen):
+                generadas.append(imagen)
+                if self.limpiar:
+                    os.remove(ruta)
+        return generadas
+
+    def esperar(self):
+        """Espera a que terminen todos los lotes encolados."""
+        with self._lock:
+            futuros = list(self._futuros)
+        wait(futuros)
+
+    def cerrar(self):
+        with self._lock:
+            ejecutor, self._ejecutor = self._ejecutor, None
+        if ejecutor is not None:
+            ejecutor.shutdown(wait=True)
+
+
+_cola_global: Optional[ColaRenderizado] = None
+_cola_lock = threading.Lock()
+
+
+def cola_renderizado(procesos: int = 2) -> ColaRenderizado:
+    """Cola compartida por el proceso; se crea en el primer uso."""
+    global _cola_global
+    with _cola_lock:
+        if _cola_global is None:
+            _cola_global = ColaRenderizado(procesos, limpiar=True)
+        return _cola_global
+
+
+def renderizar_pendientes(solutions_dir: str = "solutions", procesos: int = 2) -> List[str]:
+    """Renderiza los gráficos que aún no tienen imagen y devuelve las imágenes generadas."""
+    cola = ColaRenderizado(procesos)
+    try:
+        futuros = cola.encolar(pendientes(solutions_dir, cola.formato))
+        return [imagen for futuro in futuros for imagen in futuro.result()]
+    finally:
+        cola.cerrar()
+
+
+if __name__ == "__main__":
+    directorio = sys.argv[1] if len(sys.argv) > 1 else "solutions"
+    imagenes = renderizar_pendientes(directorio)
+    print(f"INFO: {len(imagenes)} gráficos renderizados en {directorio}")
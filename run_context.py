@@ -0,0 +1,42 @@
+import os
+import uuid
+from datetime import datetime
+
+from config import CONFIG
+
+
+class RunContext:
+    """
+    Espacio de trabajo de una ejecución de `run_main_with_problem`: los
+    directorios de soluciones, checkpoints, historial del LLM y logs cuelgan
+    de una misma raíz. Con la raíz "." se obtiene la disposición de siempre
+    (solutions/, checkpoints/, logs/ en el directorio actual).
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = root
+        self.solutions_dir = self._path("solutions")
+        self.checkpoint_dir = self._path("checkpoints")
+        self.history_dir = self.checkpoint_dir  # Mismo directorio que otros checkpoints
+        self.log_dir = self._path(CONFIG["log_directory"])
+
+    def _path(self, name: str) -> str:
+        return os.path.normpath(os.path.join(self.root, name))
+
+    @classmethod
+    def new(cls, base_dir: str = None) -> "RunContext":
+        """Crea un espacio de trabajo propio en `<base_dir>/<fecha>_<id>`."""
+        base_dir = base_dir or CONFIG["runs_directory"]
+        run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        root = os.path.join(base_dir, run_id)
+        os.makedirs(root, exist_ok=True)
+        print(f"INFO: Espacio de trabajo de la ejecución: {root}")
+        return cls(root)
+
+    @classmethod
+    def from_config(cls) -> "RunContext":
+        """Espacio propio si CONFIG["isolate_runs"] está activo; si no, el directorio actual."""
+        return cls.new() if CONFIG["isolate_runs"] else cls()
+
+    def __repr__(self):
+        return f"RunContext(root={self.root!r})"
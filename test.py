@@ -2,14 +2,20 @@
 import json
 import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import sys
 
 # Importar las funciones necesarias
 from main import run_main_with_problem  # Necesitaremos modificar main.py
 from common.gemini_interface import ask_gemini_json
 from test_checkpoints import TestCheckpointManager
+from config import CONFIG, redirect_output
+
+# Espacios de trabajo de los procesos de la suite en paralelo: cada uno tiene
+# sus propios solutions/, checkpoints/ y logs/
+WORKERS_DIR = Path("solutions/tests/workers")
 
 def load_tests() -> List[Dict[str, Any]]:
     """Carga los tests desde tests/tests.json"""
@@ -72,18 +78,168 @@ Donde "done" es true si la respuesta del modelo es correcta/equivalente y false
         print(f"Error al consultar Gemini: {e}")
         return {"done": False}
 
-def run_test_suite(resume_from_checkpoint: bool = True, save_frequency: int = 1):
+def _error_result(index: int, test: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+    """Resultado de un test que terminó con una excepción."""
+    return {
+        "index": index,
+        "done": False,
+        "final_answer": f"ERROR: {str(error)}",
+        "problem_description": test["problem_description"],
+        "expected_solution": test["solution"]
+    }
+
+def run_single_test(index: int, test: Dict[str, Any], total: int) -> Dict[str, Any]:
+    """
+    Ejecuta un test: resuelve el problema con el sistema de razonamiento y
+    evalúa la respuesta con Gemini.
+    """
+    print(f"\n{'-'*50}")
+    print(f"EJECUTANDO TEST {index + 1}/{total}")
+    print(f"{'-'*50}")
+    
+    problem_description = test["problem_description"]
+    expected_solution = test["solution"]
+    
+    print(f"Problema: {problem_description[:100]}...")
+    
+    try:
+        # Ejecutar main.py con el problema
+        print("Ejecutando sistema de razonamiento...")
+        final_answer = run_main_with_problem(problem_description)
+        
+        print(f"Respuesta obtenida: {final_answer[:200]}...")
+        
+        # Evaluar con Gemini
+        print("Evaluando respuesta con Gemini...")
+        evaluation = evaluate_answer_with_gemini(
+            problem_description, 
+            final_answer, 
+            expected_solution
+        )
+        
+        # Crear resultado
+        result = {
+            "index": index,
+            "done": evaluation.get("done", False),
+            "final_answer": final_answer,
+            "problem_description": problem_description,
+            "expected_solution": expected_solution
+        }
+        
+        status = "✅ CORRECTO" if result["done"] else "❌ INCORRECTO"
+        print(f"Resultado: {status}")
+        
+    except Exception as e:
+        print(f"❌ ERROR en test {index + 1}: {e}")
+        result = _error_result(index, test, e)
+    
+    return result
+
+def _worker_settings(workers: int) -> Dict[str, Any]:
+    """
+    Configuración para los procesos de la suite en paralelo. Las cachés se
+    comparten (rutas absolutas, escrituras atómicas) y la cuota de peticiones
+    a Gemini se reparte entre los procesos.
+    """
+    settings = dict(CONFIG)
+    for key in ("misa_j_cache_dir", "gemini_cache_dir"):
+        settings[key] = os.path.abspath(CONFIG[key])
+    if CONFIG["gemini_peticiones_por_minuto"]:
+        settings["gemini_peticiones_por_minuto"] = CONFIG["gemini_peticiones_por_minuto"] / workers
+    return settings
+
+def _init_worker(workers_dir: str, settings: Dict[str, Any]):
+    """Inicializa un proceso de la suite: aplica la configuración y entra en su espacio de trabajo."""
+    CONFIG.update(settings)
+    workspace = Path(workers_dir) / f"w{os.getpid()}"
+    workspace.mkdir(parents=True, exist_ok=True)
+    # Las rutas relativas (solutions/, checkpoints/, logs/) quedan aisladas por proceso
+    os.chdir(workspace)
+
+def _run_test_in_worker(index: int, test: Dict[str, Any], total: int) -> Tuple[Dict[str, Any], str]:
+    """Ejecuta un test en un proceso de la suite con su salida en un log propio."""
+    os.makedirs(CONFIG["log_directory"], exist_ok=True)
+    log_path = os.path.abspath(os.path.join(CONFIG["log_directory"], f"test_{index + 1}.log"))
+    with redirect_output(log_path):
+        result = run_single_test(index, test, total)
+    return result, log_path
+
+def _run_parallel(tests: List[Dict[str, Any]], pending: List[int], results: List[Dict[str, Any]],
+                  workers: int, checkpoint_manager: TestCheckpointManager, save_frequency: int) -> bool:
+    """
+    Ejecuta los tests pendientes en `workers` procesos. Solo este proceso
+    escribe el checkpoint, fusionando los resultados por índice a medida que
+    llegan.
+    
+    Returns:
+        bool: False si la suite fue interrumpida por el usuario
+    """
+    WORKERS_DIR.mkdir(parents=True, exist_ok=True)
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(str(WORKERS_DIR.resolve()), _worker_settings(workers))
+    )
+    finished = 0
+    try:
+        futures = {
+            executor.submit(_run_test_in_worker, index, tests[index], len(tests)): index
+            for index in pending
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result, log_path = future.result()
+                print(f"Test {index + 1}/{len(tests)}: {'✅ CORRECTO' if result['done'] else '❌ INCORRECTO'}"
+                      f" (log: {log_path})")
+            except Exception as e:
+                # El proceso del trabajador murió sin devolver resultado
+                print(f"❌ ERROR en test {index + 1}: {e}")
+                result = _error_result(index, tests[index], e)
+            results[:] = checkpoint_manager.merge_results(results, [result])
+            finished += 1
+            
+            # Guardar checkpoint cada N tests
+            if finished % save_frequency == 0 or finished == len(pending):
+                remaining = checkpoint_manager.pending_indices(tests, results)
+                print(f"\n💾 Guardando checkpoint... ({len(results)}/{len(tests)} tests)")
+                checkpoint_manager.save_checkpoint(
+                    tests,
+                    results,
+                    remaining[0] if remaining else len(tests),
+                    {
+                        "last_completed_test": index,
+                        "test_name": tests[index].get("name", f"Test_{index+1}"),
+                        "workers": workers
+                    }
+                )
+    except KeyboardInterrupt:
+        print(f"\n\n⚠️  Suite de tests interrumpida por el usuario ({len(results)}/{len(tests)} tests)")
+        print("Guardando checkpoint antes de salir...")
+        remaining = checkpoint_manager.pending_indices(tests, results)
+        checkpoint_manager.save_checkpoint(
+            tests,
+            results,
+            remaining[0] if remaining else len(tests),
+            {"interrupted": True, "workers": workers}
+        )
+        return False
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return True
+
+def run_test_suite(resume_from_checkpoint: bool = True, save_frequency: int = 1, workers: int = 1):
     """
     Ejecuta la suite completa de tests con soporte para checkpoints
     
     Args:
         resume_from_checkpoint: Si True, intentará cargar un checkpoint existente
         save_frequency: Frecuencia de guardado de checkpoints (cada N tests)
+        workers: Número de procesos que ejecutan tests a la vez (1: secuencial)
     """
     # Cargar tests
     tests = load_tests()
     results = []
-    start_index = 0
     
     # Inicializar manager de checkpoints
     checkpoint_manager = TestCheckpointManager()
@@ -95,17 +251,18 @@ def run_test_suite(resume_from_checkpoint: bool = True, save_frequency: int = 1)
             print(f"\n🔄 REANUDANDO DESDE CHECKPOINT")
             print(f"Progreso anterior: {checkpoint_data['completed_tests']}/{checkpoint_data['total_tests']} tests")
             
-            results = checkpoint_data["results"]
-            start_index = checkpoint_data["current_index"]
+            results = checkpoint_manager.merge_results([], checkpoint_data["results"])
             
             response = input("¿Deseas continuar desde el checkpoint? (s/n): ").lower().strip()
             if response != 's':
                 print("Iniciando desde el principio...")
                 results = []
-                start_index = 0
         else:
             print("No se encontró checkpoint previo. Iniciando desde el principio.")
     
+    # Tests sin resultado; con un checkpoint secuencial son los que siguen a current_index
+    pending = checkpoint_manager.pending_indices(tests, results)
+    
     # Crear directorio de resultados si no existe
     solutions_dir = Path("solutions")
     solutions_dir.mkdir(exist_ok=True)
@@ -114,96 +271,58 @@ def run_test_suite(resume_from_checkpoint: bool = True, save_frequency: int = 1)
     
     print(f"\n{'='*70}")
     print(f"INICIANDO SUITE DE TESTS - {len(tests)} tests totales")
-    if start_index > 0:
-        print(f"Reanudando desde test {start_index + 1}")
+    if results:
+        print(f"Reanudando: {len(pending)} tests pendientes")
+    if workers > 1:
+        print(f"Ejecutando en paralelo con {workers} procesos (logs en {WORKERS_DIR})")
     print(f"{'='*70}")
     
-    try:
-        for index in range(start_index, len(tests)):
-            test = tests[index]
-            print(f"\n{'-'*50}")
-            print(f"EJECUTANDO TEST {index + 1}/{len(tests)}")
-            print(f"{'-'*50}")
-            
-            problem_description = test["problem_description"]
-            expected_solution = test["solution"]
-            
-            print(f"Problema: {problem_description[:100]}...")
-            
-            try:
-                # Ejecutar main.py con el problema
-                print("Ejecutando sistema de razonamiento...")
-                final_answer = run_main_with_problem(problem_description)
-                
-                print(f"Respuesta obtenida: {final_answer[:200]}...")
-                
-                # Evaluar con Gemini
-                print("Evaluando respuesta con Gemini...")
-                evaluation = evaluate_answer_with_gemini(
-                    problem_description, 
-                    final_answer, 
-                    expected_solution
-                )
+    if workers > 1 and pending:
+        if not _run_parallel(tests, pending, results, workers, checkpoint_manager, save_frequency):
+            return results
+    else:
+        try:
+            for index in pending:
+                test = tests[index]
+                results.append(run_single_test(index, test, len(tests)))
                 
-                # Crear resultado
-                result = {
-                    "index": index,
-                    "done": evaluation.get("done", False),
-                    "final_answer": final_answer,
-                    "problem_description": problem_description,
-                    "expected_solution": expected_solution
-                }
-                
-                results.append(result)
-                
-                status = "✅ CORRECTO" if result["done"] else "❌ INCORRECTO"
-                print(f"Resultado: {status}")
-                
-            except Exception as e:
-                print(f"❌ ERROR en test {index + 1}: {e}")
-                result = {
-                    "index": index,
-                    "done": False,
-                    "final_answer": f"ERROR: {str(e)}",
-                    "problem_description": problem_description,
-                    "expected_solution": expected_solution
-                }
-                results.append(result)
-            
-            # Guardar checkpoint cada N tests
-            if (index + 1) % save_frequency == 0 or index == len(tests) - 1:
-                print(f"\n💾 Guardando checkpoint... (Test {index + 1}/{len(tests)})")
-                checkpoint_manager.save_checkpoint(
-                    tests, 
-                    results, 
-                    index + 1,
-                    {
-                        "last_completed_test": index,
-                        "test_name": test.get("name", f"Test_{index+1}")
-                    }
-                )
+                # Guardar checkpoint cada N tests
+                if (index + 1) % save_frequency == 0 or index == len(tests) - 1:
+                    print(f"\n💾 Guardando checkpoint... (Test {index + 1}/{len(tests)})")
+                    checkpoint_manager.save_checkpoint(
+                        tests, 
+                        results, 
+                        index + 1,
+                        {
+                            "last_completed_test": index,
+                            "test_name": test.get("name", f"Test_{index+1}")
+                        }
+                    )
+        
+        except KeyboardInterrupt:
+            print(f"\n\n⚠️  Suite de tests interrumpida por el usuario en test {index + 1}")
+            print("Guardando checkpoint antes de salir...")
+            checkpoint_manager.save_checkpoint(
+                tests, 
+                results, 
+                index,
+                {"interrupted": True, "last_completed_test": len(results) - 1}
+            )
+            return results
+        
+        except Exception as e:
+            print(f"\n❌ Error fatal en la suite de tests: {e}")
+            print("Guardando checkpoint de emergencia...")
+            checkpoint_manager.save_checkpoint(
+                tests, 
+                results, 
+                index if 'index' in locals() else len(results),
+                {"error": str(e), "emergency_save": True}
+            )
+            raise
     
-    except KeyboardInterrupt:
-        print(f"\n\n⚠️  Suite de tests interrumpida por el usuario en test {index + 1}")
-        print("Guardando checkpoint antes de salir...")
-        checkpoint_manager.save_checkpoint(
-            tests, 
-            results, 
-            index,
-            {"interrupted": True, "last_completed_test": len(results) - 1}
-        )
-        return results
-    
-    except Exception as e:
-        print(f"\n❌ Error fatal en la suite de tests: {e}")
-        print("Guardando checkpoint de emergencia...")
-        checkpoint_manager.save_checkpoint(
-            tests, 
-            results, 
-            index if 'index' in locals() else start_index,
-            {"error": str(e), "emergency_save": True}
-        )
-        raise
+    # Al reanudar un checkpoint con huecos los resultados pueden llegar desordenados
+    results.sort(key=lambda r: r["index"])
     
     # Eliminar checkpoint exitoso al completar todos los tests
     if len(results) == len(tests):
@@ -257,8 +376,19 @@ def main():
                        help="Limpiar checkpoints más antiguos que N días")
     parser.add_argument("--delete-checkpoints", action="store_true",
                        help="Eliminar todos los checkpoints de tests")
+    parser.add_argument("--workers", type=int, default=1,
+                       help="Número de procesos que ejecutan tests en paralelo (1: secuencial)")
+    parser.add_argument("--replay", action="store_true",
+                       help="Usar solo respuestas de Gemini cacheadas (falla si falta alguna)")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                       help="No leer ni guardar respuestas de Gemini en la caché")
     
     args = parser.parse_args()
+
+    if args.replay:
+        CONFIG["gemini_cache_mode"] = "reproducir"
+    elif args.no_llm_cache:
+        CONFIG["gemini_cache_mode"] = "desactivada"
     
     checkpoint_manager = TestCheckpointManager()
     
@@ -300,7 +430,8 @@ def main():
     try:
         results = run_test_suite(
             resume_from_checkpoint=not args.no_checkpoint,
-            save_frequency=args.save_frequency
+            save_frequency=args.save_frequency,
+            workers=max(1, args.workers)
         )
         print("\nSuite de tests completada.")
     except KeyboardInterrupt:
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+import checkpoints_utils
+from config import CONFIG
+from misa_j.arbol_compacto import ArbolCompacto
+from misa_j.archivo_ramas import (EXTENSION, LIMITE_SEGMENTOS, ArchivoRamas, RamasArchivadas, abrir, archivar_resultado,
+                                  escribir_archivo)
+from misa_j.cfcs import Clausula, estadisticas_subarbol
+
+PROBLEMA = "¿Quién hizo el cofre de oro?"
+
+
+def _arbol(nombre, hijos=(), veracidad=""):
+    nodo = Clausula(nombre, list(hijos), veracidad)
+    for hijo in nodo.valor:
+        hijo.padre = nodo
+    return nodo
+
+
+def _resultado():
+    compartido = _arbol("cofre(oro, bellini)", [_arbol("inscripcion(oro, verdadera)", veracidad="verde")], "verde")
+    exitosa = _arbol("root", [_arbol("sol(X)", [compartido, _arbol("cofre(plata, cellini)", veracidad="verde")],
+                                     "verde")])
+    fallida = _arbol("root", [_arbol("sol(X)", [compartido, _arbol("cofre(plomo, bellini)", veracidad="rojo")],
+                                     "rojo")])
+    return {"status": "success", "resultados": [{"X": "bellini"}], "errors": "", "ramas": [exitosa, fallida]}
+
+
+def test_ida_y_vuelta_con_subarboles_compartidos():
+    resultado = _resultado()
+    cargado = ArchivoRamas(archivar_resultado(resultado)).resultado()
+    assert {clave: valor for clave, valor in cargado.items() if clave != "ramas"} == \
+        {"status": "success", "resultados": [{"X": "bellini"}], "errors": ""}
+    ramas = cargado["ramas"]
+    assert [rama.to_dict() for rama in ramas] == [rama.to_dict() for rama in resultado["ramas"]]
+    assert ramas[0].valor[0].valor[0] is ramas[1].valor[0].valor[0]
+    assert ramas[1].valor[0].valor[1].profundidad == 2 and ramas[1].valor[0].valor[1].padre is ramas[1].valor[0]
+    assert [estadisticas_subarbol(rama) for rama in ramas] == \
+        [estadisticas_subarbol(rama) for rama in _resultado()["ramas"]]
+    assert ArchivoRamas(archivar_resultado(dict(resultado, ramas=[]))).resultado()["ramas"] == []
+
+
+def test_carga_perezosa_por_rama():
+    archivo = ArchivoRamas(archivar_resultado(_resultado()))
+    ramas = archivo.resultado()["ramas"]
+    assert isinstance(ramas, RamasArchivadas) and len(ramas) == 2
+    assert [ramas.exitosa(i) for i in range(2)] == [True, False]
+    assert ramas.estadisticas(1).rojos == 2
+    assert archivo._segmentos == {}
+    ramas[0]
+    assert list(archivo._segmentos) == [0]
+
+
+def test_checkpoint_con_archivo_de_ramas(tmp_path, monkeypatch):
+    directorio = str(tmp_path)
+    for backend in ("sqlite", "pickle"):
+        monkeypatch.setitem(CONFIG, "checkpoints_backend", backend)
+        checkpoints_utils.save_checkpoint(_resultado(), "misa_j_trace_cycle1", PROBLEMA, directorio)
+        cargado = checkpoints_utils.load_checkpoint("misa_j_trace_cycle1", PROBLEMA, directorio)
+        assert isinstance(cargado["ramas"], RamasArchivadas)
+        assert cargado["ramas"][1].to_dict() == _resultado()["ramas"][1].to_dict()
+    # Lo que no se puede escribir como JSON sigue yendo a pickle
+    checkpoints_utils.save_checkpoint(dict(_resultado(), errors={1, 2}), "misa_j_trace_cycle2", PROBLEMA, directorio)
+    cargado = checkpoints_utils.load_checkpoint("misa_j_trace_cycle2", PROBLEMA, directorio)
+    assert cargado["errors"] == {1, 2} and isinstance(cargado["ramas"], list)
+    # Y también una veracidad que el archivo no sabe codificar
+    resultado = _resultado()
+    resultado["ramas"][1].valor[0].veracidad = "amarillo"
+    with pytest.raises(ValueError, match="amarillo"):
+        archivar_resultado(resultado)
+    checkpoints_utils.save_checkpoint(resultado, "misa_j_trace_cycle3", PROBLEMA, directorio)
+    cargado = checkpoints_utils.load_checkpoint("misa_j_trace_cycle3", PROBLEMA, directorio)
+    assert isinstance(cargado["ramas"], list) and cargado["ramas"][1].valor[0].veracidad == "amarillo"
+
+
+def test_archivo_en_disco_con_mmap_y_exportacion_json(tmp_path):
+    ruta = str(tmp_path / f"ramas_de_pensamiento{EXTENSION}")
+    resultado = _resultado()
+    escribir_archivo(ruta, resultado)
+    archivo = abrir(ruta)
+    subarbol = archivo.subarbol(1, [0, 1])
+    assert subarbol.nombre == "cofre(plomo, bellini)" and subarbol.veracidad == "rojo"
+    assert list(archivo._segmentos) == [1]
+    with pytest.raises(IndexError):
+        archivo.subarbol(1, [0, 5])
+
+    archivo.exportar_json(str(tmp_path / "ramas.json"), [1])
+    with open(tmp_path / "ramas.json", encoding="utf-8") as f:
+        assert json.load(f) == [resultado["ramas"][1].to_dict()]
+    # Las ramas de un ArbolCompacto (misa_j_arbol_compacto) se archivan igual
+    compacto = ArbolCompacto.desde_ramas(resultado["ramas"]).vistas_ramas()
+    escribir_archivo(ruta, dict(resultado, ramas=compacto))
+    assert [rama.to_dict() for rama in abrir(ruta).resultado()["ramas"]] == [rama.to_dict() for rama in compacto]
+
+
+def test_acceso_a_una_rama_tardia_acotado():
+    # Cada rama comparte el subárbol de la anterior, como las copias de la traza en modo "nivel"
+    ramas, anterior = [], None
+    for i in range(40):
+        hijos = [anterior] if anterior is not None else []
+        anterior = _arbol(f"paso({i})", hijos + [_arbol(f"hecho({i})", veracidad="verde")], "verde")
+        ramas.append(_arbol("root", [anterior]))
+    datos = archivar_resultado({"status": "success", "resultados": [], "errors": "", "ramas": ramas})
+    for indice in (20, 39):
+        archivo = ArchivoRamas(datos)
+        assert archivo.rama(indice).to_dict() == ramas[indice].to_dict()
+        assert len(archivo._segmentos) <= len(archivo.segmentos(indice)) <= LIMITE_SEGMENTOS
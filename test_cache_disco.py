@@ -0,0 +1,20 @@
+import os
+
+from common.cache_disco import CacheDisco
+
+
+def test_cache_disco_evicts_least_recently_used(tmp_path):
+    cache = CacheDisco(str(tmp_path), max_bytes=25)
+    cache.guardar("a", b"0123456789")
+    cache.guardar("b", b"0123456789")
+    os.utime(tmp_path / "a.bin", ns=(1, 1))
+    os.utime(tmp_path / "b.bin", ns=(2, 2))
+
+    # Leer "a" la convierte en la más reciente; al superar el tamaño sale "b"
+    assert cache.obtener("a") == b"0123456789"
+    cache.guardar("c", b"0123456789")
+
+    assert cache.obtener("b") is None
+    assert cache.obtener("a") == b"0123456789"
+    assert cache.obtener("c") == b"0123456789"
+    assert cache.tamano_total() <= 25
@@ -0,0 +1,32 @@
+from misa_j.captura import MuestreoFallos, PoliticaCaptura, rama_exitosa
+from misa_j.cfcs import Clausula
+
+
+def _rama(numero, veracidad):
+    raiz = Clausula("root")
+    raiz.valor.append(Clausula(f"p({numero})", veracidad=veracidad, padre=raiz))
+    return raiz
+
+
+def test_muestreo_conserva_exitosas_y_acota_fallidas():
+    ramas = [_rama(i, "verde" if i % 10 == 0 else "rojo") for i in range(100)]
+    muestreo = MuestreoFallos(5, semilla=1)
+    for rama in ramas:
+        muestreo.agregar(rama)
+    conservadas = muestreo.ramas()
+    assert sum(rama_exitosa(r) for r in conservadas) == 10
+    assert sum(not rama_exitosa(r) for r in conservadas) == 5
+    assert muestreo.descartadas == 85
+    # Orden original y muestra reproducible con la misma semilla
+    assert conservadas == sorted(conservadas, key=ramas.index)
+    repetido = MuestreoFallos(5, semilla=1)
+    for rama in ramas:
+        repetido.agregar(rama)
+    assert [ramas.index(r) for r in repetido.ramas()] == [ramas.index(r) for r in conservadas]
+
+
+def test_directiva_de_politica():
+    assert PoliticaCaptura().directiva() == ""
+    assert PoliticaCaptura(muestra_fallos=20).directiva() == ""
+    directiva = PoliticaCaptura(max_eventos=5000, modulos_excluidos=("lists", "apply")).directiva()
+    assert directiva.startswith(":- nb_setval(misa_politica, politica(5000, -1, ['lists', 'apply']))")
@@ -58,13 +58,16 @@ class TestCheckpointManager:
             "metadata": metadata or {}
         }
         
+        # Escribir primero a un temporal: el checkpoint nunca queda a medias
+        temp_file = checkpoint_file.with_suffix('.json.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint_data, f, indent=2, ensure_ascii=False)
+        
         # Guardar con backup del anterior si existe
         if checkpoint_file.exists():
             backup_file = checkpoint_file.with_suffix('.json.backup')
-            checkpoint_file.rename(backup_file)
-        
-        with open(checkpoint_file, 'w', encoding='utf-8') as f:
-            json.dump(checkpoint_data, f, indent=2, ensure_ascii=False)
+            os.replace(checkpoint_file, backup_file)
+        os.replace(temp_file, checkpoint_file)
         
         print(f"Checkpoint guardado: {checkpoint_file}")
         print(f"Progreso: {len(results)}/{len(tests)} tests completados")
@@ -110,6 +113,28 @@ class TestCheckpointManager:
             print(f"Error al cargar checkpoint: {e}")
             return None
     
+    @staticmethod
+    def merge_results(results: List[Dict[str, Any]], new_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Fusiona resultados de tests por su índice. Si un test aparece en ambas
+        listas se queda el de `new_results`.
+        
+        Returns:
+            Lista de resultados ordenada por índice de test
+        """
+        merged = {result["index"]: result for result in results}
+        for result in new_results:
+            merged[result["index"]] = result
+        return [merged[index] for index in sorted(merged)]
+    
+    @staticmethod
+    def pending_indices(tests: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[int]:
+        """
+        Índices de los tests que aún no tienen resultado, en orden.
+        """
+        completed = {result["index"] for result in results}
+        return [index for index in range(len(tests)) if index not in completed]
+    
     def delete_checkpoint(self, tests: List[Dict[str, Any]]) -> bool:
         """
         Elimina el checkpoint de la suite de tests dada.
@@ -226,5 +251,19 @@ def test_checkpoint_system():
     manager.delete_checkpoint(sample_tests)
     print("Test completado.")
 
+def test_merge_results_by_index():
+    """
+    Los resultados que llegan desordenados (ejecución en paralelo) se fusionan por índice.
+    """
+    sample_tests = [{"problem_description": f"Test {i}"} for i in range(4)]
+    previous = [{"index": 0, "done": True}, {"index": 2, "done": False}]
+    new = [{"index": 3, "done": True}, {"index": 2, "done": True}]
+    
+    merged = TestCheckpointManager.merge_results(previous, new)
+    
+    assert [r["index"] for r in merged] == [0, 2, 3]
+    assert merged[1]["done"] is True
+    assert TestCheckpointManager.pending_indices(sample_tests, merged) == [1]
+
 if __name__ == "__main__":
     test_checkpoint_system() 
\ No newline at end of file
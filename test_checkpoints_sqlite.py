@@ -0,0 +1,74 @@
+import os
+import pickle
+import threading
+
+import checkpoints_utils
+import llm_history
+from config import CONFIG
+from checkpoints_sqlite import AlmacenCheckpoints, identificadores_legado, migrar_pickles
+from identidad import clave_problema
+
+PROBLEMA = "\n    Recordamos que Bellini siempre ponía a sus cofres una inscripción verdadera."
+
+
+def test_checkpoints_e_historial_en_sqlite(tmp_path, monkeypatch):
+    monkeypatch.setitem(CONFIG, "llm_history_diario", False)
+    directorio = str(tmp_path)
+    checkpoints_utils.save_checkpoint({"ciclo": 1}, "mmrc_result_cycle1", PROBLEMA, directorio)
+    checkpoints_utils.save_checkpoint({"ciclo": 1, "v": 2}, "mmrc_result_cycle1", PROBLEMA, directorio)
+    assert checkpoints_utils.load_checkpoint("mmrc_result_cycle1", PROBLEMA, directorio) == {"ciclo": 1, "v": 2}
+    assert checkpoints_utils.load_checkpoint("mmrc_result_cycle2", PROBLEMA, directorio) is None
+    assert checkpoints_utils.load_checkpoint("mmrc_result_cycle1", PROBLEMA + "?", directorio) is None
+
+    for ciclo in range(3):
+        llm_history.save_llm_history({"cycle_count": ciclo}, PROBLEMA, directorio)
+    assert llm_history.load_latest_llm_history(PROBLEMA, directorio) == {"cycle_count": 2}
+    assert os.listdir(directorio) and not any(nombre.endswith(".pkl") for nombre in os.listdir(directorio))
+
+    checkpoints_utils.clear_checkpoint("mmrc_result_cycle1", PROBLEMA, directorio)
+    assert checkpoints_utils.load_checkpoint("mmrc_result_cycle1", PROBLEMA, directorio) is None
+    assert checkpoints_utils.clear_all_checkpoints(directorio) == 3
+
+
+def test_migracion_de_pickles(tmp_path):
+    directorio = str(tmp_path)
+    de_checkpoint, de_historial = identificadores_legado(PROBLEMA)
+    with open(os.path.join(directorio, f"misa_j_trace_cycle0_{de_checkpoint}.pkl"), "wb") as f:
+        pickle.dump({"status": "failed"}, f)
+    for fecha, ciclo in (("20250617_111103", 1), ("20250614_155534", 0)):
+        nombre = f"llm_history_{de_historial}_{fecha}.pkl"
+        with open(os.path.join(directorio, nombre), "wb") as f:
+            pickle.dump({"cycle_count": ciclo}, f)
+    open(os.path.join(directorio, "otro.pkl"), "wb").close()
+
+    # Sin indicar el problema, los pickles no se atribuyen a ninguno (el nombre no basta para identificarlo)
+    assert migrar_pickles(directorio) == 3
+    assert checkpoints_utils.load_checkpoint("misa_j_trace_cycle0", PROBLEMA, directorio) is None
+    assert migrar_pickles(directorio, borrar=True, problem_description=PROBLEMA) == 3
+    assert migrar_pickles(directorio, problem_description=PROBLEMA) == 0
+    assert [nombre for nombre in os.listdir(directorio) if nombre.endswith(".pkl")] == ["otro.pkl"]
+    assert checkpoints_utils.load_checkpoint("misa_j_trace_cycle0", PROBLEMA, directorio) == {"status": "failed"}
+    assert llm_history.load_latest_llm_history(PROBLEMA, directorio) == {"cycle_count": 1}
+    # Lo guardado después de migrar tiene prioridad sobre lo migrado
+    llm_history.save_llm_history({"cycle_count": 5}, PROBLEMA, directorio)
+    assert llm_history.load_latest_llm_history(PROBLEMA, directorio) == {"cycle_count": 5}
+
+
+def test_escrituras_concurrentes(tmp_path):
+    almacen = AlmacenCheckpoints(str(tmp_path))
+    errores = []
+
+    def escribir(hilo):
+        try:
+            for ciclo in range(20):
+                almacen.guardar(clave_problema(f"problema {hilo}"), "mmrc_result", ciclo, {"hilo": hilo})
+                assert almacen.cargar([clave_problema(f"problema {hilo}")], "mmrc_result", ciclo) == {"hilo": hilo}
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=escribir, args=(hilo,)) for hilo in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert errores == [] and almacen.eliminar() == 80
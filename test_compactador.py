@@ -0,0 +1,39 @@
+from mmrc.compactador import compactar_ramas, resumir_rama
+
+
+def hoja(nombre, veracidad="verde"):
+    return {"nombre": nombre, "veracidad": veracidad}
+
+
+def nodo(nombre, veracidad, *hijos):
+    return {"nombre": nombre, "veracidad": veracidad, "valor": list(hijos)}
+
+
+RAMA = nodo("root", "", nodo("solucion(_A)", "rojo",
+                             nodo("maker(_A)", "verde", hoja("maker(bellini)")),
+                             nodo("a==a", "verde", hoja("a==a")),
+                             nodo("a==a", "verde", hoja("a==a")),
+                             nodo("lists:member(x,[a,b])", "rojo", hoja("x=a", "rojo"), hoja("x=b", "rojo")),
+                             nodo("c(_A)", "rojo", hoja("d(_A)", "rojo")),
+                             hoja("dice(" + "x" * 300 + ")", "rojo")))
+
+
+def test_resumen_agrupa_repeticiones_y_omite_bibliotecas():
+    lineas = resumir_rama(RAMA, max_termino=40)
+    assert lineas[:6] == ["✗ solucion(_A)",
+                          "  ✓ maker(_A) ⇒ maker(bellini)",
+                          "  ✓ a==a (×2)",
+                          "  ✗ lists:member(x,[a,b]) [2 metas internas omitidas]",
+                          "  ✗ c(_A)",  # una submeta distinta no es el resultado de la llamada
+                          "    ✗ d(_A)"]
+    assert lineas[6].startswith("  ✗ dice(xxx") and lineas[6].endswith("xxx)") and len(lineas[6]) == 4 + 39
+
+
+def test_presupuesto_de_tokens():
+    otra = nodo("root", "", nodo("solucion(_B)", "rojo", hoja("c==d", "rojo")))
+    completo = compactar_ramas([RAMA, RAMA, otra])
+    assert "Ramas 1-2 (idénticas):" in completo and "Rama 3:" in completo
+    acotado = compactar_ramas([RAMA, RAMA, otra], presupuesto_tokens=100)
+    assert "Rama 3:" not in acotado and acotado.endswith("… y 1 ramas más omitidas por el presupuesto de tokens")
+    # Si ni la primera rama cabe, se incluye recortada
+    assert "(rama recortada:" in compactar_ramas([RAMA], presupuesto_tokens=40)
@@ -0,0 +1,62 @@
+import json
+import os
+
+import llm_history
+from checkpoints_sqlite import AlmacenCheckpoints
+from diario_historial import DiarioHistorial, ruta_diario
+from identidad import clave_problema
+
+PROBLEMA = "¿Quién hizo cada uno de los cofres?"
+
+
+def test_un_registro_por_paso_y_recarga_incremental(tmp_path):
+    ruta = str(tmp_path / "diario.jsonl")
+    escritor, lector = DiarioHistorial(ruta), DiarioHistorial(ruta)
+    history = {"responses": [], "timestamps": [], "cycle_count": 0}
+    for ciclo in range(3):
+        history["responses"].append({"module": "MMRC", "content": f"respuesta {ciclo}"})
+        history["timestamps"].append(f"2025-06-17T11:0{ciclo}")
+        history["cycle_count"] = ciclo + 1
+        escritor.guardar(history)
+        assert lector.cargar() == history
+    with open(ruta, encoding="utf-8") as f:
+        registros = [json.loads(linea) for linea in f]
+    assert len(registros) == 3
+    assert registros[2] == {"añadir": {"responses": [{"module": "MMRC", "content": "respuesta 2"}],
+                                       "timestamps": ["2025-06-17T11:02"]}, "fijar": {"cycle_count": 3}}
+
+    # Una escritura interrumpida no se reproduce hasta que se complete la línea
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write('{"fijar": {"cycle_')
+    assert lector.cargar() == history
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write('count": 9}}\n')
+    assert lector.cargar()["cycle_count"] == 9
+
+
+def test_compactacion_y_estado_completo(tmp_path):
+    ruta = str(tmp_path / "diario.jsonl")
+    diario = DiarioHistorial(ruta)
+    history = {"responses": [], "cycle_count": 0}
+    for ciclo in range(5):
+        history["responses"].append(f"respuesta {ciclo}")
+        diario.guardar(history, compactar_cada=4)
+    with open(ruta, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2  # estado compactado + un registro
+    assert DiarioHistorial(ruta).cargar() == history
+
+    # Un historial que no continúa el guardado se escribe completo
+    diario.guardar({"responses": ["otra"], "cycle_count": 0})
+    assert DiarioHistorial(ruta).cargar() == {"responses": ["otra"], "cycle_count": 0}
+
+
+def test_historial_previo_pasa_al_diario(tmp_path):
+    directorio = str(tmp_path)
+    anterior = {"responses": ["mfsa"], "timestamps": ["t0"], "cycle_count": 0}
+    AlmacenCheckpoints(directorio).guardar(clave_problema(PROBLEMA), "llm_history", 0, anterior, reemplazar=False)
+    history = llm_history.load_latest_llm_history(PROBLEMA, directorio)
+    assert history == anterior
+    history["responses"].append("mmrc")
+    llm_history.save_llm_history(history, PROBLEMA, directorio)
+    assert llm_history.load_latest_llm_history(PROBLEMA, directorio)["responses"] == ["mfsa", "mmrc"]
+    assert os.path.exists(ruta_diario(directorio, PROBLEMA))
@@ -0,0 +1,22 @@
+from mfsa.diff_clausulas import calcular_diff
+
+
+def test_diff_empareja_cambios_por_cabeza():
+    anteriores = ["cofre(oro).", "cofre(plata).", "valida(X) :- X \\= oro.", "solucion(C) :- cofre(C), valida(C)."]
+    nuevas = ["cofre(oro).", "cofre(plata).", "valida(X) :- X \\= plata.", "solucion(C) :- cofre(C), valida(C).",
+              "cofre(plomo)."]
+    diff = calcular_diff(anteriores, nuevas)
+    assert diff.cambiadas == [("valida(X) :- X \\= oro.", "valida(X) :- X \\= plata.")]
+    # cofre(plomo) no sustituye a ninguna cláusula eliminada: es un alta
+    assert diff.agregadas == ["cofre(plomo)."]
+    assert diff.eliminadas == []
+    assert not diff.reordenadas
+    assert diff.resumen() == "+1 -0 ~1"
+
+
+def test_diff_vacio_y_reordenado():
+    clausulas = ["p(1).", "p(2).", "q :- p(_)."]
+    assert calcular_diff(clausulas, list(clausulas)).vacio
+    diff = calcular_diff(clausulas, ["p(2).", "p(1).", "q :- p(_)."])
+    assert diff.reordenadas and not diff.vacio
+    assert calcular_diff(clausulas, clausulas[:2]).eliminadas == ["q :- p(_)."]
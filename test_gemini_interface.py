@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+
+from common import gemini_interface
+from common.gemini_interface import LimitadorTasa, ask_gemini, ask_gemini_async
+from config import CONFIG
+
+
+class ClienteFalso:
+    """Sustituye a `genai.Client`: cuenta las peticiones en vuelo y en qué bucles se hacen."""
+
+    def __init__(self, duracion=0.05):
+        self.duracion = duracion
+        self.en_vuelo = self.maximo = self.llamadas = 0
+        self.bucles = set()
+        self.aio = types.SimpleNamespace(models=types.SimpleNamespace(generate_content=self._generar))
+
+    async def _generar(self, model, contents, config=None):
+        self.bucles.add(asyncio.get_running_loop())
+        self.llamadas += 1
+        self.en_vuelo += 1
+        self.maximo = max(self.maximo, self.en_vuelo)
+        await asyncio.sleep(self.duracion)
+        self.en_vuelo -= 1
+        return types.SimpleNamespace(text=f"respuesta a {contents}")
+
+
+@pytest.fixture
+def cliente(monkeypatch, tmp_path):
+    falso = ClienteFalso()
+    monkeypatch.setattr(gemini_interface, "client", falso)
+    monkeypatch.setitem(CONFIG, "gemini_cache_dir", str(tmp_path / "gemini"))
+    monkeypatch.setitem(CONFIG, "gemini_cache_mode", "desactivada")
+    monkeypatch.setitem(CONFIG, "gemini_peticiones_por_minuto", None)
+    return falso
+
+
+def test_limitador_rafaga_espera_y_devolucion(monkeypatch):
+    reloj = [100.0]
+    monkeypatch.setattr(gemini_interface.time, "monotonic", lambda: reloj[0])
+    limitador = LimitadorTasa(60)
+    assert [limitador._reservar() for _ in range(60)] == [0.0] * 60
+    assert limitador._reservar() == pytest.approx(1.0)
+    assert limitador._reservar() == pytest.approx(2.0)
+    reloj[0] += 2.0
+    assert limitador._reservar() == pytest.approx(1.0)
+
+    async def cancelar():
+        tarea = asyncio.ensure_future(limitador.adquirir())
+        await asyncio.sleep(0)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+
+    monkeypatch.setattr(gemini_interface.time, "monotonic", lambda: reloj[0])
+    fichas = limitador._fichas
+    asyncio.run(cancelar())
+    # La ficha de la petición cancelada se devuelve
+    assert limitador._fichas == pytest.approx(fichas)
+
+
+def test_concurrencia_limitada_en_todo_el_proceso(cliente, monkeypatch):
+    monkeypatch.setitem(CONFIG, "gemini_max_concurrencia", 2)
+    hilos = [threading.Thread(target=ask_gemini, args=(f"pregunta {i}",)) for i in range(6)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    async def varias():
+        return await asyncio.gather(*(ask_gemini_async(f"asincrona {i}") for i in range(4)))
+
+    # Bucles de eventos distintos comparten el mismo límite y el mismo bucle del cliente
+    assert asyncio.run(varias())[0] == "respuesta a asincrona 0"
+    assert ask_gemini("otra vez") == "respuesta a otra vez"
+    assert cliente.llamadas == 11 and cliente.maximo == 2 and len(cliente.bucles) == 1
+
+
+def test_llamada_sincrona_dentro_de_un_bucle():
+    async def dentro():
+        with pytest.raises(RuntimeError, match="ask_gemini_async"):
+            ask_gemini("pregunta")
+
+    asyncio.run(dentro())
+
+
+def test_cache_acierto_caducidad_y_modo_desactivada(cliente, monkeypatch):
+    monkeypatch.setitem(CONFIG, "gemini_cache_mode", "usar")
+    monkeypatch.setitem(CONFIG, "gemini_cache_ttl_horas", 1)
+    assert ask_gemini("pregunta") == "respuesta a pregunta"
+    assert ask_gemini("pregunta") == "respuesta a pregunta" and cliente.llamadas == 1
+
+    ahora = time.time()
+    monkeypatch.setattr(gemini_interface.time, "time", lambda: ahora + 2 * 3600)
+    ask_gemini("pregunta")
+    assert cliente.llamadas == 2
+
+    # Desactivada: ni se lee ni se guarda
+    monkeypatch.setitem(CONFIG, "gemini_cache_mode", "desactivada")
+    ask_gemini("pregunta")
+    ask_gemini("nueva")
+    assert cliente.llamadas == 4
+    monkeypatch.setitem(CONFIG, "gemini_cache_mode", "usar")
+    ask_gemini("nueva")
+    assert cliente.llamadas == 5
+
+
+def test_cache_reproducir_y_clave(cliente, monkeypatch):
+    monkeypatch.setitem(CONFIG, "gemini_cache_mode", "usar")
+    ask_gemini("pregunta")
+    monkeypatch.setitem(CONFIG, "gemini_cache_mode", "reproducir")
+    assert ask_gemini("pregunta") == "respuesta a pregunta"
+    with pytest.raises(gemini_interface.RespuestaNoCacheadaError):
+        ask_gemini("sin respuesta")
+    assert cliente.llamadas == 1
+
+    clave = gemini_interface._clave_respuesta("pregunta", None)
+    assert gemini_interface._clave_respuesta("pregunta", {"temperature": 0}) != clave
+    monkeypatch.setattr(gemini_interface, "GENERATION_MODEL", "otro-modelo")
+    assert gemini_interface._clave_respuesta("pregunta", None) != clave
+    with pytest.raises(gemini_interface.RespuestaNoCacheadaError):
+        ask_gemini("pregunta")
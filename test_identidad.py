@@ -0,0 +1,54 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import checkpoints_utils
+from config import CONFIG
+from identidad import Manifiesto, clave_problema
+
+INICIO = "\n    Recordamos que Bellini siempre ponía a sus cofres una inscripción verdadera y Cellini una falsa."
+
+
+def test_clave_normalizada_y_sin_colisiones_por_prefijo():
+    assert clave_problema(INICIO + " ¿Quién hizo el cofre de oro?") == \
+        clave_problema(INICIO.strip().replace(" ", "  ") + "\n¿Quién hizo el cofre de oro?")
+    # Dos problemas con el mismo principio ya no comparten checkpoints
+    assert clave_problema(INICIO + " ¿Quién hizo el cofre de oro?") != clave_problema(INICIO + " ¿Y el de plata?")
+
+
+def test_cambio_de_modelo_invalida_los_checkpoints(tmp_path, monkeypatch, capsys):
+    directorio, modelo = str(tmp_path), CONFIG["gemini_modelo"]
+    checkpoints_utils.save_checkpoint({"kr": 1}, "mfsa_kr_store", INICIO, directorio)
+    assert checkpoints_utils.load_checkpoint("mfsa_kr_store", INICIO, directorio) == {"kr": 1}
+
+    monkeypatch.setitem(CONFIG, "gemini_modelo", "otro-modelo")
+    assert checkpoints_utils.load_checkpoint("mfsa_kr_store", INICIO, directorio) is None
+    checkpoints_utils.save_checkpoint({"kr": 2}, "mfsa_kr_store", INICIO, directorio)
+    assert "cambió (config.gemini_modelo)" in capsys.readouterr().out
+
+    with open(Manifiesto(directorio).ruta, encoding="utf-8") as f:
+        entradas = json.load(f)["problemas"]
+    assert len(entradas) == 2 and clave_problema(INICIO) in entradas
+    assert {entrada["huella"]["config"]["gemini_modelo"] for entrada in entradas.values()} == \
+        {"otro-modelo", modelo}
+
+
+def _registrar(directorio, i):
+    return Manifiesto(directorio).registrar(f"{INICIO} Variante {i}.")
+
+
+def test_registros_concurrentes_no_se_pierden(tmp_path):
+    directorio = str(tmp_path)
+    # Varias ejecuciones (procesos) comparten el mismo directorio de checkpoints
+    with ProcessPoolExecutor(max_workers=8) as ejecutor:
+        claves = set(ejecutor.map(_registrar, [directorio] * 40, range(40)))
+    assert len(claves) == 40 and set(Manifiesto(directorio).entradas()) == claves
+
+
+def test_presupuesto_de_captura_en_la_clave(monkeypatch):
+    clave = clave_problema(INICIO)
+    for opcion, valor in (("misa_j_max_ramas", 50), ("misa_j_captura_max_eventos", 1000),
+                          ("misa_j_captura_max_profundidad", 3), ("misa_j_captura_excluir_modulos", ["lists"]),
+                          ("misa_j_captura_muestra_fallos", 10)):
+        with monkeypatch.context() as m:
+            m.setitem(CONFIG, opcion, valor)
+            assert clave_problema(INICIO) != clave, opcion
@@ -0,0 +1,66 @@
+from mfsa.indice_predicados import IndicePredicados, analizar_clausula
+
+PROGRAMA = [
+    ":- use_module(library(lists)).",
+    "cofre(oro).",
+    "cofre(plata).",
+    "dice(oro, X) :- X = oro.",
+    "verdaderos(C, N) :- findall(E, dice(E, C), L), length(L, N).",
+    "solucion(C) :- cofre(C), verdaderos(C, N), N =< 1.",
+    "auxiliar(X) :- \\+ cofre(X).",
+]
+
+
+def test_llamadas_atraviesan_control_y_metapredicados():
+    assert analizar_clausula("cofre(oro).") == (("cofre", 1), [])
+    assert analizar_clausula("p(X) :- (q(X) -> \\+ r(X) ; maplist(s(1), X)), forall(t(Y), u(Y)).") == \
+        (("p", 1), [("q", 1), ("r", 1), ("s", 2), ("t", 1), ("u", 1)])
+    assert analizar_clausula("frase --> sujeto(N), {N > 0}, [x].") == (("frase", 2), [("sujeto", 3), (">", 2)])
+    assert analizar_clausula(":- initialization(main).") == (None, [("main", 0)])
+
+
+def test_indice_incremental_y_recorte():
+    indice = IndicePredicados()
+    for clausula in PROGRAMA:
+        indice.agregar(clausula)
+    assert indice.clausulas_de("cofre", 1) == ["cofre(oro).", "cofre(plata)."]
+    assert set(indice.llamadores_de("cofre", 1)) == {("solucion", 1), ("auxiliar", 1)}
+    # auxiliar/1 no interviene en la consulta; la directiva se conserva siempre
+    assert indice.recorte(PROGRAMA, "solucion(C).") == [c for c in PROGRAMA if not c.startswith("auxiliar")]
+
+    indice.eliminar("auxiliar(X) :- \\+ cofre(X).")
+    assert indice.llamadores_de("cofre", 1) == [("solucion", 1)]
+    indice.eliminar("verdaderos(C, N) :- findall(E, dice(E, C), L), length(L, N).")
+    assert ("dice", 2) not in indice.dependencias("solucion(C)")
+
+    # Una meta variable hace que el recorte sea el programa completo
+    indice.agregar("ejecutar(G) :- call(G).")
+    assert indice.recorte(PROGRAMA, "ejecutar(solucion(C))") == PROGRAMA
+
+
+def test_recorte_con_disyunciones_y_metas_no_analizables():
+    programa = ["p(a).", "q(b).", "t(c).", "r(X) :- p(X);q(X).", "s(X) :- (p(X)->true;q(X))."]
+    indice = IndicePredicados()
+    for clausula in programa:
+        indice.agregar(clausula)
+    assert indice.recorte(programa, "r(X).") == ["p(a).", "q(b).", "r(X) :- p(X);q(X)."]
+    assert indice.recorte(programa, "s(X).") == ["p(a).", "q(b).", "s(X) :- (p(X)->true;q(X))."]
+    # Una llamada alcanzable que no es un functor invocable: programa completo
+    indice.agregar("u(X) :- p(X) q(X).")
+    assert indice.recorte(programa + ["u(X) :- p(X) q(X)."], "u(X).") == programa + ["u(X) :- p(X) q(X)."]
+
+
+def test_recorte_sigue_phrase_predsort_y_freeze():
+    casos = [
+        (["frase --> [a], resto.", "resto --> [b].", "otra --> [c].", "solucion :- phrase(frase, [a,b])."],
+         "solucion", ["otra --> [c]."]),
+        (["cmp(O, A, B) :- compare(O, A, B).", "otro(_).", "solucion(S) :- predsort(cmp, [b,a], S)."],
+         "solucion(S)", ["otro(_)."]),
+        (["p(1).", "otro(_).", "solucion(X) :- freeze(X, p(X)), X = 1."], "solucion(X)", ["otro(_)."]),
+        (["p(1).", "otro(_).", "solucion(X) :- phrase(([a], {p(X)}), [a])."], "solucion(X)", ["otro(_)."]),
+    ]
+    for programa, consulta, fuera in casos:
+        indice = IndicePredicados()
+        for clausula in programa:
+            indice.agregar(clausula)
+        assert indice.recorte(programa, consulta) == [c for c in programa if c not in fuera]
@@ -0,0 +1,35 @@
+import pickle
+
+from mfsa.kr_store import KnowledgeRepresentationStore
+
+CLAUSULAS = ["cofre(oro).", "cofre(plata).", "solucion(C) :- cofre(C)."]
+
+
+def test_checkpoint_antiguo_con_listas():
+    antiguo = KnowledgeRepresentationStore.__new__(KnowledgeRepresentationStore)
+    antiguo.__dict__ = {"base_axioms": [], "problem_clauses": list(CLAUSULAS), "goal_clauses": ["solucion(C)."]}
+    kr_store = pickle.loads(pickle.dumps(antiguo))
+    assert kr_store.problem_clauses == CLAUSULAS and kr_store.goal_clauses == ["solucion(C)."]
+    assert kr_store.clausulas_de("cofre", 1) == CLAUSULAS[:2]
+    assert kr_store.version == 0 and not kr_store.hay_cambios()
+
+
+def test_eliminar_y_diff_de_update(monkeypatch):
+    kr_store = KnowledgeRepresentationStore()
+    for clausula in CLAUSULAS:
+        kr_store.add_clause(clausula, "problem_clause")
+    assert kr_store.remove_clause_by_string("cofre(plata).", "problem_clause")
+    assert not kr_store.remove_clause_by_string("cofre(plata).", "problem_clause")
+    assert not kr_store.remove_clause_by_string("cofre(oro).", "categoria_inexistente")
+    assert kr_store.problem_clauses == ["cofre(oro).", "solucion(C) :- cofre(C)."]
+    assert kr_store.clausulas_de("cofre", 1) == ["cofre(oro)."]
+
+    respuestas = iter([(CLAUSULAS, "solucion(C)."), (CLAUSULAS, "solucion(C)."),
+                       (CLAUSULAS + ["cofre(plomo)."], "solucion(C).")])
+    monkeypatch.setattr(kr_store, "_llm_kge_extract_problem_clauses", lambda *args: next(respuestas))
+    kr_store.update("problema", "análisis")
+    assert kr_store.hay_cambios() and kr_store.ultimo_diff["problem_clause"].agregadas == ["cofre(plata)."]
+    kr_store.update("problema", "análisis")
+    assert not kr_store.hay_cambios() and kr_store.version == 2
+    kr_store.update("problema", "análisis")
+    assert kr_store.hay_cambios(("problem_clause",)) and not kr_store.hay_cambios(("goal_clause",))
@@ -0,0 +1,209 @@
+import pickle
+
+from misa_j.arbol_compacto import ArbolCompacto
+from misa_j.cfcs import PrologSolver, _recortar_traza, parsear_linea_traza, parsear_trama, estadisticas_subarbol, ramas_a_tabla, ramas_de_tabla
+
+TRAZA = """
+call: solucion(_1) @ <dynamic>:0
+  call: cofre(_1) @ <dynamic>:0
+  exit: cofre(oro) @ /tmp/p.pl:1
+  call: valida(oro) @ <dynamic>:0
+  fail: valida(oro) @ <dynamic>:0
+  redo: cofre(_1) @ /tmp/p.pl:1
+  exit: cofre(plata) @ /tmp/p.pl:2
+  call: valida(plata) @ <dynamic>:0
+  exit: valida(plata) @ /tmp/p.pl:5
+exit: solucion(plata) @ /tmp/p.pl:7
+"""
+
+
+def test_procesar_traza_snapshots_are_independent():
+    ramas = PrologSolver("nombre")._procesar_traza(TRAZA)
+
+    assert len(ramas) == 2
+    primera = ramas[0].to_dict()["valor"][0]
+    assert primera["veracidad"] == "rojo"
+    assert [h["nombre"] for h in primera["valor"]] == ["cofre(_1)", "valida(oro)"]
+    assert primera["valor"][0]["valor"][0]["nombre"] == "cofre(oro)"
+
+    final = ramas[1].to_dict()["valor"][0]
+    assert final["veracidad"] == "verde"
+    assert [h["nombre"] for h in final["valor"]] == ["cofre(_1)", "valida(plata)"]
+    assert final["valor"][0]["valor"][0]["nombre"] == "cofre(plata)"
+
+
+def test_procesar_traza_shares_unchanged_subtrees():
+    traza = TRAZA + """
+call: extra(a) @ <dynamic>:0
+exit: extra(a) @ <dynamic>:0
+redo: extra(a) @ <dynamic>:0
+exit: extra(a) @ <dynamic>:0
+"""
+    ramas = PrologSolver("nombre")._procesar_traza(traza)
+
+    assert len(ramas) == 3
+    # la rama de solucion/1 no cambió entre la segunda y la tercera instantánea
+    assert ramas[1].valor[0] is ramas[2].valor[0]
+    assert ramas[1].valor[1] is not ramas[2].valor[1]
+
+
+def test_procesar_traza_redo_targets_deepest_match():
+    traza = """
+call: p(_1) @ <dynamic>:0
+call: q(_1) @ <dynamic>:0
+call: p(_2) @ <dynamic>:0
+exit: p(a) @ <dynamic>:0
+exit: q(a) @ <dynamic>:0
+redo: p(_7) @ <dynamic>:0
+exit: p(b) @ <dynamic>:0
+"""
+    ramas = PrologSolver("nombre")._procesar_traza(traza)
+
+    final = ramas[-1].to_dict()["valor"][0]
+    assert final["nombre"] == "p(_1)"
+    # el redo se resuelve por nombre y aridad sobre el p/1 más profundo,
+    # que es el resultado p(a) de la llamada p(_2)
+    rehecho = final["valor"][0]["valor"][0]["valor"][0]
+    assert rehecho["nombre"] == "p(_7)"
+    assert rehecho["valor"] == [{"nombre": "p(b)", "veracidad": "verde"}]
+
+
+def test_procesar_traza_level_mode_uses_frames():
+    traza = """
+  call: solucion(_1) @ <dynamic>:0 [2/100/none]
+    call: cofre(_1) @ <dynamic>:0 [3/120/100]
+    exit: cofre(oro) @ /tmp/p.pl:1 [3/120/100]
+    call: valida(oro) @ <dynamic>:0 [3/140/100]
+      call: oro\\=oro @ <dynamic>:0 [4/160/140]
+      fail: oro\\=oro @ <dynamic>:0 [4/160/140]
+    fail: valida(oro) @ <dynamic>:0 [3/140/100]
+    redo(0): cofre(_1) @ /tmp/p.pl:1 [3/120/100]
+    exit: cofre(plata) @ /tmp/p.pl:2 [3/120/100]
+    call: valida(plata) @ <dynamic>:0 [3/140/100]
+    exit: valida(plata) @ /tmp/p.pl:5 [3/140/100]
+  exit: solucion(plata) @ /tmp/p.pl:7 [2/100/none]
+"""
+    ramas = PrologSolver("nivel")._procesar_traza(traza)
+
+    assert len(ramas) == 2
+    primera = ramas[0].to_dict()["valor"][0]
+    assert [h["nombre"] for h in primera["valor"]] == ["cofre(_1)", "valida(oro)"]
+    assert primera["valor"][1]["valor"][0]["nombre"] == "oro\\=oro"
+
+    final = ramas[1].to_dict()["valor"][0]
+    assert final["veracidad"] == "verde"
+    assert [h["nombre"] for h in final["valor"]] == ["cofre(_1)", "valida(plata)"]
+    assert final["valor"][0]["valor"] == [{"nombre": "cofre(plata)", "veracidad": "verde"}]
+
+
+def _trama(evento):
+    alternativa = "" if evento.alternativa is None else evento.alternativa
+    padre = "none" if evento.padre is None else evento.padre
+    campos = [evento.puerto[0], alternativa, evento.nivel, evento.frame, padre, "none", len(evento.meta), evento.meta]
+    return "\x1e" + "\x1f".join(str(c) for c in campos)
+
+
+def test_tramas_equivalen_al_texto():
+    traza = """
+  call: solucion(_1) @ <dynamic>:0 [2/100/none]
+    call: cofre(_1) @ <dynamic>:0 [3/120/100]
+    exit: cofre(oro) @ /tmp/p.pl:1 [3/120/100]
+    call: oro\\=oro @ <dynamic>:0 [3/140/100]
+    fail: oro\\=oro @ <dynamic>:0 [3/140/100]
+    redo(0): cofre(_1) @ /tmp/p.pl:1 [3/120/100]
+    exit: cofre(plata) @ /tmp/p.pl:2 [3/120/100]
+  exit: solucion(plata) @ /tmp/p.pl:7 [2/100/none]
+"""
+    eventos = [parsear_linea_traza(linea, True) for linea in traza.strip("\n").split("\n")]
+    tramas = [_trama(evento) for evento in eventos]
+    assert [parsear_trama(trama, True) for trama in tramas] == eventos
+    # Una trama cortada (longitud declarada distinta) no es un evento
+    assert parsear_trama(tramas[0][:-1], True) is None
+
+    solver = PrologSolver("nivel")
+    assert ([r.to_dict() for r in solver._procesar_traza("\n".join(tramas))] ==
+            [r.to_dict() for r in solver._procesar_traza(traza)])
+
+
+def test_recortar_traza_matches_batch_trim():
+    salida = "\n  cabecera\nuno\n\ndos\n" + "\n".join(f"cierre{i}" for i in range(6)) + "\n\n"
+    esperado = "\n".join(salida.strip().split("\n")[1:-6])
+
+    assert "\n".join(_recortar_traza(iter(salida.splitlines(keepends=True)))) == esperado
+
+
+def test_ramas_are_emitted_before_the_trace_ends():
+    leidas = []
+
+    def lineas():
+        for linea in TRAZA.split("\n"):
+            leidas.append(linea)
+            yield linea
+
+    ramas = PrologSolver("nombre")._iterar_ramas_de_lineas(lineas())
+    primera = next(ramas)
+
+    assert primera.to_dict()["valor"][0]["veracidad"] == "rojo"
+    assert len(leidas) < len(TRAZA.split("\n"))
+
+
+def test_tabla_de_ramas_round_trip_keeps_sharing():
+    traza = TRAZA + """
+call: extra(a) @ <dynamic>:0
+exit: extra(a) @ <dynamic>:0
+redo: extra(a) @ <dynamic>:0
+exit: extra(a) @ <dynamic>:0
+"""
+    ramas = PrologSolver("nombre")._procesar_traza(traza)
+
+    tabla = ramas_a_tabla(ramas)
+    copia = ramas_de_tabla(tabla)
+
+    assert [r.to_dict() for r in copia] == [r.to_dict() for r in ramas]
+    assert copia[1].valor[0] is copia[2].valor[0]
+    assert copia[2].valor[0].valor[0].valor[0].profundidad == 3
+
+
+def test_estadisticas_subarbol_se_calculan_al_congelar():
+    traza = TRAZA + """
+call: extra(a) @ <dynamic>:0
+exit: extra(a) @ <dynamic>:0
+redo: extra(a) @ <dynamic>:0
+exit: extra(a) @ <dynamic>:0
+"""
+    ramas = PrologSolver("nombre")._procesar_traza(traza)
+
+    def recorrer(nodo):
+        hijos = [recorrer(h) for h in nodo.valor]
+        return (1 + max((h[0] for h in hijos), default=0),
+                (nodo.veracidad == "verde") + sum(h[1] for h in hijos),
+                (nodo.veracidad == "rojo") + sum(h[2] for h in hijos),
+                1 + sum(h[3] for h in hijos))
+
+    for rama in ramas:
+        # Ya calculadas por la instantánea, sin recorrer de nuevo el árbol
+        assert rama._stats is not None
+        assert tuple(estadisticas_subarbol(rama)) == recorrer(rama)
+    assert ramas[1].valor[0]._stats is ramas[2].valor[0]._stats
+
+
+def test_arbol_compacto_equivale_a_las_ramas():
+    traza = TRAZA + """
+call: extra(a) @ <dynamic>:0
+exit: extra(a) @ <dynamic>:0
+redo: extra(a) @ <dynamic>:0
+exit: extra(a) @ <dynamic>:0
+"""
+    ramas = PrologSolver("nombre")._procesar_traza(traza)
+    arbol = ArbolCompacto.desde_ramas(ramas)
+    vistas = arbol.vistas_ramas()
+
+    assert [v.to_dict() for v in vistas] == [r.to_dict() for r in ramas]
+    assert arbol.a_tabla() == ramas_a_tabla(ramas)
+    assert vistas[1].valor[0] is vistas[2].valor[0]
+    assert vistas[2].valor[0].valor[0].padre is vistas[2].valor[0]
+    assert [estadisticas_subarbol(v) for v in vistas] == [estadisticas_subarbol(r) for r in ramas]
+
+    copia = pickle.loads(pickle.dumps(vistas))
+    assert [v.to_dict() for v in copia] == [r.to_dict() for r in ramas]
+    assert copia[1].valor[0] is copia[2].valor[0]
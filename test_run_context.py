@@ -0,0 +1,28 @@
+import os
+
+from config import CONFIG, clear_solutions
+from run_context import RunContext
+
+
+def test_default_context_keeps_legacy_layout():
+    context = RunContext()
+    assert context.solutions_dir == "solutions"
+    assert context.checkpoint_dir == "checkpoints"
+    assert context.history_dir == "checkpoints"
+    assert context.log_dir == CONFIG["log_directory"]
+
+
+def test_new_contexts_do_not_share_solutions(tmp_path):
+    first = RunContext.new(str(tmp_path))
+    second = RunContext.new(str(tmp_path))
+    assert first.root != second.root
+
+    clear_solutions(first.solutions_dir)
+    clear_solutions(second.solutions_dir)
+    kept = os.path.join(second.solutions_dir, "success", "arbol.png")
+    with open(kept, "w") as f:
+        f.write("png")
+
+    # Limpiar la primera ejecución no toca la salida de la segunda
+    clear_solutions(first.solutions_dir)
+    assert os.path.exists(kept)
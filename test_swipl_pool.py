@@ -0,0 +1,126 @@
+import re
+import shutil
+
+import pytest
+
+from misa_j.captura import MARCA_TRAMA, SEPARADOR_TRAMA, PoliticaCaptura, directiva_formato, rama_exitosa
+from misa_j.cfcs import PrologSolver, estadisticas_subarbol
+from misa_j.swipl_pool import ConsultaPool, PoolSwipl, _cadena_prolog
+
+requiere_swipl = pytest.mark.skipif(shutil.which("swipl") is None, reason="swipl no está instalado")
+
+PROGRAMA = "p(1).\nq(X) :- p(X).\n"
+# Prefijo del módulo temporal de cada consulta (el fichero fuente es misa_programa_<id>)
+PREFIJO_MODULO = re.compile(r"misa_\d+:")
+
+
+def _consultar(pool, programa, meta):
+    with pool.consultar(programa, meta) as consulta:
+        lineas = list(consulta.lineas())
+    return consulta, lineas
+
+
+def _tramas(lineas):
+    return [linea.split(SEPARADOR_TRAMA) for linea in lineas if linea.startswith(MARCA_TRAMA)]
+
+
+@pytest.fixture
+def pool():
+    pool = PoolSwipl(1, 10)
+    yield pool
+    pool.cerrar()
+
+
+def test_cadena_prolog_escapes_quotes_and_control_characters():
+    programa = 'saludo("hola").\nruta(\'a\\b\').\tfin.'
+
+    assert _cadena_prolog(programa) == '"saludo(\\"hola\\").\\xa\\ruta(\'a\\\\b\').\\x9\\fin."'
+
+
+def test_sin_prefijo_corrige_la_longitud_de_la_trama():
+    consulta = ConsultaPool.__new__(ConsultaPool)
+    consulta._prefijo_modulo = "misa_7:"
+    meta = "misa_7:q(misa_7:p)"
+    trama = SEPARADOR_TRAMA.join([MARCA_TRAMA + "c", "", "3", "120", "118", "<clause>(0x1)", str(len(meta)), meta])
+    campos = consulta._sin_prefijo(trama).split(SEPARADOR_TRAMA)
+    assert campos[7] == "q(p)" and campos[6] == "4" and campos[0] == MARCA_TRAMA + "c"
+    assert consulta._sin_prefijo("call: misa_7:q(_123) @ <dynamic>:0 [3/120/118]") == \
+        "call: q(_123) @ <dynamic>:0 [3/120/118]"
+
+
+@requiere_swipl
+def test_marca_de_fin_separa_las_consultas(pool):
+    # Sin salto de línea final: la marca de fin empieza siempre en una línea nueva
+    primera, lineas = _consultar(pool, PROGRAMA, "q(X), write(X), format(user_error, 'sin salto', [])")
+    assert primera.salida == "1\n" and primera.error == ""
+    assert "sin salto" in lineas and not any("MISA_FIN" in linea for linea in lineas)
+    # El mismo trabajador atiende la siguiente consulta sin restos de la anterior
+    segunda, _ = _consultar(pool, PROGRAMA, "write(otra)")
+    assert segunda.salida == "otra\n" and segunda._trabajador is primera._trabajador
+
+
+@requiere_swipl
+def test_trabajador_se_reinicia_tras_un_timeout():
+    pool = PoolSwipl(1, 1)
+    try:
+        # La política deja de trazar enseguida: el bucle no llena stderr
+        programa = PoliticaCaptura(max_eventos=10).directiva() + "bucle :- bucle.\n"
+        expirada, _ = _consultar(pool, programa, "bucle")
+        assert expirada.expirada and expirada.error == "ERROR: Timeout."
+        assert not expirada._trabajador.vivo()
+
+        siguiente, _ = _consultar(pool, PROGRAMA, "q(X), write(X)")
+        assert siguiente.salida == "1\n" and siguiente.error == ""
+        assert siguiente._trabajador.proceso.pid != expirada._trabajador.proceso.pid
+    finally:
+        pool.cerrar()
+
+
+@requiere_swipl
+def test_traza_sin_prefijo_del_modulo_temporal(pool):
+    _, lineas = _consultar(pool, directiva_formato("tramas") + PROGRAMA, "q(X)")
+    tramas = _tramas(lineas)
+    assert tramas and not any(PREFIJO_MODULO.search(linea) for linea in lineas)
+    assert all(int(campos[6]) == len(campos[7]) for campos in tramas)
+    assert {campos[7].split("(")[0] for campos in tramas} == {"q", "p"}
+
+    _, texto = _consultar(pool, PROGRAMA, "q(X)")
+    assert any(linea.lstrip().startswith("call: q(") for linea in texto)
+    assert not any(PREFIJO_MODULO.search(linea) for linea in texto)
+
+
+@requiere_swipl
+def test_politica_y_formato_se_restablecen_en_cada_consulta(pool):
+    directivas = PoliticaCaptura(max_eventos=1).directiva() + directiva_formato("tramas")
+    _, limitada = _consultar(pool, directivas + PROGRAMA, "q(X)")
+    assert len(_tramas(limitada)) == 1
+
+    # Mismo trabajador, sin directivas: traza completa y en texto
+    _, completa = _consultar(pool, PROGRAMA, "q(X)")
+    eventos = [linea for linea in completa if ": " in linea and "@" in linea]
+    assert not _tramas(completa) and len(eventos) >= 4
+
+
+@requiere_swipl
+@pytest.mark.parametrize("formato", ["texto", "tramas"])
+def test_mismas_ramas_con_y_sin_pool(tmp_path, formato):
+    clausulas = ["cofre(oro).", "cofre(plata).", "cofre(plomo).",
+                 "dice(oro, C) :- C = oro.", "dice(plata, C) :- C \\= plata.",
+                 "solucion(C) :- cofre(C), findall(E, dice(E, C), L), length(L, N), N =< 1."]
+    resultados = []
+    for tamano_pool in (0, 1):
+        solver = PrologSolver(tamano_pool=tamano_pool, formato_traza=formato)
+        try:
+            resultados.append(solver.solve(clausulas, "solucion(C).",
+                                           directorio_soluciones=str(tmp_path / f"pool_{tamano_pool}")))
+        finally:
+            if solver.pool is not None:
+                solver.pool.cerrar()
+    proceso, pool = resultados
+    assert proceso["status"] == pool["status"] and proceso["resultados"] == pool["resultados"]
+    assert len(proceso["ramas"]) == len(pool["ramas"]) > 0
+    # El envoltorio catch/3 de la consulta está en las dos trazas: misma forma y mismo criterio de éxito
+    assert [rama.valor[0].nombre.startswith("catch(") for rama in pool["ramas"]] == [True] * len(pool["ramas"])
+    assert [rama_exitosa(rama) for rama in proceso["ramas"]] == [rama_exitosa(rama) for rama in pool["ramas"]]
+    assert [estadisticas_subarbol(rama).profundidad for rama in proceso["ramas"]] == \
+        [estadisticas_subarbol(rama).profundidad for rama in pool["ramas"]]
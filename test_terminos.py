@@ -0,0 +1,39 @@
+from misa_j.cfcs import Clausula
+from misa_j.terminos import TablaSimbolos, analizar_termino, argumentos, clave_functor
+
+
+def test_clave_functor_respeta_anidamiento_y_operadores():
+    assert clave_functor("p(f(a, b), [1, 2], 'x,y')") == ("p", 3)
+    assert clave_functor('format("~w,~w", [a, b])') == ("format", 2)
+    assert clave_functor("X = f(a)") == ("=", 2)
+    assert clave_functor("X is Y - -1") == ("is", 2)
+    assert clave_functor("\\+ p(x)") == ("\\+", 1)
+    assert clave_functor("lists:member(X, [a, b])") == ("lists:member", 2)
+    assert clave_functor("true") == ("true", 0)
+    # Los argumentos se pueden recuperar sin volver a analizar la meta
+    meta = "member(X, [a, b])"
+    termino = analizar_termino(meta)
+    assert meta[termino.inicio_args:termino.fin_args] == "X, [a, b]"
+
+
+def test_tabla_simbolos_interna_y_numera_functores():
+    tabla = TablaSimbolos()
+    texto = tabla.interna("member(a, [a, b])")
+    assert tabla.interna("".join(["member(a, ", "[a, b])"])) is texto
+    assert tabla.clave("member(X, [a, b])") == tabla.clave(texto)
+    assert tabla.clave("member(X)") != tabla.clave(texto)
+    assert tabla.functores[tabla.clave(texto)] == ("member", 2)
+    # La igualdad de Clausula usa la misma aridad
+    assert Clausula("member(a, [a, b])") == Clausula("member(X, [c])")
+    assert Clausula("member(a, [a, b])") != Clausula("member(a)")
+
+
+def test_disyuncion_y_corte_sin_espacios():
+    # Así escribe SWI las disyunciones en la traza: `;` y `!` son tokens sueltos
+    assert clave_functor("a;b") == (";", 2)
+    assert clave_functor("(p(X)->true;fail)") == (";", 2)
+    assert argumentos("(p(X)->true;fail)") == ["p(X)->true", "fail"]
+    assert clave_functor("X=1;X=2") == (";", 2)
+    assert argumentos("X=1;X=2") == ["X=1", "X=2"]
+    assert argumentos("a->b;c") == ["a->b", "c"]
+    assert argumentos("a,!;b") == ["a,!", "b"]
@@ -0,0 +1,70 @@
+from misa_j.cfcs import PrologSolver
+from misa_j.verificacion import hay_errores, variables_singleton, verificar_programa
+
+PROGRAMA = [
+    ":- dynamic visitado/1.",
+    "cofre(oro).",
+    "cofre(plata).",
+    "marcar(C) :- \\+ visitado(C), assertz(visitado(C)).",
+    "solucion(C) :- cofre(C), marcar(C), format(\"~w~n\", [C]).",
+]
+
+
+def test_programa_correcto_sin_diagnosticos():
+    assert verificar_programa(PROGRAMA, "solucion(C).") == []
+    # Operadores del programa (y operadores pegados a un paréntesis)
+    equivalencia = [":- op(700, xfx, <->).", "(A <-> B) :- (A, B) ; (\\+ A, \\+ B).",
+                    "ok(X):-(cofre(X) <-> X=(oro)).", "cofre(oro)."]
+    assert verificar_programa(equivalencia, "ok(X).") == []
+    assert hay_errores(verificar_programa(equivalencia[1:], "ok(X)."))
+    assert variables_singleton("p(X, Y, _Z, 'Atomo W') :- q(X), Y = \"Cadena V\".") == []
+    assert variables_singleton("p(X, Y) :- q(X).") == ["Y"]
+
+
+def test_errores_de_sintaxis_aridad_y_consulta():
+    diagnosticos = verificar_programa(PROGRAMA + ["roto(X) :- cofre(X"], "solucion(C).")
+    assert hay_errores(diagnosticos) and "punto final" in diagnosticos[0].mensaje
+    diagnosticos = verificar_programa(PROGRAMA + ["roto(X) :- cofre(X."], "solucion(C).")
+    assert "sin cerrar" in diagnosticos[0].mensaje
+
+    programa = PROGRAMA + ["valida(C) :- cofre(C, _), comprobar(C)."]
+    mensajes = [str(d) for d in verificar_programa(programa, "valida(C), resolver(C).")]
+    assert any(m.startswith("AVISO") and "resolver/1, que no está definido" in m for m in mensajes)
+    assert any(m.startswith("ERROR: valida/1 llama a cofre/2") for m in mensajes)
+    assert any(m.startswith("AVISO: valida/1 llama a comprobar/1") for m in mensajes)
+
+
+def test_solve_no_lanza_prolog_si_hay_errores(tmp_path):
+    solver = PrologSolver(verificar=True)
+    resultado = solver.solve(["cofre(oro).", "solucion(C) :- cofre(C"], "solucion(C).",
+                             directorio_soluciones=str(tmp_path))
+    assert resultado["status"] == "failed" and resultado["ramas"] == []
+    assert resultado["errors"].startswith("ERROR:")
+    assert any("punto final" in diagnostico for diagnostico in resultado["diagnosticos"])
+
+
+def test_disyunciones_y_si_entonces_sin_espacios():
+    # Como las escribe el LLM (y SWI en la traza): `;` y `->` pegados a las metas
+    assert verificar_programa(["p(a).", "q(b).", "r(X) :- p(X);q(X)."], "r(X).") == []
+    assert verificar_programa(["p(a).", "r(X) :- (p(X)->true;fail)."], "r(X).") == []
+    assert verificar_programa(["p(a).", "r(X) :- \\+ p(X), !, X=1;X=2."], "r(X).") == []
+    # Una meta que no parece invocable es un aviso: el programa se sigue ejecutando
+    diagnosticos = verificar_programa(["p(a).", "r(X) :- p(X) q(X)."], "r(X).")
+    assert [d.gravedad for d in diagnosticos] == ["aviso"] and "no parece una meta" in diagnosticos[0].mensaje
+
+
+def test_comentarios_y_varias_clausulas_por_texto():
+    # Como las escribe el LLM: comentario al final, cadenas solo de comentarios y varias cláusulas juntas
+    programa = ["% Cofres del problema", "cofre(oro). % El de Bellini", "cofre(plata). /* Cellini */",
+                "dice(oro, '50% verdad'). dice(plata, \"a. b\").", "solucion(C) :- cofre(C), dice(C, _)."]
+    assert verificar_programa(programa, "solucion(C). % consulta") == []
+    assert "punto final" in verificar_programa(["cofre(oro). % sin punto en", "p :- q"], None)[0].mensaje
+
+
+def test_consulta_con_predicados_desconocidos_y_aridad():
+    # Un predicado del sistema que no está en PREDEFINIDOS no impide ejecutar el programa
+    diagnosticos = verificar_programa(PROGRAMA, "solucion(X), repeat, sin_listar(X), !.")
+    assert not hay_errores(diagnosticos)
+    assert [d.gravedad for d in diagnosticos] == ["aviso"] and "sin_listar/1" in diagnosticos[0].mensaje
+    # La aridad que no coincide con un predicado del programa sigue siendo un error
+    assert hay_errores(verificar_programa(PROGRAMA, "solucion(X, Y)."))
@@ -0,0 +1,25 @@
+from misa_j.cfcs import Clausula
+from mmrc.visualizacion import arbol_a_dot, escribir_arboles, pendientes
+
+
+def _rama(veracidad):
+    raiz = Clausula("raiz")
+    hijo = Clausula('p(X, "a")', veracidad=veracidad, padre=raiz)
+    raiz.valor.append(hijo)
+    hijo.valor.append(Clausula("q(1)", veracidad="rojo", padre=hijo))
+    return raiz
+
+
+def test_arbol_a_dot_numera_en_preorden():
+    dot = arbol_a_dot(_rama("verde"))
+    assert '\tnode_1 [label="p(X, \\"a\\")\\n(verde)" fillcolor=lightgreen]' in dot
+    assert "\tnode_1 -> node_2" in dot
+    # La Clausula y su to_dict() producen el mismo gráfico
+    assert arbol_a_dot(_rama("verde").to_dict()) == dot
+
+
+def test_escribir_arboles_solo_deja_pendientes(tmp_path):
+    rutas = escribir_arboles([_rama("verde"), _rama("rojo")], str(tmp_path))
+    assert [r.split("/")[-2] for r in rutas] == ["success", "fails"]
+    # Sin lanzar dot: ninguna imagen generada, todas quedan pendientes
+    assert sorted(pendientes(str(tmp_path))) == sorted(rutas)